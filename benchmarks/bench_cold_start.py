@@ -0,0 +1,89 @@
+"""
+Cold-start cost of the service modules: the wall time to import each one in
+a fresh interpreter.
+
+Importing must not need the network, so this runs with placeholder API keys.
+A module that tries to connect on import fails here instead of hanging.
+--first-use also times building the default retrieval engine after import.
+That step connects to the vector index and needs real keys. --json writes
+the results so they can be tracked over time.
+
+Usage (from the repository root):
+    python benchmarks/bench_cold_start.py --runs 5 --json cold_start.json
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = {
+    "service_config": "import service_config",
+    "retrieval": "import retrieval",
+    "document_manager": "import document_manager",
+    "agent": "import agent",
+    "app": "import main",
+}
+
+FIRST_USE = "import retrieval; retrieval.get_retrieval_engine()"
+
+TIMER = """
+import time
+start = time.perf_counter()
+{code}
+print(time.perf_counter() - start)
+"""
+
+
+def time_in_subprocess(code, env):
+    result = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", TIMER.format(code=code)],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=600,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{code!r} failed:\n{result.stderr[-2000:]}")
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--first-use", action="store_true")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.join(ROOT, "src"), os.path.join(ROOT, "src", "app")]
+    )
+    targets = dict(TARGETS)
+    if args.first_use:
+        targets["retrieval_first_use"] = FIRST_USE
+    else:
+        env.setdefault("OPENAI_API_KEY", "sk-placeholder")
+        env.setdefault("PINECONE_API_KEY", "placeholder")
+
+    results = {}
+    print(f"{'target':<20} {'median s':>9} {'min s':>7}")
+    for name, code in targets.items():
+        timings = [time_in_subprocess(code, env) for _ in range(args.runs)]
+        results[name] = {"median": statistics.median(timings), "min": min(timings)}
+        print(
+            f"{name:<20} {results[name]['median']:>9.3f} {results[name]['min']:>7.3f}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"runs": args.runs, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
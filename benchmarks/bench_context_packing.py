@@ -0,0 +1,114 @@
+"""
+Prompt tokens and LLM calls of `compact_accumulate` synthesis with and
+without the context packer.
+
+The PDFs are chunked with the settings from ncert_search.json. For a sample
+of chunks, one sentence is taken as the query, and the top
+`similarity_top_k` chunks are retrieved with the offline hash embedder from
+stand_ins.py. Each query's chunks are then synthesized twice with a fake LLM
+that counts tokens: once as retrieved, and once after `ContextPacker`. The
+LLMIncludeALLFieldsPostprocessor runs first in both cases, as in
+retrieval.py. Runs offline.
+
+Usage (from the repository root):
+    python benchmarks/bench_context_packing.py --files uploaded_files/*.pdf
+"""
+
+import os
+import sys
+import glob
+import json
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", nargs="+", default=glob.glob("uploaded_files/*.pdf"))
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=None)
+    parser.add_argument("--response-mode", default="compact_accumulate")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from llama_index.core import (
+        Settings,
+        SimpleDirectoryReader,
+        VectorStoreIndex,
+        get_response_synthesizer,
+    )
+    from llama_index.core.callbacks import CallbackManager, TokenCountingHandler
+    from llama_index.core.node_parser import SimpleNodeParser
+    from bench_hybrid_recall import make_queries
+    from context_packer import get_context_packer
+    from prompts import QA_PROMPT_TMPL
+    from stand_ins import FakeLLM, HashEmbedding
+
+    ncert_search = json.load(open("./config/ncert_search.json"))
+    top_k = args.top_k or ncert_search["similarity_top_k"]
+    token_counter = TokenCountingHandler()
+    Settings.callback_manager = CallbackManager([token_counter])
+    Settings.embed_model = HashEmbedding(embed_dim=1024)
+    # gpt-4's context window, so prompts are compacted the same way
+    Settings.llm = FakeLLM(latency=0.0, context_window=8192)
+    Settings.llm.callback_manager = Settings.callback_manager
+
+    # Imported after Settings are in place; needs no network
+    from retrieval import LLMIncludeALLFieldsPostprocessor
+
+    documents = SimpleDirectoryReader(input_files=args.files).load_data()
+    nodes = SimpleNodeParser.from_defaults(
+        chunk_size=ncert_search["chunk_size"],
+        chunk_overlap=ncert_search["chunk_overlap"],
+    ).get_nodes_from_documents(documents)
+    queries = make_queries(nodes, args.queries, args.seed)
+    retriever = VectorStoreIndex(nodes).as_retriever(similarity_top_k=top_k)
+    field_postprocessor = LLMIncludeALLFieldsPostprocessor(
+        exclude_keys_to_allow_all=ncert_search["exclude_keys_to_allow_all"]
+    )
+    packer = get_context_packer(
+        {
+            **ncert_search,
+            "context_packing": {
+                "enabled": True,
+                **ncert_search.get("context_packing", {}),
+            },
+        },
+        args.response_mode,
+    )
+    synthesizer = get_response_synthesizer(
+        response_mode=args.response_mode, text_qa_template=QA_PROMPT_TMPL
+    )
+
+    totals = {
+        name: {"llm_calls": 0, "prompt_tokens": 0, "context_nodes": 0}
+        for name in ("retrieved", "packed")
+    }
+    for query_str, _ in queries:
+        retrieved = field_postprocessor.postprocess_nodes(retriever.retrieve(query_str))
+        for name, context in (
+            ("retrieved", retrieved),
+            ("packed", packer.postprocess_nodes(retrieved)),
+        ):
+            token_counter.reset_counts()
+            synthesizer.synthesize(query_str, context)
+            totals[name]["llm_calls"] += len(token_counter.llm_token_counts)
+            totals[name]["prompt_tokens"] += token_counter.prompt_llm_token_count
+            totals[name]["context_nodes"] += len(context)
+
+    print(
+        f"{len(nodes)} chunks, {len(queries)} queries, top_k={top_k}, "
+        f"{args.response_mode}, budget={packer.token_budget}"
+    )
+    print(f"{'per query':<16}{'retrieved':>12}{'packed':>12}{'change':>10}")
+    for metric in ("context_nodes", "llm_calls", "prompt_tokens"):
+        before = totals["retrieved"][metric] / len(queries)
+        after = totals["packed"][metric] / len(queries)
+        change = (after - before) / before if before else 0.0
+        print(f"{metric:<16}{before:>12.1f}{after:>12.1f}{change:>+10.1%}")
+
+
+if __name__ == "__main__":
+    main()
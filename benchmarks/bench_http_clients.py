@@ -0,0 +1,305 @@
+"""
+Shared, pooled HTTP clients (`http_clients.py`) against one client per call.
+
+A local stand-in server speaks enough of the OpenAI API for chat completions,
+over HTTPS with a throwaway self-signed certificate (made with the openssl
+CLI) or over plain HTTP with --no-tls. It adds --server-latency to every
+request and counts the connections it accepts. OPENAI_API_BASE and
+OPENAI_BASE_URL point the real clients at it, so both sides are the code the
+service runs:
+
+- per call: a new `ChatOpenAI`, and so new HTTP clients, for each request,
+  as `agent.get_agent_llm` used to build
+- shared: `agent.get_agent_llm`, on the shared keep-alive pool
+
+Both run sequentially and from --threads threads. Then the server fails
+--fail-rate of requests with 503, and the shared transport is compared with
+and without retries. The backoff is scaled down so the run stays short.
+
+Usage (from the repository root):
+    python benchmarks/bench_http_clients.py --requests 200 --threads 16
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+PROMPT = "Does this query contain inappropriate language? What is an echo?"
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes, so Nagle would hold the body
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.requests += 1
+            failed = self.server.rng.random() < self.server.fail_rate
+        if failed:
+            self._reply(503, {"error": {"message": "overloaded"}})
+            return
+        self._reply(
+            200,
+            {
+                "id": "chatcmpl-bench",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {
+                            "role": "assistant",
+                            "content": "The query contains no inappropriate language.",
+                        },
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": 12,
+                    "completion_tokens": 8,
+                    "total_tokens": 20,
+                },
+            },
+        )
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency, ssl_context=None):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        if ssl_context is not None:
+            # The handshake happens in the handler thread, not in accept()
+            self.socket = ssl_context.wrap_socket(
+                self.socket, server_side=True, do_handshake_on_connect=False
+            )
+        self.latency = latency
+        self.fail_rate = 0.0
+        self.rng = random.Random(0)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+
+    def handle_error(self, request, client_address):
+        # Per-call clients drop their connections when they are collected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def reset(self, fail_rate=0.0):
+        self.fail_rate = fail_rate
+        self.connections = 0
+        self.requests = 0
+
+
+def make_certificate(directory):
+    """A self-signed certificate for 127.0.0.1, or None without openssl."""
+    cert = os.path.join(directory, "cert.pem")
+    key = os.path.join(directory, "key.pem")
+    try:
+        subprocess.run(
+            [
+                "openssl",
+                "req",
+                "-x509",
+                "-newkey",
+                "rsa:2048",
+                "-nodes",
+                "-keyout",
+                key,
+                "-out",
+                cert,
+                "-days",
+                "1",
+                "-subj",
+                "/CN=127.0.0.1",
+                "-addext",
+                "subjectAltName=IP:127.0.0.1",
+            ],
+            check=True,
+            capture_output=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return cert, key
+
+
+def write_config(args):
+    with open(os.path.join(ROOT, "config", "ncert_search.json")) as f:
+        ncert_search = json.load(f)
+    ncert_search["http"] = {
+        **ncert_search.get("http", {}),
+        "max_connections": args.threads,
+        "max_keepalive_connections": args.threads,
+        "backoff_base": args.backoff_base,
+    }
+    os.makedirs("config")
+    with open("config/ncert_search.json", "w") as f:
+        json.dump(ncert_search, f)
+
+
+def run(call, n_requests, threads):
+    latencies = []
+
+    def timed(_):
+        t0 = time.perf_counter()
+        try:
+            call()
+            ok = True
+        except Exception:
+            ok = False
+        latencies.append(time.perf_counter() - t0)
+        return ok
+
+    start = time.perf_counter()
+    if threads == 1:
+        results = [timed(i) for i in range(n_requests)]
+    else:
+        with ThreadPoolExecutor(threads) as pool:
+            results = list(pool.map(timed, range(n_requests)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests_per_s": n_requests / elapsed,
+        "ms_p50": 1000 * statistics.median(latencies),
+        "ms_p95": 1000 * latencies[int(0.95 * (len(latencies) - 1))],
+        "success_rate": sum(results) / n_requests,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--server-latency", type=float, default=0.005)
+    parser.add_argument("--fail-rate", type=float, default=0.2)
+    parser.add_argument("--backoff-base", type=float, default=0.01)
+    parser.add_argument("--no-tls", action="store_true")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    scratch_dir = tempfile.mkdtemp(prefix="rag_http_bench_")
+    cwd = os.getcwd()
+    try:
+        os.chdir(scratch_dir)
+        write_config(args)
+        certificate = None if args.no_tls else make_certificate(scratch_dir)
+        ssl_context = None
+        if certificate is not None:
+            import ssl
+
+            ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            ssl_context.load_cert_chain(*certificate)
+            os.environ["SSL_CERT_FILE"] = certificate[0]
+        elif not args.no_tls:
+            print("openssl not found, running over plain HTTP")
+
+        server = StandInServer(args.server_latency, ssl_context)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        scheme = "https" if ssl_context else "http"
+        base_url = f"{scheme}://127.0.0.1:{server.server_address[1]}/v1"
+        os.environ["OPENAI_API_BASE"] = os.environ["OPENAI_BASE_URL"] = base_url
+        os.environ["OPENAI_API_KEY"] = "sk-bench"
+
+        import httpx
+        from langchain_openai import ChatOpenAI
+
+        import agent
+        from http_clients import RetryTransport, get_http_config
+        from metrics import counter
+
+        def per_call():
+            ChatOpenAI(model="gpt-4", temperature=0.7).invoke(PROMPT)
+
+        def shared():
+            agent.get_agent_llm("gpt-4").invoke(PROMPT)
+
+        results = {}
+        print(f"{scheme}, {args.requests} requests per run")
+        print(
+            f"{'client':<12}{'threads':>8}{'req/s':>9}{'p50 ms':>9}"
+            f"{'p95 ms':>9}{'connections':>13}"
+        )
+        for threads in (1, args.threads):
+            for name, call in (("per call", per_call), ("shared", shared)):
+                server.reset()
+                r = run(call, args.requests, threads)
+                r["connections"] = server.connections
+                results[f"{name}, {threads} threads"] = r
+                print(
+                    f"{name:<12}{threads:>8}{r['requests_per_s']:>9.0f}"
+                    f"{r['ms_p50']:>9.1f}{r['ms_p95']:>9.1f}{r['connections']:>13}"
+                )
+
+        # Same pool settings, retries on and off, against a failing server
+        config = get_http_config()
+        print(f"\nserver failing {args.fail_rate:.0%} of requests with 503")
+        print(f"{'retries':<12}{'success':>9}{'p50 ms':>9}{'p95 ms':>9}{'sent':>7}")
+        retried = counter(
+            "rag_http_retries_total", "Retried HTTP requests.", labels={"reason": "503"}
+        )
+        for max_retries in (0, config["max_retries"]):
+            client = httpx.Client(
+                transport=RetryTransport(
+                    httpx.HTTPTransport(),
+                    max_retries=max_retries,
+                    backoff_base=config["backoff_base"],
+                    backoff_max=config["backoff_max"],
+                )
+            )
+            llm = ChatOpenAI(model="gpt-4", http_client=client, max_retries=0)
+            server.reset(args.fail_rate)
+            before = retried.value
+            r = run(lambda: llm.invoke(PROMPT), args.requests, args.threads)
+            r["requests_sent"] = server.requests
+            r["retries"] = retried.value - before
+            results[f"{max_retries} retries, {args.fail_rate:.0%} failing"] = r
+            print(
+                f"{max_retries:<12}{r['success_rate']:>9.1%}{r['ms_p50']:>9.1f}"
+                f"{r['ms_p95']:>9.1f}{r['requests_sent']:>7}"
+            )
+            client.close()
+        server.shutdown()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
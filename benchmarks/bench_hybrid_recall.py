@@ -0,0 +1,103 @@
+"""
+Recall@k of dense-only vs BM25-only vs hybrid (reciprocal-rank fusion)
+retrieval on the ingested PDFs.
+
+The PDFs are chunked with the settings from ncert_search.json. For a sample
+of chunks, one sentence is taken as a known-item query whose target is the
+chunk it came from; recall@k is the share of queries whose target chunk is in
+the top k. Dense retrieval uses the configured embedding model, so this
+needs OPENAI_API_KEY. Nothing is written to Pinecone.
+
+Usage (from the repository root):
+    python benchmarks/bench_hybrid_recall.py --files uploaded_files/*.pdf
+"""
+
+import os
+import re
+import sys
+import glob
+import json
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
+
+
+def make_queries(nodes, n_queries, seed):
+    rng = random.Random(seed)
+    queries = []
+    for node in rng.sample(nodes, min(n_queries * 3, len(nodes))):
+        sentences = [
+            s.strip()
+            for s in re.split(r"(?<=[.?!])\s+", node.get_content())
+            if 8 <= len(s.split()) <= 30
+        ]
+        if sentences:
+            queries.append((rng.choice(sentences), node.node_id))
+        if len(queries) == n_queries:
+            break
+    return queries
+
+
+def target_ranks(retriever, queries):
+    """1-based rank of each query's target chunk, or None if not retrieved."""
+    ranks = []
+    for query_str, target_id in queries:
+        ids = [r.node.node_id for r in retriever.retrieve(query_str)]
+        ranks.append(ids.index(target_id) + 1 if target_id in ids else None)
+    return ranks
+
+
+def recall_at_k(ranks, k):
+    return sum(r is not None and r <= k for r in ranks) / len(ranks)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", nargs="+", default=glob.glob("uploaded_files/*.pdf"))
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5, 10])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from llama_index.core import SimpleDirectoryReader, VectorStoreIndex, Settings
+    from llama_index.core.node_parser import SimpleNodeParser
+    from llama_index.core.retrievers import VectorIndexRetriever
+    from llama_index.embeddings.openai import OpenAIEmbedding
+    from hybrid_retriever import BM25Index, BM25Retriever, HybridRetriever
+
+    ncert_search = json.load(open("./config/ncert_search.json"))
+    Settings.embed_model = OpenAIEmbedding(
+        model=ncert_search["embedding_model_name"],
+        dimensions=ncert_search["embedding_dim"],
+    )
+    documents = SimpleDirectoryReader(input_files=args.files).load_data()
+    nodes = SimpleNodeParser.from_defaults(
+        chunk_size=ncert_search["chunk_size"],
+        chunk_overlap=ncert_search["chunk_overlap"],
+    ).get_nodes_from_documents(documents)
+    queries = make_queries(nodes, args.queries, args.seed)
+
+    max_k = max(args.k)
+    index = VectorStoreIndex(nodes)
+    bm25_index = BM25Index()
+    bm25_index.add(nodes)
+    dense = VectorIndexRetriever(index=index, similarity_top_k=max_k)
+    sparse = BM25Retriever(bm25_index, similarity_top_k=max_k)
+    retrievers = {
+        "dense": dense,
+        "bm25": sparse,
+        "hybrid": HybridRetriever(dense, sparse, similarity_top_k=max_k),
+    }
+
+    ranks = {name: target_ranks(r, queries) for name, r in retrievers.items()}
+
+    print(f"{len(nodes)} chunks, {len(queries)} queries")
+    print("k".ljust(6) + "".join(name.rjust(10) for name in retrievers))
+    for k in args.k:
+        row = [recall_at_k(ranks[name], k) for name in retrievers]
+        print(str(k).ljust(6) + "".join(f"{v:10.3f}" for v in row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Ingestion throughput: the old one-step-after-another flow (load every file,
+parse every node, then one big `insert_nodes`) against `IngestionPipeline`.
+
+Embedding and upserts are simulated with fixed per-request latencies so the
+benchmark runs offline and shows the effect of overlapping the stages. Use
+--latency 0 to measure parsing alone.
+
+Usage (from the repository root):
+    python benchmarks/bench_ingestion.py --files uploaded_files/*.pdf --parse-workers 4
+"""
+
+import os
+import sys
+import time
+import glob
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
+
+from llama_index.core import SimpleDirectoryReader, StorageContext, VectorStoreIndex
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.node_parser import SimpleNodeParser
+from llama_index.core.vector_stores import SimpleVectorStore
+
+from ingestion import IngestionPipeline
+
+
+class SlowEmbedding(MockEmbedding):
+    """Returns constant vectors after sleeping like one embedding API request."""
+
+    latency: float = 0.2
+
+    def _get_text_embeddings(self, texts):
+        time.sleep(self.latency)
+        return [self._get_vector() for _ in texts]
+
+
+class SlowVectorStore(SimpleVectorStore):
+    latency: float = 0.1
+
+    def add(self, nodes, **kwargs):
+        time.sleep(self.latency)
+        return super().add(nodes, **kwargs)
+
+
+def make_index(args):
+    embed_model = SlowEmbedding(
+        embed_dim=args.dim, latency=args.latency, embed_batch_size=args.batch_size
+    )
+    vector_store = SlowVectorStore()
+    vector_store.latency = args.latency / 2
+    index = VectorStoreIndex(
+        [],
+        storage_context=StorageContext.from_defaults(vector_store=vector_store),
+        embed_model=embed_model,
+        insert_batch_size=args.batch_size,
+    )
+    return index, embed_model
+
+
+def run_sequential(files, args):
+    index, _ = make_index(args)
+    documents = SimpleDirectoryReader(input_files=files).load_data()
+    nodes = SimpleNodeParser.from_defaults(
+        chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap
+    ).get_nodes_from_documents(documents)
+    index.insert_nodes(nodes)
+    return len(nodes)
+
+
+def run_pipeline(files, args):
+    index, embed_model = make_index(args)
+    pipeline = IngestionPipeline(
+        index,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        embed_model=embed_model,
+        parse_workers=args.parse_workers,
+        embed_batch_size=args.batch_size,
+        max_inflight_batches=args.inflight,
+    )
+    return pipeline.run(files)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", nargs="+", default=glob.glob("uploaded_files/*.pdf"))
+    parser.add_argument("--repeat-files", type=int, default=4)
+    parser.add_argument("--parse-workers", type=int, default=4)
+    parser.add_argument("--inflight", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--chunk-size", type=int, default=1024)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--dim", type=int, default=64)
+    args = parser.parse_args()
+
+    files = args.files * args.repeat_files
+    for name, run in [("sequential", run_sequential), ("pipeline", run_pipeline)]:
+        start = time.perf_counter()
+        n_nodes = run(files, args)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name:<11} {len(files)} files, {n_nodes} nodes in {elapsed:6.2f}s "
+            f"({n_nodes / elapsed:7.1f} nodes/s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
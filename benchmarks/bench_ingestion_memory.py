@@ -0,0 +1,100 @@
+"""
+Peak memory of ingesting one large PDF whole (`SimpleDirectoryReader` loads
+every page and every node is held before indexing) against streaming
+ingestion (`ingestion.streaming`), which reads page by page and hands on
+fixed-size batches.
+
+The large PDF is built by repeating the pages of the input PDF. Embeddings
+are mocked and upserted nodes are dropped, so the benchmark runs offline and
+only measures the ingestion path itself. Peak memory is traced with
+`tracemalloc`. Streaming peak memory should stay flat as --repeat grows,
+while whole-file peak memory grows with it.
+
+Usage (from the repository root):
+    python benchmarks/bench_ingestion_memory.py --file uploaded_files/2407.05131v2.pdf --repeat 2 8
+"""
+
+import os
+import sys
+import time
+import glob
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
+
+import pypdf
+from llama_index.core.embeddings import MockEmbedding
+
+from ingestion import IngestionPipeline
+
+
+class DiscardingIndex:
+    """Stands in for the vector index and forgets nodes once upserted."""
+
+    def __init__(self):
+        self.n_nodes = 0
+
+    def insert_nodes(self, nodes):
+        self.n_nodes += len(nodes)
+
+
+def make_large_pdf(path, repeat, output):
+    writer = pypdf.PdfWriter()
+    for _ in range(repeat):
+        writer.append(path)
+    writer.write(output)
+
+
+def run(path, streaming, args):
+    pipeline = IngestionPipeline(
+        DiscardingIndex(),
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        embed_model=MockEmbedding(embed_dim=args.dim),
+        parse_workers=1,  # parse in this process so tracemalloc sees it
+        embed_batch_size=args.batch_size,
+        max_inflight_batches=args.inflight,
+        streaming=streaming,
+    )
+    tracemalloc.start()
+    start = time.perf_counter()
+    n_nodes = pipeline.run([path])
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return n_nodes, peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    default_files = glob.glob("uploaded_files/*.pdf")
+    parser.add_argument("--file", default=default_files[0] if default_files else None)
+    parser.add_argument("--repeat", type=int, nargs="+", default=[2, 8])
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--inflight", type=int, default=2)
+    parser.add_argument("--chunk-size", type=int, default=1024)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--dim", type=int, default=3072)
+    args = parser.parse_args()
+
+    print(
+        f"{'pages':>6} {'MB':>7} {'mode':<10} {'nodes':>6} {'peak MB':>8} {'time':>7}"
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for repeat in args.repeat:
+            path = os.path.join(tmp_dir, f"large_{repeat}.pdf")
+            make_large_pdf(args.file, repeat, path)
+            n_pages = len(pypdf.PdfReader(path).pages)
+            size_mb = os.path.getsize(path) / 2**20
+            for mode, streaming in [("whole", False), ("streaming", True)]:
+                n_nodes, peak, elapsed = run(path, streaming, args)
+                print(
+                    f"{n_pages:>6} {size_mb:>7.1f} {mode:<10} {n_nodes:>6} "
+                    f"{peak / 2**20:>8.1f} {elapsed:>6.1f}s"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Vector search over the whole namespace against search pushed down to one
+file with metadata filters, on the local vector store.
+
+A synthetic namespace of --files files with --chunks chunks each is written
+to a scratch LocalVectorStore, with random unit vectors. Each query is a
+noisy copy of one chunk's vector, asked on behalf of that chunk's file, as a
+Streamlit user chatting about the file they just uploaded would. Reported
+per way of searching:
+
+- latency of the vector store query
+- rows scored per query
+- on-file share: the share of the top k that comes from the asked-about
+  file; the rest is irrelevant context the LLM would be given
+
+"file_name filter" uses the store's metadata index. "scanned filter" is the
+same filter with the index switched off, so every row's metadata is checked.
+
+Usage (from the repository root):
+    python benchmarks/bench_metadata_filters.py --files 200 --chunks 50
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
+
+
+def build_store(path, args, rng):
+    from llama_index.core.schema import TextNode
+    from local_vector_store import LocalVectorStore
+
+    store = LocalVectorStore(
+        persist_dir=path, namespace="bench", embedding_dim=args.embedding_dim
+    )
+    vectors = rng.standard_normal(
+        (args.files * args.chunks, args.embedding_dim), dtype=np.float32
+    )
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    nodes = []
+    for i, vector in enumerate(vectors):
+        file_no = i // args.chunks
+        nodes.append(
+            TextNode(
+                id_=f"chunk-{i}",
+                text=f"chunk {i} of file {file_no}",
+                metadata={
+                    "file_name": f"doc_{file_no:04d}.pdf",
+                    "tenant": f"tenant_{file_no % 10}",
+                    "uploaded_at": 1.7e9 + file_no,
+                },
+                embedding=vector.tolist(),
+            )
+        )
+    store.add(nodes)
+    return store, vectors
+
+
+def run(store, queries, top_k, make_filters):
+    from llama_index.core.vector_stores.types import VectorStoreQuery
+
+    latencies, scored, on_file = [], [], []
+    for vector, file_name in queries:
+        filters = make_filters(file_name)
+        start = time.perf_counter()
+        result = store.query(
+            VectorStoreQuery(
+                query_embedding=vector.tolist(),
+                similarity_top_k=top_k,
+                filters=filters,
+            )
+        )
+        latencies.append(time.perf_counter() - start)
+        scored.append(
+            len(store._select_rows(filters=filters))
+            if filters is not None
+            else store.count()
+        )
+        on_file.append(
+            sum(n.metadata["file_name"] == file_name for n in result.nodes) / top_k
+        )
+    latencies.sort()
+    return {
+        "ms_p50": 1000 * statistics.median(latencies),
+        "ms_p95": 1000 * latencies[int(0.95 * (len(latencies) - 1))],
+        "rows_scored": statistics.mean(scored),
+        "on_file_share": statistics.mean(on_file),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--chunks", type=int, default=50)
+    parser.add_argument("--embedding-dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--noise", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import local_vector_store
+    from metadata_filters import build_metadata_filters
+
+    rng = np.random.default_rng(args.seed)
+    scratch_dir = tempfile.mkdtemp(prefix="rag_filter_bench_")
+    try:
+        store, vectors = build_store(scratch_dir, args, rng)
+        queries = []
+        for i in rng.integers(0, len(vectors), args.queries):
+            vector = vectors[i] + args.noise * rng.standard_normal(
+                args.embedding_dim, dtype=np.float32
+            ) / np.sqrt(args.embedding_dim)
+            queries.append((vector, f"doc_{i // args.chunks:04d}.pdf"))
+
+        def file_filter(file_name):
+            return build_metadata_filters({"file_name": file_name})
+
+        indexed_keys = local_vector_store.INDEXED_METADATA_KEYS
+        results = {
+            "no filter": run(store, queries, args.top_k, lambda _: None),
+            "file_name filter": run(store, queries, args.top_k, file_filter),
+        }
+        local_vector_store.INDEXED_METADATA_KEYS = ()
+        try:
+            results["scanned filter"] = run(store, queries, args.top_k, file_filter)
+        finally:
+            local_vector_store.INDEXED_METADATA_KEYS = indexed_keys
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    print(
+        f"{args.files} files x {args.chunks} chunks, dim {args.embedding_dim}, "
+        f"{args.queries} queries, top {args.top_k}"
+    )
+    print(f"{'search':<18}{'p50 ms':>9}{'p95 ms':>9}{'rows scored':>13}{'on-file':>9}")
+    for name, r in results.items():
+        print(
+            f"{name:<18}{r['ms_p50']:>9.2f}{r['ms_p95']:>9.2f}"
+            f"{r['rows_scored']:>13.0f}{r['on_file_share']:>9.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Throughput and latency of the local moderation engine.
+
+Queries are generated offline: clean study questions, plus queries that use
+lexicon terms, some obfuscated with leetspeak, spacing or elongated letters.
+For comparison, the same lexicon is also checked with one word-boundary
+regex per term, the obvious alternative to a single Aho-Corasick pass.
+The share of borderline queries is the share that still needs an LLM call.
+
+Before measuring, study questions that use domain words close to lexicon
+terms are checked to be allowed; the script exits with status 1 otherwise.
+
+Usage (from the repository root):
+    python benchmarks/bench_moderation.py --queries 20000
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from bench_suite import VOCABULARY
+from moderation import VERDICT_ALLOW, Moderator, normalize_text
+
+LEET = {"a": "4", "e": "3", "i": "1", "o": "0", "s": "5", "t": "7"}
+TEMPLATES = [
+    "What is {w1} and how does it affect {w2}?",
+    "Explain the relation between {w1}, {w2} and {w3}.",
+    "Why does {w1} change with {w2}?",
+    "Describe {w1} {w2} with an example from the chapter on {w3}.",
+]
+# NCERT questions the lexicon must let through on the fast path
+PINNED_ALLOW = [
+    "What laws protect women against rape in India?",
+    "Explain marital rape as a social issue.",
+    "What is retarded motion?",
+    "Why is the motion of a ball thrown upward retarded?",
+    "What is retardation?",
+    "Can you retard the motion of a body with friction?",
+    "What is jerk in physics?",
+    "How does a syringe suck up liquid when the plunger is pulled?",
+    "Why is the bastard wing of a bird important in flight?",
+]
+
+
+def obfuscate(term, rng):
+    style = rng.choice(["plain", "leet", "spaced", "elongated"])
+    if style == "leet":
+        return "".join(LEET.get(c, c) for c in term)
+    if style == "spaced":
+        return " ".join(term) if " " not in term else term
+    if style == "elongated":
+        i = rng.randrange(len(term))
+        return term[:i] + term[i] * 4 + term[i + 1 :]
+    return term
+
+
+def make_queries(lexicon, n_queries, flagged_share, seed):
+    rng = random.Random(seed)
+    terms = [t for level in lexicon["terms"].values() for t in level]
+    queries = []
+    for _ in range(n_queries):
+        words = dict(zip(["w1", "w2", "w3"], rng.sample(VOCABULARY, 3)))
+        query = rng.choice(TEMPLATES).format(**words)
+        if rng.random() < flagged_share:
+            query = f"{query} {obfuscate(rng.choice(terms), rng)}"
+        queries.append(query)
+    return queries
+
+
+class RegexPerTerm:
+    """One compiled word-boundary regex per lexicon term."""
+
+    def __init__(self, lexicon):
+        self.patterns = [
+            re.compile(r"\b" + re.escape(term) + r"\b")
+            for level in lexicon["terms"].values()
+            for term in level
+        ]
+
+    def check(self, query_str):
+        text = normalize_text(query_str)
+        return [p.pattern for p in self.patterns if p.search(text)]
+
+
+def measure(check, queries):
+    latencies = []
+    start = time.perf_counter()
+    for query in queries:
+        t0 = time.perf_counter()
+        check(query)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "queries_per_s": len(queries) / elapsed,
+        "us_p50": 1e6 * statistics.median(latencies),
+        "us_p99": 1e6 * latencies[int(0.99 * (len(latencies) - 1))],
+    }
+
+
+def check_pinned(moderator):
+    """The PINNED_ALLOW queries that are not allowed, with their results."""
+    results = [(query, moderator.check(query)) for query in PINNED_ALLOW]
+    return [(query, r) for query, r in results if r.verdict != VERDICT_ALLOW]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--flagged-share", type=float, default=0.2)
+    parser.add_argument(
+        "--lexicon", default=os.path.join(ROOT, "config", "moderation_lexicon.json")
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(args.lexicon) as f:
+        lexicon = json.load(f)
+    queries = make_queries(lexicon, args.queries, args.flagged_share, args.seed)
+    moderator = Moderator(lexicon)
+    failed = check_pinned(moderator)
+    for query, result in failed:
+        print(f"not allowed: {query!r} -> {result.verdict} {result.score:.2f}")
+    if failed:
+        sys.exit(1)
+
+    results = {
+        "normalize only": measure(normalize_text, queries),
+        "aho-corasick": measure(moderator.check, queries),
+        "regex per term": measure(RegexPerTerm(lexicon).check, queries),
+    }
+    verdicts = Counter(moderator.check(q).verdict for q in queries)
+
+    print(f"{len(queries)} queries, {len(moderator.terms)} lexicon terms")
+    print(f"{'engine':<16}{'queries/s':>12}{'p50 us':>10}{'p99 us':>10}")
+    for name, r in results.items():
+        print(
+            f"{name:<16}{r['queries_per_s']:>12.0f}"
+            f"{r['us_p50']:>10.1f}{r['us_p99']:>10.1f}"
+        )
+    print(
+        "verdicts: "
+        + ", ".join(f"{v} {verdicts[v] / len(queries):.1%}" for v in sorted(verdicts))
+    )
+
+
+if __name__ == "__main__":
+    main()
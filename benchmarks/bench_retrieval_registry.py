@@ -0,0 +1,49 @@
+"""
+Micro-benchmark: cost of getting a retrieval engine per VectorDBTool call.
+
+Compares building a fresh SimpleRetrieverGeneration on every call (the old
+behaviour of `get_retrieval()`) against the shared registry in
+`retrieval.get_retrieval_engine`. Only construction is timed, no queries are
+sent, so this runs without network access.
+
+Usage (from the repository root):
+    python benchmarks/bench_retrieval_registry.py --calls 200
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("PINECONE_API_KEY", "benchmark")
+
+
+def time_calls(fn, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    from retrieval import SimpleRetrieverGeneration, get_retrieval_engine
+
+    get_retrieval_engine()  # first build is paid once per process
+
+    fresh = time_calls(SimpleRetrieverGeneration, args.calls)
+    shared = time_calls(get_retrieval_engine, args.calls)
+
+    print(f"calls per variant        : {args.calls}")
+    print(f"fresh engine per call    : {fresh * 1e6:10.1f} us")
+    print(f"shared registry per call : {shared * 1e6:10.1f} us")
+    print(f"speed-up                 : {fresh / shared:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Bytes sent to and from Pinecone per upserted vector and per query, with
+full node payloads against slim vectors hydrated from the node store.
+
+Synthetic text files (as in bench_suite.py) are chunked with the
+chunk_size and chunk_overlap from ncert_search.json, get the metadata
+indexing adds, and random unit vectors of `embedding_dim`. A stand-in
+Pinecone index takes the place of `pinecone.Index`: it keeps the upserted
+vectors, answers queries with a dot product, and counts the JSON bytes of
+each upsert request and query response as the REST API would carry them.
+Compared are:
+
+- full, with values: the stock PineconeVectorStore, which stores the whole
+  node in the vector metadata and asks for the stored vectors back
+- full: AsyncPineconeVectorStore, which no longer asks for the vectors
+- slim: AsyncPineconeVectorStore with `slim_metadata_keys`, which stores
+  only the filter fields; nodes are hydrated from a scratch NodeStore in one
+  lookup per query, timed with a cold and a warm hot-cache
+
+Usage (from the repository root):
+    python benchmarks/bench_slim_vectors.py --files 20 --queries 200
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+from types import SimpleNamespace
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "benchmarks")]
+
+
+class StandInPineconeIndex:
+    """Enough of `pinecone.Index` for the vector store, counting JSON bytes."""
+
+    def __init__(self):
+        self.entries = {}
+        self.upsert_bytes = 0
+        self.query_bytes = 0
+
+    def upsert(self, vectors, namespace="", batch_size=100, **kwargs):
+        for i in range(0, len(vectors), batch_size):
+            batch = vectors[i : i + batch_size]
+            self.upsert_bytes += len(
+                json.dumps({"vectors": batch, "namespace": namespace})
+            )
+            for entry in batch:
+                self.entries[entry["id"]] = entry
+        self._ids = list(self.entries)
+        self._matrix = np.asarray(
+            [self.entries[i]["values"] for i in self._ids], dtype=np.float32
+        )
+
+    def query(
+        self,
+        vector,
+        top_k,
+        include_values=False,
+        include_metadata=False,
+        namespace="",
+        filter=None,
+        **kwargs,
+    ):
+        scores = self._matrix @ np.asarray(vector, dtype=np.float32)
+        matches = []
+        for row in np.argsort(-scores)[:top_k]:
+            entry = self.entries[self._ids[row]]
+            match = {"id": entry["id"], "score": float(scores[row])}
+            if include_values:
+                match["values"] = entry["values"]
+            if include_metadata:
+                match["metadata"] = entry["metadata"]
+            matches.append(match)
+        response = {"matches": matches, "namespace": namespace}
+        self.query_bytes += len(json.dumps(response))
+        return SimpleNamespace(
+            matches=[
+                SimpleNamespace(
+                    id=m["id"],
+                    score=m["score"],
+                    values=m.get("values", []),
+                    metadata=m.get("metadata"),
+                )
+                for m in matches
+            ]
+        )
+
+
+def make_nodes(args, ncert_search, rng, scratch_dir):
+    import bench_suite
+    from ingestion import parse_file
+
+    corpus_dir = os.path.join(scratch_dir, "corpus")
+    os.makedirs(corpus_dir)
+    nodes = []
+    for path in bench_suite.make_corpus(
+        corpus_dir, args.files, args.paragraphs, args.seed
+    ):
+        nodes.extend(
+            parse_file(path, ncert_search["chunk_size"], ncert_search["chunk_overlap"])
+        )
+    uploaded_at = time.time()
+    vectors = rng.standard_normal((len(nodes), ncert_search["embedding_dim"]))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    for node, vector in zip(nodes, vectors):
+        # As DocumentManager.add_node_metadata stamps them
+        node.metadata["last_accessed_date"] = "2024-10-18T09:00:00"
+        node.metadata["tenant"] = "default"
+        node.metadata["uploaded_at"] = uploaded_at
+        node.embedding = vector.tolist()
+    return nodes, vectors
+
+
+def run_queries(vector_store, queries, top_k, hydrator=None):
+    from llama_index.core.schema import NodeWithScore
+    from llama_index.core.vector_stores.types import VectorStoreQuery
+
+    latencies, hydrate_latencies, texts = [], [], []
+    for vector in queries:
+        start = time.perf_counter()
+        result = vector_store.query(
+            VectorStoreQuery(query_embedding=vector.tolist(), similarity_top_k=top_k)
+        )
+        nodes = [
+            NodeWithScore(node=node, score=score)
+            for node, score in zip(result.nodes, result.similarities)
+        ]
+        hydrated = time.perf_counter()
+        if hydrator is not None:
+            nodes = hydrator.postprocess_nodes(nodes)
+        end = time.perf_counter()
+        latencies.append(end - start)
+        hydrate_latencies.append(end - hydrated)
+        texts.append([n.node.get_content() for n in nodes])
+    return latencies, hydrate_latencies, texts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--paragraphs", type=int, default=120)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=15)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from llama_index.vector_stores.pinecone import PineconeVectorStore
+    from indexer import AsyncPineconeVectorStore
+    from node_store import DEFAULT_SLIM_METADATA_KEYS, NodeHydrator, NodeStore
+
+    with open(os.path.join(ROOT, "config", "ncert_search.json")) as f:
+        ncert_search = json.load(f)
+    rng = np.random.default_rng(args.seed)
+    scratch_dir = tempfile.mkdtemp(prefix="rag_slim_bench_")
+    try:
+        nodes, vectors = make_nodes(args, ncert_search, rng, scratch_dir)
+        queries = [
+            vectors[i] + rng.standard_normal(vectors.shape[1]) / 8
+            for i in rng.integers(0, len(nodes), args.queries)
+        ]
+        node_store = NodeStore(os.path.join(scratch_dir, "nodes.sqlite"))
+        hydrator = NodeHydrator(node_store=node_store)
+
+        results, texts = {}, {}
+        for name, make_store in (
+            ("full, with values", PineconeVectorStore),
+            ("full", AsyncPineconeVectorStore),
+            (
+                "slim",
+                lambda **kwargs: AsyncPineconeVectorStore(
+                    slim_metadata_keys=DEFAULT_SLIM_METADATA_KEYS, **kwargs
+                ),
+            ),
+        ):
+            index = StandInPineconeIndex()
+            vector_store = make_store(pinecone_index=index, namespace="bench")
+            slim = name == "slim"
+            if slim:
+                node_store.put_many(nodes)
+            vector_store.add(nodes)
+            # A fresh hot-cache, then the same queries again with it warm
+            node_store._cache.clear()
+            runs = [
+                run_queries(
+                    vector_store, queries, args.top_k, hydrator if slim else None
+                )
+                for _ in range(2 if slim else 1)
+            ]
+            latencies, hydrate_latencies, texts[name] = runs[0]
+            results[name] = {
+                "upsert_bytes_per_vector": index.upsert_bytes / len(nodes),
+                "response_bytes_per_query": index.query_bytes
+                / (len(runs) * args.queries),
+                "ms_p50": 1000 * statistics.median(latencies),
+            }
+            if slim:
+                results[name]["hydrate_cold_ms_p50"] = 1000 * statistics.median(
+                    hydrate_latencies
+                )
+                results[name]["hydrate_warm_ms_p50"] = 1000 * statistics.median(
+                    runs[1][1]
+                )
+        node_store._conn.close()
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    assert texts["slim"] == texts["full"], "hydrated nodes differ from full ones"
+    print(
+        f"{len(nodes)} chunks of {ncert_search['chunk_size']} tokens, "
+        f"dim {ncert_search['embedding_dim']}, {args.queries} queries, "
+        f"top {args.top_k}"
+    )
+    print(
+        f"{'payload':<20}{'upsert B/vector':>17}{'response B/query':>18}"
+        f"{'p50 ms':>9}"
+    )
+    for name, r in results.items():
+        print(
+            f"{name:<20}{r['upsert_bytes_per_vector']:>17,.0f}"
+            f"{r['response_bytes_per_query']:>18,.0f}{r['ms_p50']:>9.2f}"
+        )
+    slim = results["slim"]
+    print(
+        f"slim hydration p50: {slim['hydrate_cold_ms_p50']:.2f} ms cold, "
+        f"{slim['hydrate_warm_ms_p50']:.2f} ms warm"
+    )
+
+
+if __name__ == "__main__":
+    main()
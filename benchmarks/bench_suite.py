@@ -0,0 +1,431 @@
+"""
+Offline benchmark suite for ingestion, retrieval and the agent.
+
+The OpenAI LLM, embedding model, agent chat model and Pinecone index are
+swapped for the deterministic stand-ins in `stand_ins.py`. Everything else
+is the real code path from `document_manager.py`, `retrieval.py` and
+`agent.py`. The suite runs in a scratch directory, with a copy of
+config/ncert_search.json in which the answer and query embedding caches are
+off, so storage files never touch the repository.
+
+Measured:
+- ingestion throughput through `DocumentManager.index_doc_from_files`
+- query latency per stage: embed, retrieve, postprocess, synthesize, and
+  end to end through `get_query_response`
+- time per query when the same queries go through `get_query_responses`
+- agent latency, and agent overhead excluding tool and chat model time
+- traced peak memory of ingestion, and the process's peak RSS
+
+Each benchmark runs a few untimed --warmup queries first, and is repeated
+--repeats times; the reported value of each metric is its median over the
+repeats.
+
+Results are written as JSON and compared metric by metric against
+benchmarks/baseline.json. A metric that is worse than the baseline by more
+than --tolerance (--latency-tolerance for timings, which are noisier)
+counts as a regression, and the script then exits with status 1. p95
+latencies are reported but not gated, since a few dozen samples make them
+too noisy. Timings depend on the machine, so they are only compared when
+the baseline records the same hardware; regenerate it with
+--update-baseline on new hardware.
+
+Usage (from the repository root):
+    python benchmarks/bench_suite.py --report bench_report.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import statistics
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baseline.json")
+# Arguments that only control this run, kept out of the report's meta
+RUN_FLAGS = ("report", "baseline", "tolerance", "latency_tolerance", "update_baseline")
+
+VOCABULARY = (
+    "sound wave vibration medium frequency amplitude pitch loudness echo "
+    "reflection speed air water solid compression rarefaction ultrasound "
+    "force motion energy work power gravity mass weight pressure density "
+    "cell tissue organ nucleus membrane atom molecule element compound "
+    "reaction acid base salt metal carbon light lens mirror image refraction"
+).split()
+
+
+def make_corpus(directory, n_files, paragraphs, seed):
+    rng = random.Random(seed)
+    paths = []
+    for i in range(n_files):
+        text = "\n\n".join(
+            ". ".join(
+                " ".join(rng.choices(VOCABULARY, k=rng.randint(8, 16))).capitalize()
+                for _ in range(rng.randint(4, 8))
+            )
+            + "."
+            for _ in range(paragraphs)
+        )
+        path = os.path.join(directory, f"doc_{i:03d}.txt")
+        with open(path, "w") as f:
+            f.write(text)
+        paths.append(path)
+    return paths
+
+
+def make_queries(paths, n_queries, seed):
+    rng = random.Random(seed)
+    sentences = []
+    for path in paths:
+        with open(path) as f:
+            sentences.extend(s.strip() for s in f.read().split(".") if s.strip())
+    return rng.sample(sentences, min(n_queries, len(sentences)))
+
+
+def write_config(args):
+    with open(os.path.join(ROOT, "config", "ncert_search.json")) as f:
+        ncert_search = json.load(f)
+    ncert_search["embedding_dim"] = args.embedding_dim
+    ncert_search["answer_cache"]["enabled"] = False
+    ncert_search["embedding_cache"]["enabled"] = False
+    ncert_search["warm_up_on_startup"] = False
+    ncert_search["ingestion"]["parse_workers"] = args.parse_workers
+    os.makedirs("config")
+    with open("config/ncert_search.json", "w") as f:
+        json.dump(ncert_search, f)
+
+
+def percentiles(prefix, samples):
+    samples = sorted(samples)
+    return {
+        f"{prefix}_ms_p50": 1000 * statistics.median(samples),
+        f"{prefix}_ms_p95": 1000 * samples[int(0.95 * (len(samples) - 1))],
+    }
+
+
+def install_stand_ins(args):
+    """Points the lazily built service singletons at the stand-ins."""
+    from llama_index.core import Settings
+    from llama_index.core.callbacks import CallbackManager
+    from service_config import ServiceConfig
+    from stand_ins import FakeLLM, HashEmbedding, make_memory_index
+    from tracing import LlamaIndexTraceHandler
+
+    llm = FakeLLM(
+        latency=args.llm_latency,
+        token_latency=args.token_latency,
+        output_tokens=args.llm_tokens,
+    )
+    embed_model = HashEmbedding(
+        embed_dim=args.embedding_dim, latency=args.embed_latency
+    )
+    # Same tracing callbacks as ServiceConfig.configure_settings
+    Settings.callback_manager = CallbackManager([LlamaIndexTraceHandler()])
+    llm.callback_manager = Settings.callback_manager
+    embed_model.callback_manager = Settings.callback_manager
+    Settings.llm = llm
+    Settings.embed_model = embed_model
+    ServiceConfig._settings_configured = True
+    ServiceConfig._model = llm
+    ServiceConfig._system_indexer = make_memory_index(embed_model)
+
+
+def fresh_index():
+    """Drops the index and storage, so every chunk is parsed and embedded again."""
+    from llama_index.core import Settings
+    from service_config import ServiceConfig
+    from stand_ins import make_memory_index
+
+    shutil.rmtree("storage", ignore_errors=True)
+    ServiceConfig._system_indexer = make_memory_index(Settings.embed_model)
+
+
+def bench_ingestion(paths):
+    from document_manager import DocumentManager
+
+    fresh_index()
+    start = time.perf_counter()
+    n_nodes = DocumentManager().index_doc_from_files(paths)
+    elapsed = time.perf_counter() - start
+    return n_nodes, {
+        "ingestion_seconds": elapsed,
+        "ingestion_nodes_per_s": n_nodes / elapsed,
+    }
+
+
+def bench_ingestion_memory(paths):
+    from document_manager import DocumentManager
+
+    fresh_index()
+    tracemalloc.start()
+    DocumentManager().index_doc_from_files(paths)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"ingestion_peak_traced_mb": peak / 2**20}
+
+
+def bench_query_stages(queries, warmup):
+    from llama_index.core import Settings
+    from llama_index.core.schema import QueryBundle
+    from retrieval import get_retrieval_engine
+
+    engine = get_retrieval_engine()
+    for query_str in queries[:warmup]:
+        engine.get_query_response(query_str)
+    stages = {
+        name: []
+        for name in ["embed", "retrieve", "postprocess", "synthesize", "end_to_end"]
+    }
+    for query_str in queries:
+        t0 = time.perf_counter()
+        query_bundle = QueryBundle(query_str)
+        query_bundle.embedding = Settings.embed_model.get_query_embedding(query_str)
+        t1 = time.perf_counter()
+        nodes = engine.retriever.retrieve(query_bundle)
+        t2 = time.perf_counter()
+        for post_processor in engine.post_processors:
+            nodes = post_processor.postprocess_nodes(nodes, query_bundle)
+        t3 = time.perf_counter()
+        engine.query_engine.synthesize(query_bundle, nodes)
+        t4 = time.perf_counter()
+        engine.get_query_response(query_str)
+        t5 = time.perf_counter()
+        for name, seconds in zip(stages, [t1 - t0, t2 - t1, t3 - t2, t4 - t3, t5 - t4]):
+            stages[name].append(seconds)
+
+    metrics = {}
+    for name, samples in stages.items():
+        metrics.update(percentiles(f"query_{name}", samples))
+    return metrics
+
+
+def bench_batch_queries(queries):
+    from retrieval import get_retrieval_engine
+
+    engine = get_retrieval_engine()
+    start = time.perf_counter()
+    results = engine.get_query_responses(queries)
+    elapsed = time.perf_counter() - start
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        raise errors[0]
+    return {"batch_query_ms_per_query": 1000 * elapsed / len(queries)}
+
+
+class TimedEngine:
+    """Forwards to the retrieval engine and records time spent in it."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.seconds = 0.0
+
+    def get_query_response(self, query_str, filters=None):
+        start = time.perf_counter()
+        try:
+            return self.engine.get_query_response(query_str, filters)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+
+def bench_agent(queries, args):
+    import agent
+    from retrieval import get_retrieval_engine
+    from stand_ins import FakeChatModel
+
+    chat_model = FakeChatModel(latency=args.chat_latency)
+    timed_engine = TimedEngine(get_retrieval_engine())
+    agent.get_agent_llm = lambda model="gpt-4": chat_model
+    agent.get_retrieval = lambda: timed_engine
+    executor = agent.get_agent(agent.get_agent_tools(), "fake-chat")
+    executor.verbose = False
+    for query_str in queries[: args.warmup]:
+        executor.invoke({"input": query_str})
+
+    latencies, overheads = [], []
+    for query_str in queries:
+        tool_seconds, chat_seconds = timed_engine.seconds, chat_model.seconds
+        start = time.perf_counter()
+        executor.invoke({"input": query_str})
+        elapsed = time.perf_counter() - start
+        latencies.append(elapsed)
+        overheads.append(
+            elapsed
+            - (timed_engine.seconds - tool_seconds)
+            - (chat_model.seconds - chat_seconds)
+        )
+    return {
+        **percentiles("agent", latencies),
+        **percentiles("agent_overhead", overheads),
+    }
+
+
+def hardware():
+    """What the timings depend on, recorded in the report's meta."""
+    cpu_model = platform.processor()
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    cpu_model = line.split(":", 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_model": cpu_model,
+        "cpus": os.cpu_count(),
+    }
+
+
+def median_of_runs(runs):
+    """Per-metric median over repeated runs of a benchmark."""
+    return {
+        metric: statistics.median(run[metric] for run in runs) for metric in runs[0]
+    }
+
+
+def higher_is_better(metric):
+    return metric.endswith("_per_s")
+
+
+def is_timing(metric):
+    return "_ms" in metric or metric.endswith(("_seconds", "_per_s"))
+
+
+def is_gated(metric):
+    return not metric.endswith("_p95")
+
+
+def compare(metrics, baseline, tolerance, latency_tolerance, same_hardware=True):
+    """
+    Prints current vs baseline and returns the names of regressed metrics.
+    Without `same_hardware`, timings are shown but never count as regressed,
+    and neither do p95 latencies.
+    """
+    regressions = []
+    print(f"{'metric':<34} {'baseline':>10} {'current':>10} {'change':>8}")
+    for metric, value in metrics.items():
+        base = baseline.get(metric)
+        if not base:
+            print(f"{metric:<34} {'-':>10} {value:>10.3f}")
+            continue
+        change = (value - base) / base
+        worse = -change if higher_is_better(metric) else change
+        status = ""
+        if is_timing(metric) and not same_hardware:
+            status = "  (other hardware)"
+        elif not is_gated(metric):
+            status = "  (not gated)"
+        elif worse > (latency_tolerance if is_timing(metric) else tolerance):
+            status = "  REGRESSION"
+            regressions.append(metric)
+        print(f"{metric:<34} {base:>10.3f} {value:>10.3f} {change:>+7.1%}{status}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--paragraphs", type=int, default=30)
+    parser.add_argument("--queries", type=int, default=30)
+    parser.add_argument("--agent-queries", type=int, default=10)
+    parser.add_argument("--embedding-dim", type=int, default=3072)
+    parser.add_argument("--embed-latency", type=float, default=0.0)
+    parser.add_argument("--llm-latency", type=float, default=0.02)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--llm-tokens", type=int, default=64)
+    parser.add_argument("--chat-latency", type=float, default=0.02)
+    parser.add_argument("--parse-workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--report", default="bench_report.json")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--latency-tolerance", type=float, default=0.5)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+    report_path = os.path.abspath(args.report)
+    baseline_path = os.path.abspath(args.baseline)
+
+    scratch_dir = tempfile.mkdtemp(prefix="rag_bench_")
+    cwd = os.getcwd()
+    try:
+        os.chdir(scratch_dir)
+        write_config(args)
+        os.makedirs("corpus")
+        paths = make_corpus("corpus", args.files, args.paragraphs, args.seed)
+        queries = make_queries(paths, args.queries, args.seed)
+        install_stand_ins(args)
+
+        runs = []
+        for _ in range(args.repeats):
+            n_nodes, ingestion = bench_ingestion(paths)
+            runs.append(ingestion)
+        metrics = median_of_runs(runs)
+        runs = []
+        for _ in range(args.repeats):
+            run = bench_query_stages(queries, args.warmup)
+            run.update(bench_batch_queries(queries))
+            run.update(bench_agent(queries[: args.agent_queries], args))
+            runs.append(run)
+        metrics.update(median_of_runs(runs))
+        metrics.update(bench_ingestion_memory(paths))
+        metrics["peak_rss_mb"] = (
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        )
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            **hardware(),
+            "nodes": n_nodes,
+            **{k: v for k, v in vars(args).items() if k not in RUN_FLAGS},
+        },
+        "metrics": metrics,
+    }
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        with open(baseline_path, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {baseline_path}")
+        return
+
+    baseline = {"meta": {}, "metrics": {}}
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+    same_hardware = all(
+        baseline["meta"].get(key) == value for key, value in hardware().items()
+    )
+    if not same_hardware:
+        print("Baseline was recorded on other hardware, timings are not compared")
+    regressions = compare(
+        metrics,
+        baseline["metrics"],
+        args.tolerance,
+        args.latency_tolerance,
+        same_hardware,
+    )
+    print(f"Report written to {report_path}")
+    if regressions:
+        print(f"{len(regressions)} metric(s) regressed: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
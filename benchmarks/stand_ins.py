@@ -0,0 +1,177 @@
+"""
+Deterministic local stand-ins for OpenAI and Pinecone, so that the
+benchmarks run offline and give the same output on every run.
+
+- FakeLLM: a llama-index LLM with configurable latency and output length
+- HashEmbedding: a feature-hashing embedder with a configurable dimension
+- FakeChatModel: a langchain chat model that drives the ReAct agent through
+  one tool call and then a final answer
+- make_memory_index: a VectorStoreIndex over an in-memory vector store
+"""
+
+import time
+import asyncio
+import hashlib
+from typing import Any, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from llama_index.core import StorageContext, VectorStoreIndex
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.llms import (
+    CompletionResponse,
+    CompletionResponseGen,
+    CustomLLM,
+    LLMMetadata,
+)
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.core.vector_stores import SimpleVectorStore
+
+from hybrid_retriever import tokenize
+
+
+def _words(seed_text, n_words):
+    digest = hashlib.sha256(seed_text.encode("utf-8")).hexdigest()
+    return [f"w{digest[i % 60:i % 60 + 4]}" for i in range(n_words)]
+
+
+class FakeLLM(CustomLLM):
+    """
+    Answers with `output_tokens` words derived from the prompt, after
+    sleeping `latency` seconds plus `token_latency` seconds per token.
+    """
+
+    latency: float = 0.02
+    token_latency: float = 0.0
+    output_tokens: int = 64
+    context_window: int = 8192
+    calls: int = 0
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(
+            context_window=self.context_window,
+            num_output=self.output_tokens,
+            model_name="fake-llm",
+        )
+
+    def _tokens(self, prompt):
+        self.calls += 1
+        return _words(prompt, self.output_tokens)
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        tokens = self._tokens(prompt)
+        time.sleep(self.latency + self.token_latency * len(tokens))
+        return CompletionResponse(text=" ".join(tokens))
+
+    @llm_completion_callback()
+    def stream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseGen:
+        tokens = self._tokens(prompt)
+        time.sleep(self.latency)
+        text = ""
+        for token in tokens:
+            time.sleep(self.token_latency)
+            text += token + " "
+            yield CompletionResponse(text=text, delta=token + " ")
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        tokens = self._tokens(prompt)
+        await asyncio.sleep(self.latency + self.token_latency * len(tokens))
+        return CompletionResponse(text=" ".join(tokens))
+
+
+class HashEmbedding(BaseEmbedding):
+    """
+    Feature-hashing embedder. Each token adds +1 or -1 to a bucket chosen by
+    its hash, and the vector is L2-normalized. Texts that share words end up
+    close together, so retrieval still ranks sensibly. `latency` simulates
+    the round trip of an embedding request.
+    """
+
+    embed_dim: int = 3072
+    latency: float = 0.0
+    calls: int = 0
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashEmbedding"
+
+    def _embed(self, text):
+        vector = np.zeros(self.embed_dim, dtype=np.float32)
+        for token in tokenize(text):
+            h = int.from_bytes(
+                hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(),
+                "little",
+            )
+            vector[h % self.embed_dim] += 1.0 if h >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._get_text_embeddings([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    ReAct-compatible chat model. The first call for a question asks for the
+    VectorDBTool, and once the scratchpad holds an observation it gives the
+    final answer.
+    """
+
+    latency: float = 0.02
+    calls: int = 0
+    seconds: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        start = time.perf_counter()
+        time.sleep(self.latency)
+        prompt = messages[-1].content
+        question_part = prompt.rsplit("Question:", 1)[-1]
+        question = question_part.split("\n", 1)[0].strip()
+        if "\nObservation:" in question_part:
+            text = "Thought: I now know the final answer\nFinal Answer: " + question
+        else:
+            text = (
+                "Thought: I should search the documents.\n"
+                f"Action: VectorDBTool\nAction Input: {question}"
+            )
+        self.calls += 1
+        self.seconds += time.perf_counter() - start
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+
+def make_memory_index(embed_model):
+    """An empty VectorStoreIndex whose vectors and nodes stay in memory."""
+    return VectorStoreIndex(
+        [],
+        storage_context=StorageContext.from_defaults(vector_store=SimpleVectorStore()),
+        embed_model=embed_model,
+    )
@@ -1,11 +1,21 @@
 import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
 from langchain.agents import initialize_agent, Tool, AgentType
 
 # from langchain.chat_models.openai import ChatOpenAI
 from langchain.tools import BaseTool
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_openai import ChatOpenAI
+from functools import lru_cache
 from typing import List
 
+from http_clients import get_async_http_client, get_http_client, get_http_config
+from moderation import local_moderation_reply
+from tracing import record_llm_call, record_span
+
 # from langchain.s import LLMChain
 from dotenv import load_dotenv, find_dotenv
 
@@ -13,10 +23,24 @@ from dotenv import load_dotenv, find_dotenv
 
 
 def get_retrieval():
-    from retrieval import SimpleRetrieverGeneration
+    from retrieval import get_retrieval_engine
+
+    return get_retrieval_engine()
+
+
+# Metadata filters for the VectorDBTool calls of the current request. Agents
+# are pooled and shared, so the filters travel with the request's context.
+retrieval_filters = contextvars.ContextVar("retrieval_filters", default=None)
 
-    ncert_retriever_generation = SimpleRetrieverGeneration()
-    return ncert_retriever_generation
+
+@contextmanager
+def use_retrieval_filters(filters):
+    """Restricts VectorDBTool to nodes matching `filters` inside the block."""
+    token = retrieval_filters.set(filters)
+    try:
+        yield
+    finally:
+        retrieval_filters.reset(token)
 
 
 # class GeneralLLMTool(BaseTool):
@@ -49,6 +73,70 @@ def get_retrieval():
 #         return response
 
 
+CONTENT_MODERATION_PROMPT = """
+        Analyze the following query and determine if it contains inappropriate, offensive, or harmful language:
+        "{query}"
+
+        If the language is inappropriate, generate a polite response asking the user to rephrase their query. 
+        If the language is severely inappropriate, respond with a warning and do not engage further.
+        """
+
+
+class AgentTraceHandler(BaseCallbackHandler):
+    """
+    Records the agent's chat model calls (tool selection, moderation) and
+    tool runs as tracing stages, and counts the chat model's tokens.
+    """
+
+    # Run in the caller's context so spans land in the request's trace
+    run_inline = True
+
+    def __init__(self):
+        self._starts = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, stage):
+        with self._lock:
+            self._starts[run_id] = (stage, time.perf_counter())
+
+    def _end(self, run_id):
+        with self._lock:
+            started = self._starts.pop(run_id, None)
+        if started is not None:
+            stage, start = started
+            record_span(stage, start, time.perf_counter() - start)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, "agent.llm")
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, "agent.llm")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end(run_id)
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        record_llm_call(
+            "agent",
+            token_usage.get("prompt_tokens", 0),
+            token_usage.get("completion_tokens", 0),
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._start(run_id, f"agent.tool.{(serialized or {}).get('name', 'tool')}")
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+
+trace_handler = AgentTraceHandler()
+
+
 class InappropriateContentDetector(BaseTool):
     name: str = "InappropriateContentDetector"
     description: str = (
@@ -56,18 +144,26 @@ class InappropriateContentDetector(BaseTool):
     )
 
     def _run(self, query: str):
+        # Local moderation decides clear cases; only borderline ones need the LLM
+        reply = local_moderation_reply(query)
+        if reply is not None:
+            return reply
         llm = get_agent_llm()
-        content_moderation_prompt = f"""
-        Analyze the following query and determine if it contains inappropriate, offensive, or harmful language:
-        "{query}"
-
-        If the language is inappropriate, generate a polite response asking the user to rephrase their query. 
-        If the language is severely inappropriate, respond with a warning and do not engage further.
-        """
+        content_moderation_prompt = CONTENT_MODERATION_PROMPT.format(query=query)
 
         response = llm(content_moderation_prompt)
         return response
 
+    async def _arun(self, query: str):
+        reply = local_moderation_reply(query)
+        if reply is not None:
+            return reply
+        llm = get_agent_llm()
+        content_moderation_prompt = CONTENT_MODERATION_PROMPT.format(query=query)
+
+        response = await llm.ainvoke(content_moderation_prompt)
+        return response.content
+
 
 class VectorDBTool(BaseTool):
     name: str = "VectorDBTool"
@@ -77,17 +173,62 @@ class VectorDBTool(BaseTool):
 
     def _run(self, query: str):
         retriever = get_retrieval()
-        response, is_valid, _ = retriever.get_query_response(query)
+        response, is_valid, _ = retriever.get_query_response(
+            query, filters=retrieval_filters.get()
+        )
+        if not is_valid:
+            return "No relevant information found."
+        return response
+
+    async def _arun(self, query: str):
+        retriever = get_retrieval()
+        response, is_valid, _ = await retriever.aget_query_response(
+            query, filters=retrieval_filters.get()
+        )
         if not is_valid:
             return "No relevant information found."
         return response
 
 
+@lru_cache
 def get_agent_llm(model="gpt-4"):
-    llm = ChatOpenAI(model=model, temperature=0.7)
+    """
+    The shared ChatOpenAI for `model`. It is built once, on the shared HTTP
+    clients, instead of once per agent and per moderation call.
+    """
+    llm = ChatOpenAI(
+        model=model,
+        temperature=0.7,
+        callbacks=[trace_handler],
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client(),
+        max_retries=0,
+        timeout=get_http_config()["read_timeout"],
+    )
     return llm
 
 
+def get_agent_tools():
+    vector_db_tool = VectorDBTool()
+    content_detector = InappropriateContentDetector()
+    return [
+        Tool(
+            name="VectorDBTool",
+            func=vector_db_tool.run,
+            coroutine=vector_db_tool.arun,
+            description="Use this tool to query the VectorDB for complex information.",
+            callbacks=[trace_handler],
+        ),
+        Tool(
+            name="InappropriateContentDetector",
+            func=content_detector.run,
+            coroutine=content_detector.arun,
+            description="Detects inappropriate language in user queries and warns the user.",
+            callbacks=[trace_handler],
+        ),
+    ]
+
+
 def get_agent(tools: List, model: str):
     agent = initialize_agent(
         tools=tools,
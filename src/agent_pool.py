@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import queue
+import asyncio
+import threading
+from contextlib import contextmanager, asynccontextmanager
+
+from agent import get_agent, get_agent_tools
+
+CONFIG_PATH = "./config/ncert_search.json"
+DEFAULT_POOL_SIZE = 4
+DEFAULT_CHECKOUT_TIMEOUT = 30
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class AgentPool:
+    """
+    A process-wide pool of ready agent executors.
+
+    Agents are built once (at startup) and handed out to one request at a
+    time through `checkout()`. When the config file changes on disk the pool
+    is rebuilt by one caller while the others keep using the current agents;
+    agents that are checked out while this happens are dropped on checkin
+    instead of being returned to the new pool.
+
+    Waiters sleep until an agent is checked in or the pool is rebuilt, and
+    then look at the current pool again.
+    """
+
+    def __init__(self, size=None, config_path=CONFIG_PATH):
+        self.config_path = config_path
+        self._size = size
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        # (loop, future) of async waiters, woken from any thread
+        self._async_waiters = set()
+        self._reload_lock = threading.Lock()
+        self._agents = queue.Queue()
+        self._generation = 0
+        self._config_mtime = None
+        self.config = {}
+
+    @property
+    def size(self):
+        if self._size is not None:
+            return self._size
+        return self.config.get("agent_pool_size", DEFAULT_POOL_SIZE)
+
+    def _read_config(self):
+        with open(self.config_path) as f:
+            return json.load(f), os.path.getmtime(self.config_path)
+
+    def start(self):
+        """Build (or rebuild) every agent in the pool from the current config."""
+        with self._reload_lock:
+            self._build()
+
+    def _build(self):
+        config, mtime = self._read_config()
+        size = self._size or config.get("agent_pool_size", DEFAULT_POOL_SIZE)
+        agents = queue.Queue()
+        for _ in range(size):
+            agents.put(get_agent(get_agent_tools(), config["agent_llm"]))
+        with self._lock:
+            self.config = config
+            self._agents = agents
+            self._generation += 1
+            self._config_mtime = mtime
+            # Waiters on the old pool would never get an agent from it
+            self._available.notify_all()
+            self._wake_async_waiters()
+        print(f"Agent pool ready with {size} agents (generation {self._generation})")
+
+    def reload(self):
+        self.start()
+
+    def _config_changed(self):
+        try:
+            mtime = os.path.getmtime(self.config_path)
+        except OSError:
+            return False
+        return mtime != self._config_mtime
+
+    def reload_if_changed(self):
+        """
+        Reload hook: rebuild the pool if the config file was modified. Only
+        one caller rebuilds; callers arriving meanwhile return at once and
+        keep using the current agents.
+        """
+        if not self._config_changed():
+            return False
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        try:
+            # Another request may have rebuilt the pool in the meantime.
+            if not self._config_changed():
+                return False
+            self._build()
+            return True
+        finally:
+            self._reload_lock.release()
+
+    def _wake_async_waiters(self):
+        """Called with `_lock` held."""
+        for loop, waiter in self._async_waiters:
+            loop.call_soon_threadsafe(_wake, waiter)
+        self._async_waiters.clear()
+
+    def _checkin(self, agent, agents, generation):
+        with self._lock:
+            if generation != self._generation:
+                return
+            agents.put(agent)
+            self._available.notify()
+            self._wake_async_waiters()
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        """
+        Borrow an agent for the duration of a `with` block.
+
+        Raises:
+            TimeoutError: If no agent becomes free within `timeout` seconds.
+        """
+        self.reload_if_changed()
+        if timeout is None:
+            timeout = self.config.get("agent_pool_timeout", DEFAULT_CHECKOUT_TIMEOUT)
+
+        deadline = time.monotonic() + timeout
+        with self._available:
+            while True:
+                # Re-read after every wakeup, the pool may have been rebuilt
+                agents, generation = self._agents, self._generation
+                try:
+                    agent = agents.get_nowait()
+                    break
+                except queue.Empty:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(
+                            f"No agent became available within {timeout} seconds"
+                        )
+                    self._available.wait(remaining)
+
+        try:
+            yield agent
+        finally:
+            self._checkin(agent, agents, generation)
+
+    @asynccontextmanager
+    async def acheckout(self, timeout=None):
+        """
+        Async variant of `checkout()` that waits for a free agent without
+        blocking the event loop. A rebuild runs on a worker thread.
+        """
+        if self._config_changed() and not self._reload_lock.locked():
+            await asyncio.to_thread(self.reload_if_changed)
+        if timeout is None:
+            timeout = self.config.get("agent_pool_timeout", DEFAULT_CHECKOUT_TIMEOUT)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            with self._lock:
+                # Re-read after every wakeup, the pool may have been rebuilt
+                agents, generation = self._agents, self._generation
+                try:
+                    agent = agents.get_nowait()
+                    break
+                except queue.Empty:
+                    waiter = loop.create_future()
+                    self._async_waiters.add((loop, waiter))
+            try:
+                await asyncio.wait_for(waiter, max(deadline - loop.time(), 0))
+            except asyncio.TimeoutError:
+                raise TimeoutError(
+                    f"No agent became available within {timeout} seconds"
+                )
+            finally:
+                with self._lock:
+                    self._async_waiters.discard((loop, waiter))
+
+        try:
+            yield agent
+        finally:
+            self._checkin(agent, agents, generation)
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "available": self._agents.qsize(),
+            "generation": self._generation,
+        }
@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import copy
+import threading
+from collections import Counter, OrderedDict
+from functools import lru_cache
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """
+    Caches generated answers by query embedding, per namespace.
+
+    A query whose embedding has cosine similarity of at least
+    `similarity_threshold` with a cached query in the same namespace gets the
+    cached answer back without running retrieval or synthesis. Entries expire
+    after `ttl_seconds`, and the least recently used ones are dropped once
+    `max_entries` is reached.
+
+    Answers are cached apart per `scope`, which names whatever else they
+    depend on (the engine and metadata filters), and are invalidated with
+    their namespace.
+
+    Invalidation is recorded in a small stamp file per namespace, so an upload
+    indexed by one process (e.g. Streamlit) also clears the cache of every other
+    process (e.g. the API workers) on their next lookup.
+    """
+
+    def __init__(
+        self,
+        similarity_threshold=0.92,
+        ttl_seconds=3600,
+        max_entries=1000,
+        stamp_dir="./cache",
+    ):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.stamp_dir = stamp_dir
+        self._entries = OrderedDict()
+        # (namespace, scope) -> (keys, rows), rows possibly with spare capacity
+        self._matrices = {}
+        self._live = Counter()
+        self._stamps = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _stamp_path(self, namespace):
+        return os.path.join(
+            self.stamp_dir, f"answer_cache.{namespace or 'default'}.stamp"
+        )
+
+    def _read_stamp(self, namespace):
+        try:
+            return os.stat(self._stamp_path(namespace)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _drop_namespace(self, namespace):
+        for key in [k for k, e in self._entries.items() if e["namespace"] == namespace]:
+            del self._entries[key]
+        for key in [k for k in self._matrices if k[0] == namespace]:
+            del self._matrices[key]
+        for key in [k for k in self._live if k[0] == namespace]:
+            del self._live[key]
+
+    def _delete(self, key):
+        entry = self._entries.pop(key)
+        self._live[entry["namespace"], entry["scope"]] -= 1
+
+    def _sync_stamp(self, namespace):
+        stamp = self._read_stamp(namespace)
+        if self._stamps.get(namespace) != stamp:
+            self._drop_namespace(namespace)
+            self._stamps[namespace] = stamp
+
+    def _matrix(self, namespace, scope):
+        if (namespace, scope) not in self._matrices:
+            keys = [
+                k
+                for k, e in self._entries.items()
+                if e["namespace"] == namespace and e["scope"] == scope
+            ]
+            vectors = (
+                np.stack([self._entries[k]["vector"] for k in keys])
+                if keys
+                else np.empty((0, 0), dtype=np.float32)
+            )
+            self._matrices[namespace, scope] = (keys, vectors)
+        keys, rows = self._matrices[namespace, scope]
+        return keys, rows[: len(keys)]
+
+    def _append_row(self, scope_key, key, vector):
+        """
+        Adds a new entry to its scope's matrix, if built, instead of
+        rebuilding it. Rows of removed entries stay until they outnumber the
+        live ones; lookups skip them.
+        """
+        cached = self._matrices.get(scope_key)
+        if cached is None:
+            return
+        keys, rows = cached
+        if len(keys) > 2 * self._live[scope_key]:
+            del self._matrices[scope_key]
+            return
+        if len(keys) == len(rows):
+            grown = np.empty((max(2 * len(keys), 16), len(vector)), dtype=np.float32)
+            if keys:
+                grown[: len(keys)] = rows
+            rows = grown
+            self._matrices[scope_key] = (keys, rows)
+        rows[len(keys)] = vector
+        keys.append(key)
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, namespace, embedding, scope=""):
+        """
+        Returns a copy of the cached `(response, is_valid, extra_info)` for the
+        closest cached query above the similarity threshold, or None.
+        """
+        vector = self._normalize(embedding)
+        now = time.time()
+        with self._lock:
+            self._sync_stamp(namespace)
+            keys, matrix = self._matrix(namespace, scope)
+            if not keys:
+                self.misses += 1
+                return None
+            scores = matrix @ vector
+            for i in np.argsort(-scores):
+                if scores[i] < self.similarity_threshold:
+                    break
+                entry = self._entries.get(keys[i])
+                if entry is None:
+                    continue
+                if now - entry["created_at"] > self.ttl_seconds:
+                    continue
+                self._entries.move_to_end(keys[i])
+                self.hits += 1
+                response, is_valid, extra_info = copy.deepcopy(entry["result"])
+                extra_info["cache_hit"] = True
+                extra_info["cached_query_str"] = entry["query_str"]
+                extra_info["cache_similarity"] = float(scores[i])
+                return response, is_valid, extra_info
+            self.misses += 1
+            return None
+
+    def current_stamp(self, namespace):
+        """Invalidation stamp to pass to `store()` for answers computed from now on."""
+        return self._read_stamp(namespace) or 0
+
+    def store(self, namespace, query_str, embedding, result, stamp=None, scope=""):
+        """
+        Caches `result`. If `stamp` is given and the namespace was invalidated
+        since it was read, the (possibly stale) result is discarded.
+        """
+        now = time.time()
+        with self._lock:
+            self._sync_stamp(namespace)
+            if stamp is not None and stamp != (self._stamps.get(namespace) or 0):
+                return
+            key = self._next_id
+            self._next_id += 1
+            vector = self._normalize(embedding)
+            self._entries[key] = {
+                "namespace": namespace,
+                "scope": scope,
+                "query_str": query_str,
+                "vector": vector,
+                "result": copy.deepcopy(result),
+                "created_at": now,
+            }
+            self._live[namespace, scope] += 1
+            self._expire(now)
+            while len(self._entries) > self.max_entries:
+                self._delete(next(iter(self._entries)))
+            self._append_row((namespace, scope), key, vector)
+
+    def _expire(self, now):
+        expired = [
+            k
+            for k, e in self._entries.items()
+            if now - e["created_at"] > self.ttl_seconds
+        ]
+        for key in expired:
+            self._delete(key)
+
+    def invalidate(self, namespace):
+        """Drops every cached answer for `namespace`, in this and other processes."""
+        os.makedirs(self.stamp_dir, exist_ok=True)
+        path = self._stamp_path(namespace)
+        with open(path, "w") as f:
+            f.write(str(time.time_ns()))
+        with self._lock:
+            self._drop_namespace(namespace)
+            self._stamps[namespace] = self._read_stamp(namespace)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+@lru_cache
+def get_answer_cache():
+    """
+    Returns the process-wide answer cache, or None when `answer_cache.enabled`
+    is off in the config.
+    """
+    ncert_search = json.load(open("./config/ncert_search.json"))
+    cache_config = ncert_search.get("answer_cache", {})
+    if not cache_config.get("enabled", False):
+        return None
+    return SemanticAnswerCache(
+        similarity_threshold=cache_config.get("similarity_threshold", 0.92),
+        ttl_seconds=cache_config.get("ttl_seconds", 3600),
+        max_entries=cache_config.get("max_entries", 1000),
+        stamp_dir=cache_config.get("stamp_dir", "./cache"),
+    )
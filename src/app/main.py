@@ -1,20 +1,58 @@
 import os
 import sys
-from fastapi import FastAPI, HTTPException
+import json
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, File, Header, HTTPException, Response, UploadFile
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
 import uvicorn
 
-import json
-from langchain.agents import Tool
-from src.agent import VectorDBTool, get_agent, InappropriateContentDetector
-
 # from dotenv import load_dotenv
 
 # load_dotenv()
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-app = FastAPI()
+from agent import use_retrieval_filters
+from agent_pool import AgentPool
+from embedding_cache import normalize_query
+from ingestion_jobs import DEFAULT_TENANT, UploadTooLarge, get_ingestion_queue
+from metadata_filters import filters_key, tenant_scoped_filters
+from metrics import render_prometheus
+from single_flight import get_single_flight
+from tracing import trace
+from moderation import (
+    BLOCKED_QUERY_REPLY,
+    VERDICT_ALLOW,
+    VERDICT_BLOCK,
+    get_moderator,
+)
+from query_router import ROUTE_RETRIEVAL, ROUTE_TEMPLATE, get_query_router
+
+agent_pool = AgentPool()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the agents once per process instead of once per request
+    agent_pool.start()
+    ncert_search = json.load(open("./config/ncert_search.json"))
+    if ncert_search.get("warm_up_on_startup", True):
+        from retrieval import warm_up
+
+        # Connect to the index before serving instead of on the first request
+        await asyncio.to_thread(warm_up)
+    run_ingestion = ncert_search.get("ingestion_queue", {}).get("enabled", True)
+    if run_ingestion:
+        get_ingestion_queue().start()
+    yield
+    if run_ingestion:
+        await asyncio.to_thread(get_ingestion_queue().stop, 30)
+
+
+app = FastAPI(lifespan=lifespan)
 
 qa_system_prompt = """
 You are an expert educational system trusted for providing accurate explanations based on NCERT concepts.
@@ -46,13 +84,30 @@ def get_service_config():
 
 class QueryRequest(BaseModel):
     query: str = "what is sound propagation?"
+    # Only search documents matching these, see `build_metadata_filters`
+    filters: Optional[Dict[str, Any]] = None
+
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    filters: Optional[Dict[str, Any]] = None
+
+
+def parse_filters(filters, tenant):
+    """
+    The request's filters, scoped to what the `X-Tenant-Id` tenant may
+    search, as `/documents` scopes uploads and jobs.
+    """
+    try:
+        return tenant_scoped_filters(filters, tenant)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 def get_retrieval():
-    from retrieval import SimpleRetrieverGeneration
+    from retrieval import get_retrieval_engine
 
-    ncert_retriever_generation = SimpleRetrieverGeneration()
-    return ncert_retriever_generation
+    return get_retrieval_engine()
 
 
 @app.get("/")
@@ -76,35 +131,228 @@ async def home():
 #         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def answer_query(query_str, filters=None):
+    """
+    Blocks clearly inappropriate queries, then answers small talk from
+    templates and plain knowledge questions straight from the retrieval
+    engine, as decided by the query router. Everything else, and questions
+    the knowledge base has no answer for, go to the agent.
+
+    `filters` restricts the knowledge base search, by the engine or by the
+    agent's VectorDBTool, to matching documents.
+    """
+    moderator = get_moderator()
+    verdict = moderator.moderate(query_str).verdict if moderator else VERDICT_ALLOW
+    if verdict == VERDICT_BLOCK:
+        return BLOCKED_QUERY_REPLY
+    router = get_query_router()
+    # Borderline queries go to the agent, whose moderation tool asks the LLM
+    if router is not None and verdict == VERDICT_ALLOW:
+        decision = await router.aroute(query_str)
+        if decision.route == ROUTE_TEMPLATE:
+            return decision.reply
+        if decision.route == ROUTE_RETRIEVAL:
+            answer, is_valid, _ = await get_retrieval().aget_query_response(
+                query_str, filters
+            )
+            if is_valid:
+                return answer
+            print("No answer in the knowledge base, falling back to the agent")
+    async with agent_pool.acheckout() as agent:
+        # response = agent.invoke(qa_system_prompt.format(query_str=query_str))
+        with use_retrieval_filters(filters):
+            result = await agent.ainvoke(query_str)
+    return result["output"]
+
+
+def default_namespace():
+    return json.load(open("./config/ncert_search.json"))["namespace"]
+
+
+def debug_trace_enabled():
+    ncert_search = json.load(open("./config/ncert_search.json"))
+    return ncert_search.get("tracing", {}).get("debug_header", False)
+
+
 @app.post("/agent")
-def query_with_agent(request: QueryRequest):
+async def query_with_agent(
+    request: QueryRequest,
+    response: Response,
+    x_debug_trace: Optional[str] = Header(default=None),
+    x_tenant_id: str = Header(default=DEFAULT_TENANT),
+):
+    """
+    Answers with the agent. With `tracing.debug_header` enabled, sending an
+    `X-Debug-Trace` header returns the request's per-stage timings, LLM calls,
+    tokens and cache results as JSON in the `X-Trace` response header.
+    """
+    filters = parse_filters(request.filters, x_tenant_id)
     try:
         query_str = request.query
-        ncert_search = json.load(open("./config/ncert_search.json"))
-        tools = [
-            Tool(
-                name="VectorDBTool",
-                func=VectorDBTool().run,
-                description="Use this tool to query the VectorDB for complex information.",
-            ),
-            Tool(
-                name="InappropriateContentDetector",
-                func=InappropriateContentDetector().run,
-                description="Detects inappropriate language in user queries and warns the user.",
-            ),
-            # Tool(name="VulnerabilityTool", func=VulnerabilityTool().run,
-            #      description="Dynamically detects vulnerability-related queries and responds with explanations and mitigation strategies."),
-        ]
-
-        model_name = ncert_search["agent_llm"]
-        agent = get_agent(tools, model_name)
-        # response = agent.invoke(qa_system_prompt.format(query_str=query_str))
-        response = agent.invoke(query_str)
-        return {"response": response["output"]}
+        with trace("agent") as request_trace:
+            single_flight = get_single_flight("agent")
+            if single_flight is None:
+                answer = await answer_query(query_str, filters)
+            else:
+                # Identical questions asked together share one agent run
+                answer = await single_flight.ado(
+                    (
+                        default_namespace(),
+                        filters_key(filters),
+                        normalize_query(query_str),
+                    ),
+                    answer_query,
+                    query_str,
+                    filters,
+                )
+        if x_debug_trace and debug_trace_enabled():
+            response.headers["X-Trace"] = json.dumps(request_trace.summary())
+        return {"response": answer}
 
+    except TimeoutError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/query/batch")
+async def query_batch(
+    request: BatchQueryRequest, x_tenant_id: str = Header(default=DEFAULT_TENANT)
+):
+    """
+    Answers many questions from the knowledge base in one request, without
+    the agent. Results come back in the order of `queries`, each with the
+    answer and sources, or with the error that query hit.
+    """
+    max_queries = (
+        json.load(open("./config/ncert_search.json"))
+        .get("batch", {})
+        .get("max_queries", 256)
+    )
+    if len(request.queries) > max_queries:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {max_queries} queries are allowed per batch",
+        )
+    filters = parse_filters(request.filters, x_tenant_id)
+    with trace("query_batch"):
+        results = await get_retrieval().aget_query_responses(
+            request.queries, filters=filters
+        )
+    items = []
+    for query_str, result in zip(request.queries, results):
+        # gather() also returns CancelledError, which is not an Exception
+        if isinstance(result, BaseException):
+            items.append(
+                {"query": query_str, "error": str(result) or type(result).__name__}
+            )
+            continue
+        answer, is_valid, extra_info = result
+        items.append(
+            {
+                "query": query_str,
+                "response": answer,
+                "is_valid": is_valid,
+                "sources": extra_info.get("sources", []),
+            }
+        )
+    return {"results": items}
+
+
+@app.post("/documents", status_code=202)
+async def upload_document(
+    file: UploadFile = File(...),
+    x_tenant_id: str = Header(default=DEFAULT_TENANT),
+):
+    """
+    Stores an uploaded PDF or text file and queues it for indexing. Returns
+    the job at once; poll `/documents/jobs/{job_id}` for its progress.
+    """
+    ingestion_queue = get_ingestion_queue()
+    try:
+        # Copied in a thread, so a large upload never holds up the event loop
+        job = await asyncio.to_thread(
+            ingestion_queue.submit, file.file, file.filename, x_tenant_id
+        )
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        await file.close()
+    return {"job_id": job["id"], "status": job["status"]}
+
+
+@app.get("/documents/jobs")
+async def list_ingestion_jobs(
+    status: Optional[str] = None,
+    limit: int = 100,
+    x_tenant_id: str = Header(default=DEFAULT_TENANT),
+):
+    """The tenant's ingestion jobs, newest first, with queue-wide counts."""
+    store = get_ingestion_queue().store
+    jobs = await asyncio.to_thread(store.list, x_tenant_id, status, limit)
+    return {"jobs": jobs, "counts": await asyncio.to_thread(store.counts)}
+
+
+@app.get("/documents/jobs/{job_id}")
+async def get_ingestion_job(
+    job_id: str, x_tenant_id: str = Header(default=DEFAULT_TENANT)
+):
+    """Status and progress of one ingestion job."""
+    job = await asyncio.to_thread(get_ingestion_queue().store.get, job_id)
+    if job is None or job["tenant"] != x_tenant_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/agent/stream")
+async def stream_with_agent(
+    request: QueryRequest, x_tenant_id: str = Header(default=DEFAULT_TENANT)
+):
+    """
+    Streams the knowledge-base answer as Server-Sent Events: one `token` event
+    per generated chunk, then a `done` event carrying sources and
+    time-to-first-token, or an `error` event.
+    """
+    filters = parse_filters(request.filters, x_tenant_id)
+    retriever = get_retrieval()
+
+    async def event_stream():
+        with trace("agent_stream"):
+            try:
+                token_gen, extra_info = await retriever.astream_query_response(
+                    request.query, filters
+                )
+                async for token in token_gen:
+                    yield sse_event("token", {"token": token})
+                yield sse_event(
+                    "done",
+                    {
+                        "sources": extra_info["sources"],
+                        "time_to_first_token": extra_info.get("time_to_first_token"),
+                    },
+                )
+            except Exception as e:
+                yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return render_prometheus()
+
+
+@app.post("/agent/reload")
+def reload_agents():
+    agent_pool.reload()
+    return {"response": agent_pool.stats()}
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
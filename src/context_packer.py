@@ -0,0 +1,175 @@
+from typing import Dict, List, Optional
+
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from llama_index.core.settings import Settings
+
+from tracing import record_context_tokens
+
+# Shortest suffix/prefix match treated as chunk overlap rather than chance
+MIN_OVERLAP_CHARS = 20
+# A node cut to fit the budget must keep at least this many tokens
+MIN_TRUNCATED_TOKENS = 64
+
+
+def overlap_length(a, b, min_chars=MIN_OVERLAP_CHARS):
+    """Length of the longest suffix of `a` that is a prefix of `b`, or 0."""
+    if len(a) < min_chars or len(b) < min_chars:
+        return 0
+    probe = b[:min_chars]
+    i = a.find(probe, max(0, len(a) - len(b)))
+    while i != -1:
+        if b.startswith(a[i:]):
+            return len(a) - i
+        i = a.find(probe, i + 1)
+    return 0
+
+
+def merge_texts(texts):
+    """
+    Merges chunk texts from one source. Chunks contained in another are
+    dropped, and chunks whose ends overlap are joined without repeating the
+    overlap. Returns the list of remaining, non-overlapping pieces.
+    """
+    pieces = []
+    for text in texts:
+        text = text.strip()
+        for i, piece in enumerate(pieces):
+            if text in piece:
+                break
+            if piece in text:
+                pieces[i] = text
+                break
+            k = overlap_length(piece, text)
+            if k:
+                pieces[i] = piece + text[k:]
+                break
+            k = overlap_length(text, piece)
+            if k:
+                pieces[i] = text + piece[k:]
+                break
+        else:
+            pieces.append(text)
+            continue
+        # A grown piece may now bridge to another piece
+        pieces = merge_texts(pieces) if len(pieces) > 1 else pieces
+    return pieces
+
+
+class ContextPacker(BaseNodePostprocessor):
+    """
+    Packs the retrieved chunks into as little prompt as possible:
+
+    - chunks with the same source and LLM metadata (file and page) are merged
+      into one node, so the metadata header is sent once per source
+    - text repeated because of `chunk_overlap`, and chunks retrieved twice,
+      are dropped
+    - the merged nodes, best first, are fitted into `token_budget` tokens,
+      metadata included, cutting the last node that fits only in part
+
+    Tokens before and after packing are recorded as metrics, and in the
+    request's trace.
+    """
+
+    token_budget: int = Field(default=6000, gt=0)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ContextPacker"
+
+    def _count(self, text):
+        return len(Settings.tokenizer(text))
+
+    def _llm_text(self, node):
+        return node.get_content(metadata_mode=MetadataMode.LLM)
+
+    def _group(self, nodes):
+        groups: Dict[tuple, List[NodeWithScore]] = {}
+        for node in nodes:
+            metadata = node.node.metadata
+            key = (
+                metadata.get("file_path") or metadata.get("file_name"),
+                node.node.get_metadata_str(mode=MetadataMode.LLM),
+            )
+            groups.setdefault(key, []).append(node)
+        return list(groups.values())
+
+    def _merge(self, group):
+        if len(group) == 1:
+            return group[0]
+        ordered = group
+        if all(n.node.start_char_idx is not None for n in group):
+            ordered = sorted(group, key=lambda n: n.node.start_char_idx)
+        best = max(group, key=lambda n: n.score or 0.0)
+        merged = best.node.model_copy()
+        merged.set_content(
+            "\n\n".join(merge_texts([n.node.get_content() for n in ordered]))
+        )
+        return NodeWithScore(node=merged, score=best.score)
+
+    def _truncate(self, node, max_tokens):
+        """Cuts `node`'s text at a word boundary so it fits in `max_tokens`."""
+        text = node.node.get_content()
+        header_tokens = self._count(self._llm_text(node.node)) - self._count(text)
+        budget = max_tokens - header_tokens
+        if budget < MIN_TRUNCATED_TOKENS:
+            return None
+        tokens = self._count(text)
+        while tokens > budget:
+            text = text[: int(len(text) * budget / tokens * 0.95)]
+            text = text.rsplit(" ", 1)[0]
+            tokens = self._count(text)
+        truncated = node.node.model_copy()
+        truncated.set_content(text)
+        return NodeWithScore(node=truncated, score=node.score)
+
+    def _postprocess_nodes(
+        self, nodes: List[NodeWithScore], query_bundle: Optional[QueryBundle]
+    ) -> List[NodeWithScore]:
+        if not nodes:
+            return nodes
+        # Tokenizing dominates the cost, so count each node once
+        node_tokens = {id(n.node): self._count(self._llm_text(n.node)) for n in nodes}
+        tokens_in = sum(node_tokens.values())
+        merged = sorted(
+            (self._merge(group) for group in self._group(nodes)),
+            key=lambda n: n.score or 0.0,
+            reverse=True,
+        )
+
+        packed, used = [], 0
+        for node in merged:
+            tokens = node_tokens.get(id(node.node))
+            if tokens is None:
+                tokens = self._count(self._llm_text(node.node))
+            if used + tokens > self.token_budget:
+                node = self._truncate(node, self.token_budget - used)
+                if node is not None:
+                    packed.append(node)
+                    used += self._count(self._llm_text(node.node))
+                break
+            packed.append(node)
+            used += tokens
+        if not packed:
+            # Never leave the synthesizer empty-handed
+            packed = [self._truncate(merged[0], self.token_budget) or merged[0]]
+            used = self._count(self._llm_text(packed[0].node))
+
+        record_context_tokens(tokens_in, used)
+        return packed
+
+
+def get_context_packer(ncert_search, response_mode):
+    """
+    Builds the context packer for `response_mode`, or returns None if
+    `context_packing` is disabled. `token_budget` maps response modes to
+    budgets, with `default` used for the rest.
+    """
+    packing_config = ncert_search.get("context_packing", {})
+    if not packing_config.get("enabled", False):
+        return None
+    budgets = packing_config.get("token_budget", {})
+    return ContextPacker(
+        token_budget=budgets.get(response_mode, budgets.get("default", 6000))
+    )
@@ -1,8 +1,18 @@
+import os
 import json
+import time
 from llama_index.core.node_parser import SimpleNodeParser
 from llama_index.core import SimpleDirectoryReader
 from service_config import ServiceConfig
+from answer_cache import get_answer_cache
+from hybrid_retriever import get_bm25_index, get_hybrid_config
+from ingestion import IngestionPipeline
+from index_manifest import IndexManifest, chunk_hashes, chunk_node_id
+from metadata_filters import DEFAULT_TENANT, TENANT_KEY, UPLOADED_AT_KEY
+from node_store import get_node_store
+from tracing import span
 from datetime import datetime
+from functools import lru_cache
 
 
 class DocumentManager:
@@ -14,6 +24,12 @@ class DocumentManager:
         service_config = ServiceConfig()
         self.index = service_config.system_indexer
         self.ncert_search = json.load(open("./config/ncert_search.json"))
+        self.manifest = IndexManifest(
+            os.path.join(
+                self.ncert_search.get("index_manifest_path", "./storage/manifests"),
+                f"{self.ncert_search['index_name']}.{self.ncert_search['namespace']}.json",
+            )
+        )
 
     def prepare_pdf(self, files):
         documents = SimpleDirectoryReader(input_files=files).load_data()
@@ -27,19 +43,164 @@ class DocumentManager:
             chunk_overlap=self.ncert_search["chunk_overlap"],
         )
         nodes = parser.get_nodes_from_documents(documents)
+        return self.add_node_metadata(nodes)
 
+    def add_node_metadata(self, nodes, tenant=DEFAULT_TENANT, uploaded_at=None):
         # Add proper metadata to each node
         current_time = datetime.now().isoformat()
+        uploaded_at = uploaded_at or time.time()
         for node in nodes:
             if hasattr(node, "metadata"):
                 node.metadata["last_accessed_date"] = current_time
+                # Filter fields only, kept out of the embedded and LLM text
+                node.metadata[TENANT_KEY] = tenant
+                node.metadata[UPLOADED_AT_KEY] = uploaded_at
+                for keys in (
+                    node.excluded_embed_metadata_keys,
+                    node.excluded_llm_metadata_keys,
+                ):
+                    keys.extend(
+                        key for key in (TENANT_KEY, UPLOADED_AT_KEY) if key not in keys
+                    )
 
         return nodes
 
-    def index_doc_from_files(self, files):
-        nodes = self.load_nodes(files)
-        self.index.insert_nodes(nodes)
-        return len(nodes)
+    def get_bm25_index(self):
+        namespace = self.ncert_search["namespace"]
+        if get_hybrid_config(namespace) is None:
+            return None
+        return get_bm25_index(namespace)
+
+    def delete_nodes(self, node_ids, bm25_index=None):
+        if not node_ids:
+            return
+        self.index.vector_store.delete_nodes(node_ids)
+        node_store = get_node_store(self.ncert_search["namespace"])
+        if node_store is not None:
+            node_store.delete_many(node_ids)
+        if bm25_index is not None:
+            bm25_index.delete(node_ids, persist=False)
+
+    def persist(self, bm25_index=None):
+        from local_vector_store import LocalVectorStore
+
+        vector_store = self.index.vector_store
+        if isinstance(vector_store, LocalVectorStore):
+            # Compacts the rows deleted by re-indexing
+            vector_store.persist()
+        if bm25_index is not None:
+            bm25_index.persist()
+
+    def index_doc_from_files(
+        self, files, progress_callback=None, tenant=DEFAULT_TENANT
+    ):
+        """
+        Incrementally indexes `files` for `tenant` and returns the number of
+        chunks upserted.
+
+        Files whose size and mtime match the manifest are skipped without
+        being read. Changed files are re-chunked, and only chunks whose
+        content hash is new are embedded and upserted. Vectors of chunks that
+        no longer appear in a file are deleted.
+
+        New chunks get `tenant` and `uploaded_at` metadata for filtering;
+        chunks unchanged since an earlier upload keep theirs.
+        """
+        namespace = self.ncert_search["namespace"]
+        changed_files = [path for path in files if not self.manifest.is_unchanged(path)]
+        if not changed_files:
+            self.manifest.save()
+            return 0
+
+        bm25_index = self.get_bm25_index()
+        file_chunks = {}
+        seen_hashes = {}
+        uploaded_at = time.time()
+
+        def prepare_nodes(nodes, path):
+            # Streaming ingestion calls this once per batch of a file
+            file_key = self.manifest.file_key(path)
+            indexed_chunks = self.manifest.files.get(file_key, {}).get("chunks", {})
+            chunks = file_chunks.setdefault(path, {})
+            new_nodes = []
+            hashes = chunk_hashes(nodes, seen_hashes.setdefault(path, {}))
+            for node, chunk_hash in zip(nodes, hashes):
+                node.id_ = chunk_node_id(file_key, chunk_hash)
+                chunks[chunk_hash] = node.node_id
+                if chunk_hash not in indexed_chunks:
+                    new_nodes.append(node)
+            return self.add_node_metadata(new_nodes, tenant, uploaded_at)
+
+        pipeline = IngestionPipeline.from_config(
+            self.index,
+            self.ncert_search,
+            prepare_nodes=prepare_nodes,
+            on_batch_upserted=(
+                (lambda batch: bm25_index.add(batch, persist=False))
+                if bm25_index is not None
+                else None
+            ),
+            progress_callback=progress_callback,
+        )
+        try:
+            with span("ingest.pipeline"):
+                n_indexed = pipeline.run(changed_files)
+            # Only drop old chunks and commit the manifest once their
+            # replacements are in the index
+            stale_node_ids = [
+                node_id
+                for path, chunks in file_chunks.items()
+                for chunk_hash, node_id in self.manifest.chunks(path).items()
+                if chunk_hash not in chunks
+            ]
+            with span("ingest.delete_stale"):
+                self.delete_nodes(stale_node_ids, bm25_index)
+            for path, chunks in file_chunks.items():
+                self.manifest.record(path, chunks)
+            self.manifest.save()
+            return n_indexed
+        finally:
+            # Runs even after a failure, since some batches may be upserted
+            self.persist(bm25_index)
+            # Cached answers for this namespace may no longer reflect the index
+            answer_cache = get_answer_cache()
+            if answer_cache is not None:
+                answer_cache.invalidate(namespace)
+
+    def remove_files(self, files):
+        """Deletes every chunk indexed for `files` and returns how many."""
+        bm25_index = self.get_bm25_index()
+        node_ids = [node_id for path in files for node_id in self.manifest.forget(path)]
+        self.delete_nodes(node_ids, bm25_index)
+        self.manifest.save()
+        self.persist(bm25_index)
+        answer_cache = get_answer_cache()
+        if answer_cache is not None:
+            answer_cache.invalidate(self.ncert_search["namespace"])
+        return len(node_ids)
+
+    def clear(self):
+        """Forgets everything indexed, after the vector index was rebuilt."""
+        self.manifest.clear()
+        self.manifest.save()
+        bm25_index = self.get_bm25_index()
+        if bm25_index is not None:
+            bm25_index.clear()
+        node_store = get_node_store(self.ncert_search["namespace"])
+        if node_store is not None:
+            node_store.clear()
+        answer_cache = get_answer_cache()
+        if answer_cache is not None:
+            answer_cache.invalidate(self.ncert_search["namespace"])
+
+
+@lru_cache
+def get_document_manager():
+    return DocumentManager()
 
 
-document_manager = DocumentManager()
+def __getattr__(name):
+    # Built on first use so that importing this module stays cheap
+    if name == "document_manager":
+        return get_document_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
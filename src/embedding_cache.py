@@ -0,0 +1,288 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Any, List
+
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+from tracing import record_cache
+
+
+def normalize_query(text):
+    """Collapses whitespace and case so trivially different queries share a key."""
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+class SQLiteEmbeddingStore:
+    """
+    On-disk embedding tier. Vectors are stored as float32 blobs and the least
+    recently used rows are evicted once `max_entries` is exceeded.
+
+    A hit only rewrites `last_used` once it is more than `touch_interval`
+    seconds old, so repeated reads of a hot key don't each commit a write.
+    Eviction order is exact to within that interval.
+    """
+
+    def __init__(self, path, max_entries=200_000, touch_interval=3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings "
+            "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)"
+        )
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[
+            0
+        ]
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT vector, last_used FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if now - row[1] > self.touch_interval:
+                self._conn.execute(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?", (now, key)
+                )
+                self._conn.commit()
+        return array("f", row[0]).tolist()
+
+    def put(self, key, embedding):
+        blob = array("f", embedding).tobytes()
+        with self._lock:
+            inserted = self._conn.execute(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                (key, blob, time.time()),
+            ).rowcount
+            self._count += inserted
+            if self._count > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # Evict a tenth of the store at a time so we don't pay for a delete on
+        # every insert once the store is full.
+        n_evict = self._count - self.max_entries + max(1, self.max_entries // 10)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+            (n_evict,),
+        )
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[
+            0
+        ]
+
+    def __len__(self):
+        return self._count
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Wraps an embed model and caches its query embeddings in an in-memory LRU
+    backed by an on-disk SQLite store.
+
+    Keys are derived from the normalized query text plus the model name and
+    dimension, so changing either never returns a stale vector. Text (document)
+    embeddings are passed straight through to the wrapped model.
+    """
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _dimension: Any = PrivateAttr()
+    _memory: OrderedDict = PrivateAttr()
+    _memory_entries: int = PrivateAttr()
+    _disk: Any = PrivateAttr()
+    _lock: Any = PrivateAttr()
+    _counters: dict = PrivateAttr()
+
+    def __init__(
+        self,
+        embed_model: BaseEmbedding,
+        dimension=None,
+        path="./cache/query_embeddings.sqlite",
+        memory_entries=2048,
+        max_disk_entries=200_000,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            **kwargs,
+        )
+        self._embed_model = embed_model
+        self._dimension = dimension
+        self._memory = OrderedDict()
+        self._memory_entries = memory_entries
+        self._disk = (
+            SQLiteEmbeddingStore(path, max_entries=max_disk_entries) if path else None
+        )
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def embed_model(self):
+        return self._embed_model
+
+    def cache_key(self, query: str) -> str:
+        raw = f"{self.model_name}\x00{self._dimension}\x00{normalize_query(query)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _lookup(self, key):
+        with self._lock:
+            embedding = self._memory.get(key)
+            if embedding is not None:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+        if embedding is not None:
+            record_cache("query_embedding", "memory_hit")
+            return embedding
+        embedding = self._disk.get(key) if self._disk is not None else None
+        with self._lock:
+            self._counters["misses" if embedding is None else "disk_hits"] += 1
+        if embedding is None:
+            record_cache("query_embedding", "miss")
+            return None
+        record_cache("query_embedding", "disk_hit")
+        self._remember(key, embedding)
+        return embedding
+
+    def _remember(self, key, embedding):
+        with self._lock:
+            self._memory[key] = embedding
+            self._memory.move_to_end(key)
+            while len(self._memory) > self._memory_entries:
+                self._memory.popitem(last=False)
+
+    def _store(self, key, embedding):
+        self._remember(key, embedding)
+        if self._disk is not None:
+            self._disk.put(key, embedding)
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        key = self.cache_key(query)
+        embedding = self._lookup(key)
+        if embedding is None:
+            embedding = self._embed_model.get_query_embedding(query)
+            self._store(key, embedding)
+        return embedding
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        key = self.cache_key(query)
+        embedding = self._lookup(key)
+        if embedding is None:
+            embedding = await self._embed_model.aget_query_embedding(query)
+            self._store(key, embedding)
+        return embedding
+
+    def _missing(self, queries):
+        keys = [self.cache_key(query) for query in queries]
+        embeddings = [self._lookup(key) for key in keys]
+        missing = {}
+        for query, key, embedding in zip(queries, keys, embeddings):
+            if embedding is None:
+                missing.setdefault(key, query)
+        return keys, embeddings, missing
+
+    def _fill(self, keys, embeddings, missing, new_embeddings):
+        found = dict(zip(missing, new_embeddings))
+        for key, embedding in found.items():
+            self._store(key, embedding)
+        return [e if e is not None else found[k] for k, e in zip(keys, embeddings)]
+
+    def get_query_embedding_batch(self, queries: List[str]) -> List[Embedding]:
+        """Cached query embeddings, with all misses embedded in one request."""
+        keys, embeddings, missing = self._missing(queries)
+        new_embeddings = (
+            get_query_embedding_batch(self._embed_model, list(missing.values()))
+            if missing
+            else []
+        )
+        return self._fill(keys, embeddings, missing, new_embeddings)
+
+    async def aget_query_embedding_batch(self, queries: List[str]) -> List[Embedding]:
+        keys, embeddings, missing = self._missing(queries)
+        new_embeddings = (
+            await aget_query_embedding_batch(self._embed_model, list(missing.values()))
+            if missing
+            else []
+        )
+        return self._fill(keys, embeddings, missing, new_embeddings)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._embed_model.get_text_embedding(text)
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return await self._embed_model.aget_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return self._embed_model.get_text_embedding_batch(texts)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return await self._embed_model.aget_text_embedding_batch(texts)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            counters["memory_entries"] = len(self._memory)
+        counters["disk_entries"] = len(self._disk) if self._disk is not None else 0
+        lookups = counters["memory_hits"] + counters["disk_hits"] + counters["misses"]
+        counters["hit_rate"] = (
+            (counters["memory_hits"] + counters["disk_hits"]) / lookups
+            if lookups
+            else 0.0
+        )
+        return counters
+
+
+def get_query_embedding_batch(embed_model, queries):
+    """
+    Embeds `queries` in as few requests as the model's batch size allows,
+    instead of one request per query. OpenAI models embed queries and
+    documents the same way, so the text batch endpoint is used.
+    """
+    if isinstance(embed_model, CachedEmbedding):
+        return embed_model.get_query_embedding_batch(queries)
+    return embed_model.get_text_embedding_batch(queries)
+
+
+async def aget_query_embedding_batch(embed_model, queries):
+    if isinstance(embed_model, CachedEmbedding):
+        return await embed_model.aget_query_embedding_batch(queries)
+    return await embed_model.aget_text_embedding_batch(queries)
+
+
+def get_embed_model(embed_model, config):
+    """
+    Wraps `embed_model` in a CachedEmbedding when `embedding_cache.enabled` is
+    set in the config, otherwise returns it unchanged.
+    """
+    cache_config = config.get("embedding_cache", {})
+    if not cache_config.get("enabled", False):
+        return embed_model
+    return CachedEmbedding(
+        embed_model,
+        dimension=config["embedding_dim"],
+        path=cache_config.get("path", "./cache/query_embeddings.sqlite"),
+        memory_entries=cache_config.get("memory_entries", 2048),
+        max_disk_entries=cache_config.get("max_disk_entries", 200_000),
+    )
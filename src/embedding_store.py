@@ -0,0 +1,129 @@
+import os
+import hashlib
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+VECTORS_FILE = "vectors.f32"
+OFFSETS_FILE = "offsets.txt"
+LOCK_FILE = ".lock"
+
+
+class ContentEmbeddingStore:
+    """
+    Content-addressed store for document embeddings, so re-indexing the same
+    chunk text with the same model never calls the embed model twice.
+
+    Vectors are appended to a flat float32 file that is read through a
+    memory map. `offsets.txt` is an append-only index of "<key> <row>" lines.
+    Keys hash the model name, dimension and exact chunk text. Both files
+    only grow, so several processes can share a store, with writers
+    serialized by a lock file.
+    """
+
+    def __init__(self, path, dimension):
+        self.dimension = dimension
+        self.path = os.path.join(path, str(dimension))
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._offsets = {}
+        self._offsets_read = 0
+        self._matrix = None
+        self._load()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def content_key(self, text, model_name):
+        raw = f"{model_name}\x00{self.dimension}\x00{text}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _load(self):
+        """Reads offsets appended since the last call and remaps the vectors."""
+        offsets_path = self._file(OFFSETS_FILE)
+        if not os.path.exists(offsets_path):
+            return
+        if os.path.getsize(offsets_path) == self._offsets_read:
+            return
+        with open(offsets_path, "rb") as f:
+            f.seek(self._offsets_read)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # a writer is half-way through this line
+                key, row = line.split()
+                self._offsets[key.decode()] = int(row)
+                self._offsets_read += len(line)
+        rows = os.path.getsize(self._file(VECTORS_FILE)) // (4 * self.dimension)
+        self._matrix = np.memmap(
+            self._file(VECTORS_FILE),
+            dtype=np.float32,
+            mode="r",
+            shape=(rows, self.dimension),
+        )
+
+    @contextmanager
+    def _write_lock(self):
+        with self._lock:
+            if fcntl is None:
+                self._load()
+                yield
+                return
+            with open(self._file(LOCK_FILE), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._load()
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get_many(self, keys):
+        """Returns the stored embedding for each key, or None where missing."""
+        with self._lock:
+            if any(key not in self._offsets for key in keys):
+                self._load()
+            matrix, offsets = self._matrix, self._offsets
+            return [
+                matrix[offsets[key]].tolist() if key in offsets else None
+                for key in keys
+            ]
+
+    def put_many(self, keys, embeddings):
+        with self._write_lock():
+            new = {}
+            for key, embedding in zip(keys, embeddings):
+                if key not in self._offsets:
+                    new[key] = embedding
+            if not new:
+                return
+            row_bytes = 4 * self.dimension
+            with open(self._file(VECTORS_FILE), "ab") as f:
+                end = f.tell()
+                if end % row_bytes:
+                    # Drop a row left half-written by a crashed writer
+                    f.truncate(end - end % row_bytes)
+                    end -= end % row_bytes
+                f.write(np.asarray(list(new.values()), dtype=np.float32).tobytes())
+            start = end // row_bytes
+            with open(self._file(OFFSETS_FILE), "a") as f:
+                f.write("".join(f"{key} {start + i}\n" for i, key in enumerate(new)))
+            self._load()
+
+
+def get_embedding_store(ncert_search):
+    """
+    Returns the ingestion embedding store, or None when
+    `ingestion.embedding_store_path` is not set.
+    """
+    path = ncert_search.get("ingestion", {}).get("embedding_store_path")
+    if not path:
+        return None
+    return ContentEmbeddingStore(path, ncert_search["embedding_dim"])
@@ -0,0 +1,245 @@
+import json
+import time
+import random
+import asyncio
+import weakref
+import threading
+from functools import lru_cache
+
+import httpx
+
+from metrics import counter
+
+# Responses that mean "try again": throttling, and gateways or servers that
+# failed before doing the work
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+# Errors raised before the request reached the server, or by a pooled
+# keep-alive connection the server had already closed
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+
+DEFAULT_HTTP_CONFIG = {
+    "max_connections": 64,
+    "max_keepalive_connections": 32,
+    "keepalive_expiry": 60.0,
+    "connect_timeout": 5.0,
+    "read_timeout": 60.0,
+    "max_retries": 3,
+    "backoff_base": 0.5,
+    "backoff_max": 8.0,
+}
+
+
+@lru_cache
+def get_http_config():
+    """`http` from the config, on top of DEFAULT_HTTP_CONFIG."""
+    ncert_search = json.load(open("./config/ncert_search.json"))
+    return {**DEFAULT_HTTP_CONFIG, **ncert_search.get("http", {})}
+
+
+def backoff_delay(attempt, base, cap, retry_after=None):
+    """
+    Seconds to wait before retry number `attempt` (0-based): "full jitter"
+    exponential backoff, so clients that failed together do not retry
+    together. A server's Retry-After wins when it is within `cap`.
+    """
+    if retry_after is not None and 0 <= retry_after <= cap:
+        return retry_after
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers["retry-after"])
+    except (KeyError, ValueError):
+        return None
+
+
+def _record_retry(reason):
+    counter(
+        "rag_http_retries_total", "Retried HTTP requests.", labels={"reason": reason}
+    ).inc()
+
+
+class RetryTransport(httpx.BaseTransport):
+    """Retries a request with jittered backoff on RETRY_STATUSES and RETRY_ERRORS."""
+
+    def __init__(self, transport, max_retries=3, backoff_base=0.5, backoff_max=8.0):
+        self._transport = transport
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def handle_request(self, request):
+        for attempt in range(self.max_retries + 1):
+            last = attempt == self.max_retries
+            try:
+                response = self._transport.handle_request(request)
+            except RETRY_ERRORS as e:
+                if last:
+                    raise
+                _record_retry(type(e).__name__)
+                time.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_max))
+                continue
+            if last or response.status_code not in RETRY_STATUSES:
+                return response
+            response.close()
+            _record_retry(str(response.status_code))
+            time.sleep(
+                backoff_delay(
+                    attempt,
+                    self.backoff_base,
+                    self.backoff_max,
+                    _retry_after(response),
+                )
+            )
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncRetryTransport(httpx.AsyncBaseTransport):
+    """
+    Async RetryTransport. Connections belong to the event loop that opened
+    them, so each loop gets its own pool. The server's loop keeps one for
+    its lifetime. The short-lived loops that llama-index starts for
+    `use_async` synthesis get theirs, and it is dropped with the loop.
+    """
+
+    def __init__(
+        self, transport_factory, max_retries=3, backoff_base=0.5, backoff_max=8.0
+    ):
+        self._transport_factory = transport_factory
+        self._transports = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def _transport(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.get(loop)
+            if transport is None:
+                transport = self._transports[loop] = self._transport_factory()
+        return transport
+
+    async def handle_async_request(self, request):
+        transport = self._transport()
+        for attempt in range(self.max_retries + 1):
+            last = attempt == self.max_retries
+            try:
+                response = await transport.handle_async_request(request)
+            except RETRY_ERRORS as e:
+                if last:
+                    raise
+                _record_retry(type(e).__name__)
+                await asyncio.sleep(
+                    backoff_delay(attempt, self.backoff_base, self.backoff_max)
+                )
+                continue
+            if last or response.status_code not in RETRY_STATUSES:
+                return response
+            await response.aclose()
+            _record_retry(str(response.status_code))
+            await asyncio.sleep(
+                backoff_delay(
+                    attempt,
+                    self.backoff_base,
+                    self.backoff_max,
+                    _retry_after(response),
+                )
+            )
+
+    async def aclose(self):
+        try:
+            transport = self._transports.pop(asyncio.get_running_loop(), None)
+        except RuntimeError:
+            transport = None
+        if transport is not None:
+            await transport.aclose()
+
+
+def _limits(config):
+    return httpx.Limits(
+        max_connections=config["max_connections"],
+        max_keepalive_connections=config["max_keepalive_connections"],
+        keepalive_expiry=config["keepalive_expiry"],
+    )
+
+
+def _timeout(config):
+    return httpx.Timeout(config["read_timeout"], connect=config["connect_timeout"])
+
+
+def _retry_kwargs(config):
+    return {
+        "max_retries": config["max_retries"],
+        "backoff_base": config["backoff_base"],
+        "backoff_max": config["backoff_max"],
+    }
+
+
+@lru_cache
+def get_http_client():
+    """
+    The process-wide httpx.Client shared by the OpenAI LLMs and embedding
+    models. Connections are pooled and kept alive, and failed requests are
+    retried with jittered backoff, as set by `http` in the config.
+    """
+    config = get_http_config()
+    return httpx.Client(
+        timeout=_timeout(config),
+        transport=RetryTransport(
+            httpx.HTTPTransport(limits=_limits(config)), **_retry_kwargs(config)
+        ),
+    )
+
+
+@lru_cache
+def get_async_http_client():
+    """The async counterpart of `get_http_client`."""
+    config = get_http_config()
+    return httpx.AsyncClient(
+        timeout=_timeout(config),
+        transport=AsyncRetryTransport(
+            lambda: httpx.AsyncHTTPTransport(limits=_limits(config)),
+            **_retry_kwargs(config),
+        ),
+    )
+
+
+def openai_client_kwargs():
+    """
+    Keyword arguments that make an OpenAI client from llama-index use the
+    shared clients. Retries happen in the shared transport, so the SDK's own
+    are turned off.
+    """
+    return {
+        "http_client": get_http_client(),
+        "async_http_client": get_async_http_client(),
+        "max_retries": 0,
+        "timeout": get_http_config()["read_timeout"],
+    }
+
+
+def configure_pinecone(pc):
+    """
+    Applies the `http` pool size and jittered retries to the urllib3 pool
+    behind Pinecone data-plane clients created from `pc` (the Pinecone client
+    has no pluggable HTTP client, and already turns on TCP keep-alive).
+    """
+    from urllib3.util.retry import Retry
+
+    config = get_http_config()
+    openapi_config = pc.openapi_config
+    openapi_config.connection_pool_maxsize = config["max_connections"]
+    openapi_config.retries = Retry(
+        total=config["max_retries"],
+        backoff_factor=config["backoff_base"],
+        backoff_max=config["backoff_max"],
+        backoff_jitter=config["backoff_base"],
+        status_forcelist=RETRY_STATUSES,
+        # Upserts and queries are POSTs, and both are safe to repeat
+        allowed_methods=None,
+    )
+    return pc
@@ -0,0 +1,460 @@
+import os
+import re
+import gzip
+import math
+import json
+import pickle
+import heapq
+import asyncio
+import threading
+from array import array
+from collections import Counter
+from functools import lru_cache
+from typing import List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+from llama_index.core.vector_stores.types import MetadataFilters
+
+from local_vector_store import indexed_rows_for, match_filters, metadata_index_keys
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from how in is it of on or that the this to was "
+    "what when where which who why with".split()
+)
+# Share of removed docs at which postings and node text are rewritten without them
+COMPACT_DELETED_FRACTION = 0.25
+# Size of the change log, relative to the snapshot, at which `persist` writes
+# a new snapshot instead of appending to the log
+SNAPSHOT_LOG_RATIO = 1.0
+
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Incremental BM25 inverted index over node text.
+
+    Postings are kept as flat `array("I")` buffers of (doc, term frequency)
+    pairs. Node text and metadata are stored alongside so that hits can be
+    returned as regular nodes.
+
+    On disk, the index is a gzipped pickle snapshot plus a `.log` of the
+    nodes added and deleted since, one JSON line each. `persist` only appends
+    the changes made since the last call, and writes a new snapshot once the
+    log outgrows `SNAPSHOT_LOG_RATIO` times the snapshot.
+
+    Removed or replaced nodes are only marked deleted, and their text is
+    dropped. Once they make up `COMPACT_DELETED_FRACTION` of the index, the
+    postings are rewritten without them, so re-uploads don't grow it.
+    """
+
+    def __init__(self, path=None, k1=1.5, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._mtime = None
+        self._log_inode = None
+        self._log_offset = 0
+        # Changes not persisted yet, replayed if the files are reloaded
+        self._pending = []
+        self._needs_snapshot = False
+        self._reset()
+        if path:
+            self._load()
+
+    def _reset(self):
+        self.node_ids = []
+        self.nodes = []
+        self.doc_lens = array("I")
+        self.deleted = set()
+        self.postings = {}
+        self._id_to_doc = {}
+        self._metadata_docs = {}
+        self._total_len = 0
+
+    def __len__(self):
+        return len(self.node_ids) - len(self.deleted)
+
+    @property
+    def log_path(self):
+        return f"{self.path}.log"
+
+    def _load(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        try:
+            log_stat = os.stat(self.log_path)
+        except OSError:
+            log_stat = None
+        log_inode = log_stat.st_ino if log_stat is not None else None
+        # A log that appeared since the snapshot was read only holds newer
+        # changes, while a replaced one means reading everything again
+        reloaded = (
+            mtime != self._mtime
+            or (self._log_inode is not None and log_inode != self._log_inode)
+            or (log_stat is not None and log_stat.st_size < self._log_offset)
+        )
+        if reloaded:
+            self._load_snapshot(mtime)
+            self._log_offset = 0
+        self._log_inode = log_inode
+        if log_stat is not None and log_stat.st_size > self._log_offset:
+            with open(self.log_path, "rb") as f:
+                f.seek(self._log_offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # a writer is half-way through this line
+                    self._apply(json.loads(line))
+                    self._log_offset += len(line)
+        if reloaded:
+            for change in self._pending:
+                self._apply(change)
+            self._maybe_compact()
+
+    def _load_snapshot(self, mtime):
+        self._reset()
+        self._mtime = mtime
+        if mtime is None:
+            return
+        with gzip.open(self.path, "rb") as f:
+            state = pickle.load(f)
+        self.node_ids = state["node_ids"]
+        self.nodes = state["nodes"]
+        self.doc_lens = state["doc_lens"]
+        self.deleted = state["deleted"]
+        self.postings = state["postings"]
+        self._id_to_doc = {
+            node_id: doc
+            for doc, node_id in enumerate(self.node_ids)
+            if doc not in self.deleted
+        }
+        for doc in self._id_to_doc.values():
+            self._index_metadata(doc, alive=True)
+        self._total_len = sum(
+            n for doc, n in enumerate(self.doc_lens) if doc not in self.deleted
+        )
+
+    def persist(self):
+        if not self.path:
+            return
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            if self._needs_snapshot or self._mtime is None:
+                self._write_snapshot()
+                return
+            if not self._pending:
+                return
+            with open(self.log_path, "ab") as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                # Catch up with lines other processes appended, so that the
+                # offset stays at the end of what this one has read
+                self._load()
+                data = b"".join(
+                    (json.dumps(change) + "\n").encode("utf-8")
+                    for change in self._pending
+                )
+                f.write(data)
+                f.flush()
+                self._log_inode = os.fstat(f.fileno()).st_ino
+                self._log_offset += len(data)
+            self._pending = []
+            if self._log_offset > SNAPSHOT_LOG_RATIO * os.path.getsize(self.path):
+                self._write_snapshot()
+
+    def _write_snapshot(self):
+        tmp_path = f"{self.path}.tmp"
+        with gzip.open(tmp_path, "wb") as f:
+            pickle.dump(
+                {
+                    "node_ids": self.node_ids,
+                    "nodes": self.nodes,
+                    "doc_lens": self.doc_lens,
+                    "deleted": self.deleted,
+                    "postings": self.postings,
+                },
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(tmp_path, self.path)
+        # The snapshot has everything in the log
+        try:
+            os.remove(self.log_path)
+        except FileNotFoundError:
+            pass
+        self._mtime = os.path.getmtime(self.path)
+        self._log_inode = None
+        self._log_offset = 0
+        self._pending = []
+        self._needs_snapshot = False
+
+    def _apply(self, change):
+        if "delete" in change:
+            self._remove(change["delete"])
+            return
+        node_id = change["add"]
+        self._remove(node_id)
+        doc = len(self.node_ids)
+        tokens = tokenize(change["text"])
+        for term, tf in Counter(tokens).items():
+            self.postings.setdefault(term, array("I")).extend((doc, tf))
+        self.node_ids.append(node_id)
+        self.nodes.append({"text": change["text"], "metadata": change["metadata"]})
+        self.doc_lens.append(len(tokens))
+        self._id_to_doc[node_id] = doc
+        self._index_metadata(doc, alive=True)
+        self._total_len += len(tokens)
+
+    def _index_metadata(self, doc, alive):
+        for index_key in metadata_index_keys(self.nodes[doc]["metadata"]):
+            docs = self._metadata_docs.setdefault(index_key, set())
+            if alive:
+                docs.add(doc)
+            else:
+                docs.discard(doc)
+
+    def add(self, nodes, persist=True):
+        """Adds (or replaces) nodes in the index."""
+        with self._lock:
+            if self.path:
+                self._load()
+            for node in nodes:
+                change = {
+                    "add": node.node_id,
+                    "text": node.get_content(),
+                    "metadata": node.metadata,
+                }
+                self._apply(change)
+                if self.path:
+                    self._pending.append(change)
+            self._maybe_compact()
+            if persist:
+                self.persist()
+
+    def _remove(self, node_id):
+        doc = self._id_to_doc.pop(node_id, None)
+        if doc is not None:
+            self._index_metadata(doc, alive=False)
+            self.deleted.add(doc)
+            self.nodes[doc] = None
+            self._total_len -= self.doc_lens[doc]
+
+    def _maybe_compact(self):
+        if len(self.deleted) <= COMPACT_DELETED_FRACTION * len(self.node_ids):
+            return
+        new_doc = {}
+        for doc in range(len(self.node_ids)):
+            if doc not in self.deleted:
+                new_doc[doc] = len(new_doc)
+        postings = {}
+        for term, old_postings in self.postings.items():
+            kept = array("I")
+            for i in range(0, len(old_postings), 2):
+                doc = old_postings[i]
+                if doc not in self.deleted:
+                    kept.extend((new_doc[doc], old_postings[i + 1]))
+            if kept:
+                postings[term] = kept
+        self.node_ids = [self.node_ids[doc] for doc in new_doc]
+        self.nodes = [self.nodes[doc] for doc in new_doc]
+        self.doc_lens = array("I", (self.doc_lens[doc] for doc in new_doc))
+        self.postings = postings
+        self.deleted = set()
+        self._id_to_doc = {node_id: doc for doc, node_id in enumerate(self.node_ids)}
+        self._metadata_docs = {}
+        for doc in range(len(self.node_ids)):
+            self._index_metadata(doc, alive=True)
+
+    def delete(self, node_ids, persist=True):
+        with self._lock:
+            if self.path:
+                self._load()
+            for node_id in node_ids:
+                self._remove(node_id)
+                if self.path:
+                    self._pending.append({"delete": node_id})
+            self._maybe_compact()
+            if persist:
+                self.persist()
+
+    def clear(self, persist=True):
+        with self._lock:
+            self._reset()
+            self._pending = []
+            self._needs_snapshot = True
+            if persist:
+                self.persist()
+
+    def search(self, query_str, top_k=10, filters=None):
+        """
+        Returns the `top_k` (node, score) pairs for `query_str`, among the
+        nodes whose metadata matches `filters` if given.
+
+        Filters are checked before scoring: EQ/IN/IS_EMPTY filters on
+        `INDEXED_METADATA_KEYS` pick the candidate docs from an index, and
+        only candidates that match the remaining filters are scored.
+        """
+        with self._lock:
+            if self.path:
+                self._load()
+            n_docs = len(self)
+            if n_docs == 0:
+                return []
+            avg_len = self._total_len / n_docs
+            candidates = matched = None
+            if filters is not None:
+                candidates = indexed_rows_for(self._metadata_docs, filters)
+                if candidates is not None and not candidates:
+                    return []
+                matched = {}
+
+            def admits(doc):
+                if matched is None:
+                    return True
+                if candidates is not None and doc not in candidates:
+                    return False
+                if doc not in matched:
+                    matched[doc] = match_filters(self.nodes[doc]["metadata"], filters)
+                return matched[doc]
+
+            scores = {}
+            for term in set(tokenize(query_str)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                # Every live doc counts towards the document frequency, but
+                # only admitted ones are scored
+                df = 0
+                scored = []
+                for i in range(0, len(postings), 2):
+                    doc = postings[i]
+                    if doc in self.deleted:
+                        continue
+                    df += 1
+                    if admits(doc):
+                        scored.append((doc, postings[i + 1]))
+                if not scored:
+                    continue
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                for doc, tf in scored:
+                    norm = self.k1 * (
+                        1 - self.b + self.b * self.doc_lens[doc] / avg_len
+                    )
+                    scores[doc] = scores.get(doc, 0.0) + idf * tf * (self.k1 + 1) / (
+                        tf + norm
+                    )
+            top = heapq.nlargest(top_k, scores.items(), key=lambda x: x[1])
+            return [
+                (
+                    TextNode(
+                        id_=self.node_ids[doc],
+                        text=self.nodes[doc]["text"],
+                        metadata=self.nodes[doc]["metadata"],
+                    ),
+                    score,
+                )
+                for doc, score in top
+            ]
+
+
+class BM25Retriever(BaseRetriever):
+    def __init__(
+        self,
+        bm25_index: BM25Index,
+        similarity_top_k=10,
+        filters: Optional[MetadataFilters] = None,
+        **kwargs,
+    ):
+        self.bm25_index = bm25_index
+        self.similarity_top_k = similarity_top_k
+        self.filters = filters
+        super().__init__(**kwargs)
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return [
+            NodeWithScore(node=node, score=score)
+            for node, score in self.bm25_index.search(
+                query_bundle.query_str, self.similarity_top_k, filters=self.filters
+            )
+        ]
+
+
+def reciprocal_rank_fusion(result_lists, k=60, top_k=None):
+    """
+    Fuses ranked lists of NodeWithScore with reciprocal-rank fusion,
+    score(d) = sum over lists of 1 / (k + rank(d)).
+    """
+    fused, nodes = {}, {}
+    for results in result_lists:
+        for rank, node_with_score in enumerate(results, start=1):
+            node_id = node_with_score.node.node_id
+            fused[node_id] = fused.get(node_id, 0.0) + 1.0 / (k + rank)
+            # Prefer the dense copy of a node, it carries the full metadata
+            nodes.setdefault(node_id, node_with_score.node)
+    ranked = sorted(fused.items(), key=lambda x: -x[1])[:top_k]
+    return [
+        NodeWithScore(node=nodes[node_id], score=score) for node_id, score in ranked
+    ]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Runs the dense retriever and a BM25 retriever for the same query and
+    merges their rankings with reciprocal-rank fusion.
+    """
+
+    def __init__(
+        self, dense_retriever, sparse_retriever, similarity_top_k=5, rrf_k=60, **kwargs
+    ):
+        self.dense_retriever = dense_retriever
+        self.sparse_retriever = sparse_retriever
+        self.similarity_top_k = similarity_top_k
+        self.rrf_k = rrf_k
+        super().__init__(**kwargs)
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        dense = self.dense_retriever.retrieve(query_bundle)
+        sparse = self.sparse_retriever.retrieve(query_bundle)
+        return reciprocal_rank_fusion(
+            [dense, sparse], k=self.rrf_k, top_k=self.similarity_top_k
+        )
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        dense, sparse = await asyncio.gather(
+            self.dense_retriever.aretrieve(query_bundle),
+            asyncio.to_thread(self.sparse_retriever.retrieve, query_bundle),
+        )
+        return reciprocal_rank_fusion(
+            [dense, sparse], k=self.rrf_k, top_k=self.similarity_top_k
+        )
+
+
+def get_hybrid_config(namespace):
+    """Returns the hybrid retrieval settings for `namespace`, or None if disabled."""
+    ncert_search = json.load(open("./config/ncert_search.json"))
+    hybrid_config = ncert_search.get("hybrid_retrieval", {}).get(namespace)
+    if not hybrid_config or not hybrid_config.get("enabled", False):
+        return None
+    return hybrid_config
+
+
+@lru_cache
+def get_bm25_index(namespace):
+    ncert_search = json.load(open("./config/ncert_search.json"))
+    path = os.path.join(
+        ncert_search.get("bm25_index_path", "./storage/bm25"),
+        f"{namespace or 'default'}.pkl.gz",
+    )
+    return BM25Index(path)
@@ -0,0 +1,110 @@
+import os
+import json
+import hashlib
+import threading
+
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_hashes(nodes, seen=None):
+    """
+    Content hash per node, from its text and page. Repeated chunks within the
+    same file (running headers, blank pages) get an occurrence suffix so every
+    hash stays unique. Pass the same `seen` dict for every batch of a file
+    that arrives in several batches.
+    """
+    seen = {} if seen is None else seen
+    hashes = []
+    for node in nodes:
+        raw = f"{node.metadata.get('page_label', '')}\x00{node.get_content()}"
+        chunk_hash = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+        seen[chunk_hash] = seen.get(chunk_hash, 0) + 1
+        if seen[chunk_hash] > 1:
+            chunk_hash = f"{chunk_hash}#{seen[chunk_hash] - 1}"
+        hashes.append(chunk_hash)
+    return hashes
+
+
+def chunk_node_id(file_key, chunk_hash):
+    """Deterministic node id, so re-upserting an unchanged chunk overwrites it."""
+    return hashlib.sha256(f"{file_key}\x00{chunk_hash}".encode("utf-8")).hexdigest()
+
+
+class IndexManifest:
+    """
+    Persistent record of what has been indexed: per file its size, mtime and
+    content hash, and per chunk its content hash and node id.
+
+    Unchanged files are recognised from `os.stat` alone. Files whose stat
+    changed but whose bytes did not are recognised by hash without being
+    parsed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.files = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.files = json.load(f).get("files", {})
+
+    @staticmethod
+    def file_key(path):
+        return os.path.abspath(path)
+
+    def save(self):
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"files": self.files}, f)
+            os.replace(tmp_path, self.path)
+
+    def is_unchanged(self, path):
+        """
+        True if `path` is indexed with its current content. Refreshes the
+        stored stat when only the mtime moved.
+        """
+        entry = self.files.get(self.file_key(path))
+        if entry is None:
+            return False
+        stat = os.stat(path)
+        if entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return True
+        if entry["size"] != stat.st_size or entry["sha256"] != file_sha256(path):
+            return False
+        entry["mtime_ns"] = stat.st_mtime_ns
+        return True
+
+    def chunks(self, path):
+        """Returns {chunk_hash: node_id} recorded for `path`."""
+        entry = self.files.get(self.file_key(path))
+        return dict(entry["chunks"]) if entry else {}
+
+    def record(self, path, chunks):
+        stat = os.stat(path)
+        with self._lock:
+            self.files[self.file_key(path)] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": file_sha256(path),
+                "chunks": chunks,
+            }
+
+    def forget(self, path):
+        """Drops `path` and returns the node ids that were indexed for it."""
+        with self._lock:
+            entry = self.files.pop(self.file_key(path), None)
+        return list(entry["chunks"].values()) if entry else []
+
+    def clear(self):
+        with self._lock:
+            self.files = {}
@@ -1,10 +1,26 @@
 import os
+import asyncio
+import dataclasses
+from typing import List, Optional
 from pinecone import Pinecone, ServerlessSpec
 from llama_index.vector_stores.pinecone import PineconeVectorStore
 from llama_index.core import VectorStoreIndex
+from llama_index.core.vector_stores.types import (
+    FilterCondition,
+    FilterOperator,
+    MetadataFilters,
+)
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
 from dotenv import load_dotenv, find_dotenv
 import json
 from functools import lru_cache
+from http_clients import configure_pinecone, get_http_config
+from node_store import (
+    DEFAULT_SLIM_METADATA_KEYS,
+    get_slim_vectors_config,
+    node_from_slim_metadata,
+    slim_metadata,
+)
 import json
 
 # _ = load_dotenv(find_dotenv())
@@ -19,12 +35,23 @@ def get_document_manager():
     return document_manager
 
 
+def get_pinecone_client():
+    """Pinecone client whose index connections use the shared `http` settings"""
+    http_config = get_http_config()
+    return configure_pinecone(
+        Pinecone(
+            api_key=os.getenv("PINECONE_API_KEY"),
+            pool_threads=http_config["max_connections"],
+        )
+    )
+
+
 @lru_cache
 def load_pinecone_index(index_name, host=""):
     """Base Index from pinecone
     This can be used to create multi-tenant using llama-index vector-store object"""
     ncert_search = json.load(open("./config/ncert_search.json"))
-    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+    pc = get_pinecone_client()
     if host == "":
         if index_name not in pc.list_indexes().names():
             # create the index
@@ -42,9 +69,121 @@ def load_pinecone_index(index_name, host=""):
     return pinecone_index
 
 
-def get_rag_index(pinecone_index, namespace=""):
-    vector_store = PineconeVectorStore(
-        pinecone_index=pinecone_index, namespace=namespace
+PINECONE_OPERATORS = {
+    FilterOperator.EQ: "$eq",
+    FilterOperator.NE: "$ne",
+    FilterOperator.GT: "$gt",
+    FilterOperator.GTE: "$gte",
+    FilterOperator.LT: "$lt",
+    FilterOperator.LTE: "$lte",
+    FilterOperator.IN: "$in",
+    FilterOperator.NIN: "$nin",
+}
+
+
+def to_pinecone_filter(filters):
+    """
+    MetadataFilters as a Pinecone filter. Same as the vector store's own
+    translation, plus IS_EMPTY as `$exists: false`, which matches vectors
+    without the key (such as those indexed before chunks carried a tenant).
+    """
+    clauses = []
+    for f in filters.filters:
+        if isinstance(f, MetadataFilters):
+            clauses.append(to_pinecone_filter(f))
+        elif f.operator == FilterOperator.IS_EMPTY:
+            clauses.append({f.key: {"$exists": False}})
+        elif f.operator in PINECONE_OPERATORS:
+            clauses.append({f.key: {PINECONE_OPERATORS[f.operator]: f.value}})
+        else:
+            raise ValueError(f"Filter operator {f.operator} not supported by Pinecone")
+    if len(clauses) <= 1:
+        return clauses[0] if clauses else {}
+    return {"$or" if filters.condition == FilterCondition.OR else "$and": clauses}
+
+
+class SlimPineconeIndex:
+    """
+    Wraps a pinecone Index holding slim vectors. Query matches get their slim
+    metadata expanded to the node metadata PineconeVectorStore parses, with
+    empty text, so the vector store's own query handling applies unchanged.
+    """
+
+    def __init__(self, pinecone_index):
+        self.pinecone_index = pinecone_index
+
+    def __getattr__(self, name):
+        return getattr(self.pinecone_index, name)
+
+    def query(self, *args, **kwargs):
+        response = self.pinecone_index.query(*args, **kwargs)
+        for match in response.matches:
+            # Vectors upserted before slim mode carry the full node already
+            if match.metadata is not None and "_node_content" not in match.metadata:
+                match.metadata = node_to_metadata_dict(
+                    node_from_slim_metadata(match.id, match.metadata), remove_text=True
+                )
+        return response
+
+
+class AsyncPineconeVectorStore(PineconeVectorStore):
+    """
+    The pinecone client only offers blocking calls, and the base vector store
+    runs them directly inside `aquery`/`async_add`, which stalls the event
+    loop. Run them on a worker thread instead.
+
+    Queries do not ask for the stored vectors back, since retrieval never
+    uses them, and translate their filters with `to_pinecone_filter`. With
+    `slim_metadata_keys` set, vectors only carry those metadata keys and the
+    document id. Queries then return nodes without text, which the node
+    store hydrates (see `node_store.py`).
+    """
+
+    slim_metadata_keys: Optional[List[str]] = None
+
+    def __init__(self, *args, slim_metadata_keys=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.slim_metadata_keys = slim_metadata_keys
+        if slim_metadata_keys is not None:
+            self._pinecone_index = SlimPineconeIndex(self._pinecone_index)
+
+    def add(self, nodes, **add_kwargs):
+        if self.slim_metadata_keys is None:
+            return super().add(nodes, **add_kwargs)
+        self._pinecone_index.upsert(
+            [
+                {
+                    "id": node.node_id,
+                    "values": node.get_embedding(),
+                    "metadata": slim_metadata(node, self.slim_metadata_keys),
+                }
+                for node in nodes
+            ],
+            namespace=self.namespace,
+            batch_size=self.batch_size,
+            **self.insert_kwargs,
+        )
+        return [node.node_id for node in nodes]
+
+    def query(self, query, **kwargs):
+        kwargs.setdefault("include_values", False)
+        if query.filters is not None:
+            kwargs["pinecone_query_filters"] = to_pinecone_filter(query.filters)
+            query = dataclasses.replace(query, filters=None)
+        return super().query(query, **kwargs)
+
+    async def aquery(self, query, **kwargs):
+        return await asyncio.to_thread(self.query, query, **kwargs)
+
+    async def async_add(self, nodes, **add_kwargs):
+        return await asyncio.to_thread(self.add, nodes, **add_kwargs)
+
+
+def get_rag_index(pinecone_index, namespace="", slim_metadata_keys=None):
+    vector_store = AsyncPineconeVectorStore(
+        pinecone_index=pinecone_index,
+        namespace=namespace,
+        slim_metadata_keys=slim_metadata_keys,
     )
     # print("INDEX NAME :", vector_store.index_name)
     index = VectorStoreIndex.from_vector_store(
@@ -53,6 +192,46 @@ def get_rag_index(pinecone_index, namespace=""):
     return index
 
 
+def get_local_rag_index(persist_dir, namespace="", embedding_dim=3072):
+    from local_vector_store import LocalVectorStore
+
+    vector_store = LocalVectorStore(
+        persist_dir=persist_dir, namespace=namespace, embedding_dim=embedding_dim
+    )
+    index = VectorStoreIndex.from_vector_store(vector_store=vector_store)
+    return index
+
+
+def load_rag_index(ncert_search, index_name=None, namespace=None):
+    """Builds the index for the vector store backend selected in the config."""
+    index_name = index_name or ncert_search["index_name"]
+    namespace = namespace if namespace is not None else ncert_search["namespace"]
+    backend = ncert_search.get("vector_store", "pinecone")
+    if backend == "local":
+        return get_local_rag_index(
+            os.path.join(ncert_search["local_vector_store_path"], index_name),
+            namespace=namespace,
+            embedding_dim=ncert_search["embedding_dim"],
+        )
+    if backend == "pinecone":
+        host = (
+            ncert_search["pinecone_host"]
+            if index_name == ncert_search["index_name"]
+            else ""
+        )
+        slim_config = get_slim_vectors_config(ncert_search)
+        return get_rag_index(
+            load_pinecone_index(index_name, host=host),
+            namespace=namespace,
+            slim_metadata_keys=(
+                slim_config.get("vector_metadata_keys", DEFAULT_SLIM_METADATA_KEYS)
+                if slim_config is not None
+                else None
+            ),
+        )
+    raise NotImplementedError(f"Vector store {backend} not implemented")
+
+
 def delete(pc, index_name):
     try:
         pc.delete_index(index_name)
@@ -63,32 +242,45 @@ def delete(pc, index_name):
 
 # Add this to indexer.py's main block
 if __name__ == "__main__":
-    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-    # index = pc.Index("ncert-index")
-    # stats = index.describe_index_stats()
-    # print(f"Index stats: {stats}")
-    # 1. Delete existing index
-
-    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-    if "ncert-index" in pc.list_indexes().names():
-        pc.delete_index("ncert-index")
-
-    # 2. Create new index with correct dimensions
-    pc.create_index(
-        name="ncert-index",
-        dimension=3072,  # Updated for text-embedding-3-large
-        metric="dotproduct",
-        spec=ServerlessSpec(cloud="aws", region="us-east-1"),
-    )
-    index = pc.Index("ncert-index")
-    stats = index.describe_index_stats()
-    print(f"Index stats: {stats}")
+    import sys
 
-    # 3. Index your documents
-    files = ["data/iesc111.pdf"]
+    ncert_search = json.load(open("./config/ncert_search.json"))
+    index_name = ncert_search["index_name"]
+
+    # Indexing is incremental: unchanged files are skipped and only new or
+    # changed chunks are embedded. Pass --rebuild to drop the index and the
+    # manifest and start over.
+    backend = ncert_search.get("vector_store", "pinecone")
+    if "--rebuild" in sys.argv:
+        if backend == "local":
+            # Empties the namespace; persisting compacts its files away
+            vector_store = load_rag_index(ncert_search).vector_store
+            vector_store.clear()
+            vector_store.persist()
+        else:
+            pc = get_pinecone_client()
+            if index_name in pc.list_indexes().names():
+                pc.delete_index(index_name)
+
+            pc.create_index(
+                name=index_name,
+                dimension=ncert_search["embedding_dim"],
+                metric="dotproduct",
+                spec=ServerlessSpec(cloud="aws", region="us-east-1"),
+            )
     doc_manager = get_document_manager()
+    if "--rebuild" in sys.argv:
+        doc_manager.clear()
+    if backend == "local":
+        print(f"Index size: {doc_manager.index.vector_store.count()} vectors")
+    else:
+        index = get_pinecone_client().Index(index_name)
+        stats = index.describe_index_stats()
+        print(f"Index stats: {stats}")
+
+    files = ["data/iesc111.pdf"]
     n_indexed = doc_manager.index_doc_from_files(files)
-    print(f"Indexed {n_indexed} chunks")
+    print(f"Indexed {n_indexed} new or changed chunks")
 
 # if __name__ == "__main__":
 #     files = ["data/iesc111.pdf"]
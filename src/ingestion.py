@@ -0,0 +1,364 @@
+import os
+import queue
+import threading
+import time
+import contextvars
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from llama_index.core import SimpleDirectoryReader
+from llama_index.core.node_parser import SimpleNodeParser
+from llama_index.core.readers.file.base import default_file_metadata_func
+from llama_index.core.schema import Document, MetadataMode
+from llama_index.core.settings import Settings
+
+from embedding_store import get_embedding_store
+from node_store import get_node_store
+from tracing import record_cache, record_span, span
+
+_DONE = object()
+
+# Same as SimpleDirectoryReader, so streamed chunks embed the same text
+EXCLUDED_FILE_METADATA_KEYS = [
+    "file_name",
+    "file_type",
+    "file_size",
+    "creation_date",
+    "last_modified_date",
+    "last_accessed_date",
+]
+
+
+def parse_file(path, chunk_size, chunk_overlap):
+    """Loads one file and splits it into nodes. Runs in a worker process."""
+    documents = SimpleDirectoryReader(input_files=[path]).load_data()
+    parser = SimpleNodeParser.from_defaults(
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap
+    )
+    return parser.get_nodes_from_documents(documents)
+
+
+def iter_documents(path):
+    """
+    Yields the documents of one file. PDFs are read lazily, one page at a
+    time. Other file types are loaded whole.
+    """
+    if not path.lower().endswith(".pdf"):
+        yield from SimpleDirectoryReader(input_files=[path]).load_data()
+        return
+
+    import pypdf
+
+    file_metadata = default_file_metadata_func(path)
+    with open(path, "rb") as f:
+        reader = pypdf.PdfReader(f)
+        page_labels = reader.page_labels
+        for page_number in range(len(reader.pages)):
+            text = reader.pages[page_number].extract_text()
+            # pypdf caches every object it parses; drop them so memory does
+            # not grow with the number of pages read
+            reader.resolved_objects.clear()
+            metadata = {
+                "page_label": page_labels[page_number],
+                "file_name": os.path.basename(path),
+            }
+            metadata.update(file_metadata)
+            yield Document(
+                text=text,
+                metadata=metadata,
+                excluded_embed_metadata_keys=list(EXCLUDED_FILE_METADATA_KEYS),
+                excluded_llm_metadata_keys=list(EXCLUDED_FILE_METADATA_KEYS),
+            )
+
+
+def iter_file_nodes(path, chunk_size, chunk_overlap, batch_size):
+    """
+    Streams the nodes of one file in batches of at most `batch_size`.
+
+    Each page is chunked as it is read. The last chunk of a page may be
+    incomplete, so it is carried over and chunked again together with the
+    next page. Chunks and their overlap therefore continue across page
+    breaks. A chunk that starts on one page and ends on the next keeps the
+    metadata of the page it started on.
+    """
+    parser = SimpleNodeParser.from_defaults(
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap
+    )
+    carried = None
+    batch = []
+    for document in iter_documents(path):
+        if carried is not None:
+            document.set_content(f"{carried.get_content()}\n{document.text}")
+        nodes = parser.get_nodes_from_documents([document])
+        if not nodes:
+            continue
+        if carried is not None:
+            nodes[0].metadata = dict(carried.metadata)
+        batch.extend(nodes[:-1])
+        carried = nodes[-1]
+        while len(batch) >= batch_size:
+            yield batch[:batch_size]
+            batch = batch[batch_size:]
+    if carried is not None:
+        batch.append(carried)
+    if batch:
+        yield batch
+
+
+def timed(iterable, stage):
+    """Yields from `iterable`, recording the wait for each item as `stage`."""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        record_span(stage, start, time.perf_counter() - start)
+        yield item
+
+
+class IngestionProgress:
+    def __init__(self, files_total=0):
+        self.files_total = files_total
+        self.files_parsed = 0
+        self.nodes_parsed = 0
+        self.nodes_embedded = 0
+        self.embeddings_reused = 0
+        self.nodes_upserted = 0
+        self.started_at = time.time()
+
+    def as_dict(self):
+        return {
+            "files_total": self.files_total,
+            "files_parsed": self.files_parsed,
+            "nodes_parsed": self.nodes_parsed,
+            "nodes_embedded": self.nodes_embedded,
+            "embeddings_reused": self.embeddings_reused,
+            "nodes_upserted": self.nodes_upserted,
+            "elapsed": time.time() - self.started_at,
+        }
+
+
+class IngestionPipeline:
+    """
+    Pipelined ingestion: parse -> embed -> upsert.
+
+    Files are parsed and chunked across a process pool. Nodes are embedded in
+    batches of `embed_batch_size` on a thread pool with at most
+    `max_inflight_batches` embedding requests in flight, and a dedicated
+    thread upserts each embedded batch while later batches are still being
+    embedded.
+
+    With `streaming`, files are instead read page by page in this process
+    and handed on in batches of `embed_batch_size`. No file is ever fully in
+    memory, so peak memory depends on the batch size and the number of
+    batches in flight, not on the document size.
+
+    With an `embedding_store`, chunks whose text was embedded before reuse
+    the stored vector instead of calling the embed model. With a
+    `node_store`, full nodes are written there, so the vector store only
+    needs to keep ids and filter fields.
+    """
+
+    def __init__(
+        self,
+        index,
+        chunk_size=1024,
+        chunk_overlap=50,
+        embed_model=None,
+        parse_workers=4,
+        embed_batch_size=64,
+        max_inflight_batches=4,
+        embedding_store=None,
+        node_store=None,
+        streaming=False,
+        prepare_nodes=None,
+        on_batch_upserted=None,
+        progress_callback=None,
+    ):
+        self.index = index
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.embed_model = embed_model
+        self.parse_workers = parse_workers
+        self.embed_batch_size = embed_batch_size
+        self.max_inflight_batches = max_inflight_batches
+        self.embedding_store = embedding_store
+        self.node_store = node_store
+        self.streaming = streaming
+        self.prepare_nodes = prepare_nodes
+        self.on_batch_upserted = on_batch_upserted
+        self.progress_callback = progress_callback
+
+    @classmethod
+    def from_config(cls, index, ncert_search, **kwargs):
+        ingestion_config = ncert_search.get("ingestion", {})
+        return cls(
+            index,
+            chunk_size=ncert_search["chunk_size"],
+            chunk_overlap=ncert_search["chunk_overlap"],
+            parse_workers=ingestion_config.get("parse_workers", 4),
+            embed_batch_size=ingestion_config.get("embed_batch_size", 64),
+            max_inflight_batches=ingestion_config.get("max_inflight_embed_batches", 4),
+            embedding_store=get_embedding_store(ncert_search),
+            node_store=get_node_store(ncert_search["namespace"]),
+            streaming=ingestion_config.get("streaming", False),
+            **kwargs,
+        )
+
+    def _report(self):
+        if self.progress_callback is not None:
+            self.progress_callback(self.progress.as_dict())
+
+    def iter_parsed(self, files):
+        """
+        Yields (path, nodes, file_done) as nodes become available. Without
+        streaming, each file arrives whole as soon as it has been parsed.
+        """
+        if self.streaming:
+            yield from self._iter_streamed(files)
+            return
+        workers = min(self.parse_workers, len(files))
+        if workers <= 1:
+            for path in files:
+                yield path, parse_file(path, self.chunk_size, self.chunk_overlap), True
+            return
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(parse_file, path, self.chunk_size, self.chunk_overlap): path
+                for path in files
+            }
+            for future in as_completed(futures):
+                yield futures[future], future.result(), True
+
+    def _iter_streamed(self, files):
+        for path in files:
+            previous = []
+            for nodes in iter_file_nodes(
+                path, self.chunk_size, self.chunk_overlap, self.embed_batch_size
+            ):
+                if previous:
+                    yield path, previous, False
+                previous = nodes
+            yield path, previous, True
+
+    def _embed_batch(self, batch):
+        embed_model = self.embed_model or Settings.embed_model
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in batch]
+        if self.embedding_store is not None:
+            keys = [
+                self.embedding_store.content_key(text, embed_model.model_name)
+                for text in texts
+            ]
+            embeddings = self.embedding_store.get_many(keys)
+        else:
+            embeddings = [None] * len(texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            with span("ingest.embed"):
+                new_embeddings = embed_model.get_text_embedding_batch(
+                    [texts[i] for i in missing]
+                )
+            for i, embedding in zip(missing, new_embeddings):
+                embeddings[i] = embedding
+            if self.embedding_store is not None:
+                self.embedding_store.put_many(
+                    [keys[i] for i in missing], new_embeddings
+                )
+        if self.embedding_store is not None:
+            record_cache("chunk_embedding", "hit", len(batch) - len(missing))
+            record_cache("chunk_embedding", "miss", len(missing))
+        with self._progress_lock:
+            self.progress.embeddings_reused += len(batch) - len(missing)
+        for node, embedding in zip(batch, embeddings):
+            node.embedding = embedding
+        return batch
+
+    def _upsert_worker(self, upserts, errors):
+        while True:
+            batch = upserts.get()
+            if batch is _DONE:
+                return
+            if errors:
+                continue  # drain the queue so producers never block
+            try:
+                if self.node_store is not None:
+                    # Before the upsert, so a slim vector is never returned
+                    # before its node can be hydrated
+                    with span("ingest.node_store"):
+                        self.node_store.put_many(batch)
+                # Nodes already carry embeddings, so the index does not re-embed
+                with span("ingest.upsert"):
+                    self.index.insert_nodes(batch)
+                if self.on_batch_upserted is not None:
+                    self.on_batch_upserted(batch)
+                with self._progress_lock:
+                    self.progress.nodes_upserted += len(batch)
+                    self._report()
+            except Exception as e:
+                errors.append(e)
+
+    def run(self, files):
+        """Ingests `files` and returns the number of nodes indexed."""
+        self.progress = IngestionProgress(files_total=len(files))
+        self._progress_lock = threading.Lock()
+        errors = []
+        inflight = threading.BoundedSemaphore(self.max_inflight_batches)
+        # Bounded so a slow vector store applies back-pressure to embedding
+        upserts = queue.Queue(maxsize=self.max_inflight_batches)
+        # Worker threads run in copies of this context, so their spans land
+        # in the caller's trace
+        upsert_thread = threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(self._upsert_worker, upserts, errors),
+            daemon=True,
+        )
+        upsert_thread.start()
+
+        def embedded(future):
+            inflight.release()
+            try:
+                batch = future.result()
+            except Exception as e:
+                errors.append(e)
+                return
+            with self._progress_lock:
+                self.progress.nodes_embedded += len(batch)
+                self._report()
+            upserts.put(batch)
+
+        def submit(pool, batch):
+            inflight.acquire()
+            pool.submit(
+                contextvars.copy_context().run, self._embed_batch, batch
+            ).add_done_callback(embedded)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_inflight_batches) as pool:
+                pending = []
+                for path, nodes, file_done in timed(
+                    self.iter_parsed(files), "ingest.parse"
+                ):
+                    if errors:
+                        break
+                    with self._progress_lock:
+                        self.progress.files_parsed += file_done
+                        self.progress.nodes_parsed += len(nodes)
+                        self._report()
+                    if self.prepare_nodes is not None:
+                        # Called once per batch when streaming. May also drop
+                        # nodes that do not need indexing.
+                        nodes = self.prepare_nodes(nodes, path)
+                    pending.extend(nodes)
+                    while len(pending) >= self.embed_batch_size:
+                        submit(pool, pending[: self.embed_batch_size])
+                        pending = pending[self.embed_batch_size :]
+                if pending and not errors:
+                    submit(pool, pending)
+        finally:
+            upserts.put(_DONE)
+            upsert_thread.join()
+
+        if errors:
+            raise errors[0]
+        return self.progress.nodes_upserted
@@ -0,0 +1,474 @@
+import os
+import re
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from functools import lru_cache
+
+from metrics import counter
+from metadata_filters import DEFAULT_TENANT
+from tracing import span, trace
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_SUPERSEDED = "superseded"
+
+_TENANT = re.compile(r"[A-Za-z0-9_.-]{1,64}")
+
+# Longest gap between progress writes of a running job
+PROGRESS_INTERVAL = 0.5
+COPY_BLOCK_SIZE = 1 << 20
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+class JobStore:
+    """
+    Persistent ingestion jobs in SQLite, shared by every process that opens
+    the same file.
+
+    A job is claimed in one transaction, so two workers never run the same
+    job. A running job carries the id of the queue that claimed it and a
+    heartbeat. Jobs whose heartbeat stopped, because their process died or
+    was restarted, are queued again, or failed after `max_attempts`.
+    """
+
+    COLUMNS = (
+        "id",
+        "tenant",
+        "file_name",
+        "file_path",
+        "status",
+        "progress",
+        "n_indexed",
+        "error",
+        "attempts",
+        "owner",
+        "created_at",
+        "started_at",
+        "finished_at",
+        "heartbeat_at",
+    )
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, tenant TEXT NOT NULL, file_name TEXT NOT NULL, "
+            "file_path TEXT NOT NULL, status TEXT NOT NULL, progress TEXT, "
+            "n_indexed INTEGER, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+            "owner TEXT, created_at REAL NOT NULL, started_at REAL, "
+            "finished_at REAL, heartbeat_at REAL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created_at)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_tenant ON jobs(tenant, created_at)"
+        )
+
+    def _to_dict(self, row):
+        if row is None:
+            return None
+        job = dict(zip(self.COLUMNS, row))
+        job["progress"] = json.loads(job["progress"]) if job["progress"] else {}
+        return job
+
+    def _select(self, where="", params=(), suffix=""):
+        return self._conn.execute(
+            f"SELECT {', '.join(self.COLUMNS)} FROM jobs {where} {suffix}", params
+        ).fetchall()
+
+    def add(self, job_id, tenant, file_name, file_path, publish=None):
+        """
+        Queues a job for `file_path`. Jobs still queued for the same path are
+        superseded by it, since they would index its bytes too.
+
+        `publish` is called inside the transaction, after superseding and
+        before the new job is visible, so no worker can claim either job
+        while the file is being replaced.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, finished_at = ?, error = ? "
+                    "WHERE file_path = ? AND status = ?",
+                    (
+                        JOB_SUPERSEDED,
+                        now,
+                        f"Superseded by job {job_id}",
+                        file_path,
+                        JOB_QUEUED,
+                    ),
+                )
+                if publish is not None:
+                    publish()
+                self._conn.execute(
+                    "INSERT INTO jobs (id, tenant, file_name, file_path, status, "
+                    "created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (job_id, tenant, file_name, file_path, JOB_QUEUED, now),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.get(job_id)
+
+    def get(self, job_id):
+        with self._lock:
+            rows = self._select("WHERE id = ?", (job_id,))
+        return self._to_dict(rows[0] if rows else None)
+
+    def list(self, tenant=None, status=None, limit=100):
+        """Newest first, optionally for one tenant and status."""
+        clauses, params = [], []
+        if tenant is not None:
+            clauses.append("tenant = ?")
+            params.append(tenant)
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._select(
+                where, (*params, limit), "ORDER BY created_at DESC LIMIT ?"
+            )
+        return [self._to_dict(row) for row in rows]
+
+    def counts(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+            ).fetchall()
+        return dict(rows)
+
+    def claim(self, owner, per_tenant_limit):
+        """
+        Marks the oldest queued job of a tenant with fewer than
+        `per_tenant_limit` running jobs as running for `owner`, and returns
+        it. Returns None if there is no such job.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                saturated = [
+                    tenant
+                    for tenant, running in self._conn.execute(
+                        "SELECT tenant, COUNT(*) FROM jobs WHERE status = ? "
+                        "GROUP BY tenant",
+                        (JOB_RUNNING,),
+                    )
+                    if running >= per_tenant_limit
+                ]
+                where = "WHERE status = ?"
+                if saturated:
+                    where += f" AND tenant NOT IN ({', '.join('?' * len(saturated))})"
+                rows = self._select(
+                    where, (JOB_QUEUED, *saturated), "ORDER BY created_at LIMIT 1"
+                )
+                if not rows:
+                    self._conn.execute("COMMIT")
+                    return None
+                job_id = rows[0][0]
+                now = time.time()
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, owner = ?, attempts = attempts + 1, "
+                    "started_at = ?, heartbeat_at = ?, error = NULL WHERE id = ?",
+                    (JOB_RUNNING, owner, now, now, job_id),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.get(job_id)
+
+    def update_progress(self, job_id, progress):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET progress = ?, heartbeat_at = ? WHERE id = ?",
+                (json.dumps(progress), time.time(), job_id),
+            )
+
+    def heartbeat(self, owner):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status = ?",
+                (time.time(), owner, JOB_RUNNING),
+            )
+
+    def finish(self, job_id, status, progress=None, n_indexed=None, error=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, progress = COALESCE(?, progress), "
+                "n_indexed = ?, error = ?, finished_at = ?, owner = NULL "
+                "WHERE id = ?",
+                (
+                    status,
+                    json.dumps(progress) if progress is not None else None,
+                    n_indexed,
+                    error,
+                    time.time(),
+                    job_id,
+                ),
+            )
+
+    def recover_stale(self, stale_after, max_attempts):
+        """
+        Requeues running jobs without a heartbeat for `stale_after` seconds,
+        or fails them once they have been tried `max_attempts` times. Returns
+        the number of jobs recovered.
+        """
+        cutoff = time.time() - stale_after
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                failed = self._conn.execute(
+                    "UPDATE jobs SET status = ?, owner = NULL, finished_at = ?, "
+                    "error = 'Interrupted too many times' "
+                    "WHERE status = ? AND heartbeat_at < ? AND attempts >= ?",
+                    (JOB_FAILED, time.time(), JOB_RUNNING, cutoff, max_attempts),
+                ).rowcount
+                requeued = self._conn.execute(
+                    "UPDATE jobs SET status = ?, owner = NULL "
+                    "WHERE status = ? AND heartbeat_at < ?",
+                    (JOB_QUEUED, JOB_RUNNING, cutoff),
+                ).rowcount
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return failed + requeued
+
+
+def _index_files(files, progress_callback=None, tenant=DEFAULT_TENANT):
+    from document_manager import get_document_manager
+
+    return get_document_manager().index_doc_from_files(
+        files, progress_callback=progress_callback, tenant=tenant
+    )
+
+
+class IngestionQueue:
+    """
+    Background ingestion.
+
+    `submit` stores an upload and queues a job for it, and returns at once.
+    A bounded pool of `workers` threads runs the jobs through
+    `DocumentManager.index_doc_from_files`, oldest first. At most
+    `per_tenant_concurrency` jobs of one tenant run at a time, counted across
+    every process sharing the job store, so one tenant's large uploads cannot
+    take every worker. Progress is saved as the job runs, and jobs survive
+    restarts.
+
+    Uploads of the default tenant are stored directly in `upload_dir`, where
+    the Streamlit app has always put them, so re-uploads stay incremental.
+    Other tenants get a subdirectory each. Re-uploading a file supersedes
+    its jobs that are still queued; a running one finishes, and the new job
+    then indexes whatever changed since.
+    """
+
+    def __init__(
+        self,
+        store,
+        upload_dir="./uploaded_files",
+        workers=2,
+        per_tenant_concurrency=1,
+        allowed_extensions=(".pdf", ".txt"),
+        max_upload_bytes=None,
+        stale_after=60.0,
+        max_attempts=3,
+        poll_interval=1.0,
+        index_files=_index_files,
+    ):
+        self.store = store
+        self.upload_dir = upload_dir
+        self.workers = workers
+        self.per_tenant_concurrency = per_tenant_concurrency
+        self.allowed_extensions = tuple(allowed_extensions)
+        self.max_upload_bytes = max_upload_bytes
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.index_files = index_files
+        self.owner = uuid.uuid4().hex
+        self._wakeup = threading.Condition()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def upload_path(self, tenant, file_name):
+        if tenant == DEFAULT_TENANT:
+            return os.path.join(self.upload_dir, file_name)
+        return os.path.join(self.upload_dir, tenant, file_name)
+
+    def submit(self, fileobj, file_name, tenant=DEFAULT_TENANT):
+        """
+        Stores the upload read from `fileobj` and queues a job to index it.
+        Returns the job. Raises ValueError for a bad tenant or file type, and
+        UploadTooLarge past `max_upload_bytes`.
+        """
+        if not _TENANT.fullmatch(tenant):
+            raise ValueError(f"Invalid tenant {tenant!r}")
+        file_name = os.path.basename(file_name or "")
+        if not file_name.lower().endswith(self.allowed_extensions):
+            raise ValueError(
+                f"Unsupported file type, expected one of {', '.join(self.allowed_extensions)}"
+            )
+        file_path = self.upload_path(tenant, file_name)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        job_id = uuid.uuid4().hex
+        tmp_path = f"{file_path}.{job_id}.part"
+        try:
+            with open(tmp_path, "wb") as output:
+                self._copy(fileobj, output)
+            # A job still reading the previous upload keeps its open file
+            job = self.store.add(
+                job_id,
+                tenant,
+                file_name,
+                os.path.abspath(file_path),
+                publish=lambda: os.replace(tmp_path, file_path),
+            )
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        counter(
+            "rag_ingestion_jobs_total",
+            "Ingestion jobs by the status they reached.",
+            labels={"status": JOB_QUEUED},
+        ).inc()
+        with self._wakeup:
+            self._wakeup.notify()
+        return job
+
+    def _copy(self, fileobj, output):
+        size = 0
+        for block in iter(lambda: fileobj.read(COPY_BLOCK_SIZE), b""):
+            size += len(block)
+            if self.max_upload_bytes is not None and size > self.max_upload_bytes:
+                raise UploadTooLarge(
+                    f"Uploads are limited to {self.max_upload_bytes} bytes"
+                )
+            output.write(block)
+
+    def start(self):
+        """Starts the workers and the heartbeat, once."""
+        if self._threads:
+            return
+        self._stopping.clear()
+        self.store.recover_stale(self.stale_after, self.max_attempts)
+        self._threads = [
+            threading.Thread(
+                target=self._work, name=f"ingestion-worker-{i}", daemon=True
+            )
+            for i in range(self.workers)
+        ]
+        self._threads.append(
+            threading.Thread(
+                target=self._heartbeat, name="ingestion-heartbeat", daemon=True
+            )
+        )
+        for thread in self._threads:
+            thread.start()
+        print(f"Ingestion queue started with {self.workers} workers")
+
+    def stop(self, timeout=None):
+        """
+        Stops taking jobs and waits for running ones. Jobs still running
+        after `timeout` are requeued by the next process to start.
+        """
+        self._stopping.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _heartbeat(self):
+        interval = self.stale_after / 4
+        while not self._stopping.wait(interval):
+            self.store.heartbeat(self.owner)
+            if self.store.recover_stale(self.stale_after, self.max_attempts):
+                with self._wakeup:
+                    self._wakeup.notify_all()
+
+    def _work(self):
+        while not self._stopping.is_set():
+            job = self.store.claim(self.owner, self.per_tenant_concurrency)
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+            self._run(job)
+            # A tenant slot is free again
+            with self._wakeup:
+                self._wakeup.notify_all()
+
+    def _run(self, job):
+        job_id = job["id"]
+        last_write = 0.0
+        latest = None
+
+        def on_progress(progress):
+            nonlocal last_write, latest
+            latest = progress
+            now = time.monotonic()
+            if now - last_write >= PROGRESS_INTERVAL:
+                last_write = now
+                self.store.update_progress(job_id, progress)
+
+        print(f"Ingestion job {job_id} started for {job['file_name']!r}")
+        try:
+            with trace("ingestion_job"), span("ingest.job"):
+                n_indexed = self.index_files(
+                    [job["file_path"]],
+                    progress_callback=on_progress,
+                    tenant=job["tenant"],
+                )
+        except Exception as e:
+            print(f"Ingestion job {job_id} failed: {e}")
+            self.store.finish(job_id, JOB_FAILED, latest, error=str(e))
+            status = JOB_FAILED
+        else:
+            print(f"Ingestion job {job_id} indexed {n_indexed} chunks")
+            self.store.finish(job_id, JOB_SUCCEEDED, latest, n_indexed=n_indexed)
+            status = JOB_SUCCEEDED
+        counter(
+            "rag_ingestion_jobs_total",
+            "Ingestion jobs by the status they reached.",
+            labels={"status": status},
+        ).inc()
+
+
+@lru_cache
+def get_ingestion_queue():
+    """
+    The process-wide IngestionQueue built from `ingestion_queue` in the
+    config. Call `start()` on it to run jobs in this process.
+    """
+    ncert_search = json.load(open("./config/ncert_search.json"))
+    queue_config = ncert_search.get("ingestion_queue", {})
+    max_upload_mb = queue_config.get("max_upload_mb")
+    return IngestionQueue(
+        JobStore(queue_config.get("db_path", "./storage/ingestion_jobs.sqlite")),
+        upload_dir=queue_config.get("upload_dir", "./uploaded_files"),
+        workers=queue_config.get("workers", 2),
+        per_tenant_concurrency=queue_config.get("per_tenant_concurrency", 1),
+        allowed_extensions=queue_config.get("allowed_extensions", [".pdf", ".txt"]),
+        max_upload_bytes=max_upload_mb * 2**20 if max_upload_mb else None,
+        stale_after=queue_config.get("stale_after", 60.0),
+        max_attempts=queue_config.get("max_attempts", 3),
+    )
@@ -1,7 +1,4 @@
 
-from llama_index.llms.openai import OpenAI
-
-
 def get_openai_model(model="gpt-3.5-turbo", system_prompt=""):
     """
     Creates and returns an OpenAI model object.
@@ -13,9 +10,14 @@ def get_openai_model(model="gpt-3.5-turbo", system_prompt=""):
     Returns:
     OpenAI: A configured OpenAI model object.
     """
+    # Imported here so importing this module stays cheap
+    from llama_index.llms.openai import OpenAI
+    from http_clients import openai_client_kwargs
+
     return OpenAI(
         model=model,
         max_tokens=4_096,
         temperature=0.7,
         system_prompt=system_prompt,
+        **openai_client_kwargs(),
     )
@@ -0,0 +1,507 @@
+import os
+import json
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Any, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    FilterCondition,
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import (
+    metadata_dict_to_node,
+    node_to_metadata_dict,
+)
+
+EMBEDDINGS_FILE = "embeddings.f32"
+RECORDS_FILE = "records.jsonl"
+LOCK_FILE = ".lock"
+INITIAL_CAPACITY = 1024
+# Share of deleted rows above which `persist` rewrites the namespace
+COMPACT_DEAD_FRACTION = 0.25
+# Metadata keys with an in-memory value -> rows index, so that EQ/IN filters
+# on them only look at the matching rows
+INDEXED_METADATA_KEYS = ("file_name", "tenant")
+
+
+def _match_filter(metadata, metadata_filter):
+    value = metadata.get(metadata_filter.key)
+    target = metadata_filter.value
+    operator = metadata_filter.operator
+    if operator == FilterOperator.IS_EMPTY:
+        return value is None or value == [] or value == ""
+    if value is None:
+        return operator in (FilterOperator.NE, FilterOperator.NIN)
+    if operator == FilterOperator.EQ:
+        return value == target
+    if operator == FilterOperator.NE:
+        return value != target
+    if operator == FilterOperator.GT:
+        return value > target
+    if operator == FilterOperator.GTE:
+        return value >= target
+    if operator == FilterOperator.LT:
+        return value < target
+    if operator == FilterOperator.LTE:
+        return value <= target
+    if operator == FilterOperator.IN:
+        return value in target
+    if operator == FilterOperator.NIN:
+        return value not in target
+    if operator == FilterOperator.CONTAINS:
+        return target in value
+    if operator == FilterOperator.ANY:
+        return any(v in value for v in target)
+    if operator == FilterOperator.ALL:
+        return all(v in value for v in target)
+    if operator == FilterOperator.TEXT_MATCH:
+        return str(target) in str(value)
+    raise ValueError(f"Unsupported filter operator: {operator}")
+
+
+def match_filters(metadata, filters: MetadataFilters):
+    """Evaluates (possibly nested) MetadataFilters against a metadata dict."""
+    results = (
+        (
+            match_filters(metadata, f)
+            if isinstance(f, MetadataFilters)
+            else _match_filter(metadata, f)
+        )
+        for f in filters.filters
+    )
+    if filters.condition == FilterCondition.OR:
+        return any(results)
+    return all(results)
+
+
+def metadata_index_keys(metadata):
+    """
+    The (key, value) pairs `metadata` is indexed under: the string values of
+    its `INDEXED_METADATA_KEYS`, and (key, None) for those it has no value for.
+    """
+    for key in INDEXED_METADATA_KEYS:
+        value = metadata.get(key)
+        if value is None or value == "" or value == []:
+            yield key, None
+        elif isinstance(value, str):
+            yield key, value
+
+
+def indexed_rows_for(metadata_rows, filters: MetadataFilters):
+    """
+    The rows that can match `filters`, from a (key, value) -> rows index of
+    `INDEXED_METADATA_KEYS` built with `metadata_index_keys`, or None if no
+    EQ/IN/IS_EMPTY filter on those keys narrows them down.
+    """
+    parts = []
+    for f in filters.filters:
+        if isinstance(f, MetadataFilters):
+            parts.append(indexed_rows_for(metadata_rows, f))
+        elif f.key not in INDEXED_METADATA_KEYS:
+            parts.append(None)
+        elif f.operator == FilterOperator.IS_EMPTY:
+            parts.append(set(metadata_rows.get((f.key, None), ())))
+        elif f.operator in (FilterOperator.EQ, FilterOperator.IN):
+            values = [f.value] if f.operator == FilterOperator.EQ else f.value
+            parts.append(
+                set().union(
+                    *(metadata_rows.get((f.key, value), ()) for value in values)
+                )
+            )
+        else:
+            parts.append(None)
+    if filters.condition == FilterCondition.OR:
+        if not parts or None in parts:
+            return None
+        return set().union(*parts)
+    parts = [rows for rows in parts if rows is not None]
+    if not parts:
+        return None
+    return set.intersection(*parts)
+
+
+class LocalVectorStore(BasePydanticVectorStore):
+    """
+    In-process vector store backed by a memory-mapped float32 matrix.
+
+    Each namespace lives in its own directory holding `embeddings.f32` (one row
+    of `embedding_dim` floats per node) and an append-only `records.jsonl`
+    with node metadata and deletions. Queries are a single vectorized dot
+    product over the matrix, matching the `dotproduct` metric used for
+    Pinecone. Writes are persisted immediately, and other processes pick them
+    up on their next query.
+
+    Metadata filters are applied before scoring, so a filtered query only
+    scores the rows that match. Rows are looked up by `INDEXED_METADATA_KEYS`
+    where the filters allow it, instead of checking every row. Rows without
+    one of those keys are indexed too, for IS_EMPTY filters.
+
+    Deleted and replaced rows stay in both files until `persist` finds they
+    make up more than `COMPACT_DEAD_FRACTION` of the namespace. It then
+    writes the live rows to a new embeddings file and swaps in a new
+    `records.jsonl` pointing to it; other processes notice the swap and
+    reload.
+    """
+
+    stores_text: bool = True
+    flat_metadata: bool = False
+
+    persist_dir: str
+    namespace: str
+    embedding_dim: int
+
+    _lock: Any = PrivateAttr()
+    _matrix: Any = PrivateAttr()
+    _capacity: int = PrivateAttr()
+    _records: list = PrivateAttr()
+    _alive: Any = PrivateAttr()
+    _id_to_row: dict = PrivateAttr()
+    _metadata_rows: dict = PrivateAttr()
+    _records_offset: int = PrivateAttr()
+    _records_inode: Any = PrivateAttr()
+    _embeddings_file: str = PrivateAttr()
+
+    def __init__(self, persist_dir, namespace="", embedding_dim=3072, **kwargs: Any):
+        super().__init__(
+            persist_dir=persist_dir,
+            namespace=namespace,
+            embedding_dim=embedding_dim,
+            **kwargs,
+        )
+        self._lock = threading.RLock()
+        self._reset()
+        os.makedirs(self.path, exist_ok=True)
+        self._load()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalVectorStore"
+
+    @property
+    def client(self) -> Any:
+        return None
+
+    @property
+    def path(self):
+        return os.path.join(self.persist_dir, self.namespace or "default")
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def count(self):
+        with self._lock:
+            self._load()
+            return int(self._alive.sum())
+
+    # Storage
+
+    def _reset(self):
+        self._matrix = None
+        self._capacity = 0
+        self._records = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._id_to_row = {}
+        self._metadata_rows = {}
+        self._records_offset = 0
+        self._records_inode = None
+        self._embeddings_file = EMBEDDINGS_FILE
+
+    def _open_matrix(self, capacity):
+        embeddings_path = self._file(self._embeddings_file)
+        row_bytes = self.embedding_dim * np.dtype(np.float32).itemsize
+        if not os.path.exists(embeddings_path):
+            open(embeddings_path, "wb").close()
+        if os.path.getsize(embeddings_path) < capacity * row_bytes:
+            with open(embeddings_path, "r+b") as f:
+                f.truncate(capacity * row_bytes)
+        capacity = os.path.getsize(embeddings_path) // row_bytes
+        if self._matrix is not None:
+            self._matrix.flush()
+        self._matrix = np.memmap(
+            embeddings_path,
+            dtype=np.float32,
+            mode="r+",
+            shape=(capacity, self.embedding_dim),
+        )
+        self._capacity = capacity
+
+    def _ensure_capacity(self, rows):
+        if self._matrix is not None and rows <= self._capacity:
+            return
+        capacity = max(INITIAL_CAPACITY, self._capacity)
+        while capacity < rows:
+            capacity *= 2
+        self._open_matrix(capacity)
+
+    def _index_metadata(self, row, alive):
+        for index_key in metadata_index_keys(self._records[row]["metadata"]):
+            rows = self._metadata_rows.setdefault(index_key, set())
+            if alive:
+                rows.add(row)
+            else:
+                rows.discard(row)
+
+    def _apply_record(self, record):
+        if "embeddings" in record:
+            # Header of a compacted records file
+            self._embeddings_file = record["embeddings"]
+            return
+        if "delete" in record:
+            row = record["delete"]
+            if row < len(self._records) and self._alive[row]:
+                self._alive[row] = False
+                self._id_to_row.pop(self._records[row]["id"], None)
+                self._index_metadata(row, alive=False)
+            return
+        row = record["row"]
+        while len(self._records) <= row:
+            self._records.append(None)
+        if len(self._alive) < len(self._records):
+            alive = np.zeros(max(len(self._records), 2 * len(self._alive)), dtype=bool)
+            alive[: len(self._alive)] = self._alive
+            self._alive = alive
+        previous = self._id_to_row.get(record["id"])
+        if previous is not None:
+            self._alive[previous] = False
+            self._index_metadata(previous, alive=False)
+        self._records[row] = record
+        self._alive[row] = True
+        self._id_to_row[record["id"]] = row
+        self._index_metadata(row, alive=True)
+
+    def _load(self):
+        """Replays `records.jsonl` from where we last stopped reading."""
+        try:
+            f = open(self._file(RECORDS_FILE), "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            stat = os.fstat(f.fileno())
+            if stat.st_ino != self._records_inode:
+                if self._records_inode is not None:
+                    # Swapped in by a compaction, replay it from the start
+                    self._reset()
+                self._records_inode = stat.st_ino
+            if stat.st_size == self._records_offset:
+                return
+            f.seek(self._records_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # a writer is half-way through this line
+                self._apply_record(json.loads(line))
+                self._records_offset += len(line)
+        self._open_matrix(len(self._records))
+
+    @contextmanager
+    def _write_lock(self):
+        """Serializes writers across threads and, where supported, processes."""
+        with self._lock:
+            if fcntl is None:
+                self._load()
+                yield
+                return
+            with open(self._file(LOCK_FILE), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._load()
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _append_records(self, records):
+        with open(self._file(RECORDS_FILE), "ab") as f:
+            if self._records_inode is None:
+                self._records_inode = os.fstat(f.fileno()).st_ino
+            for record in records:
+                line = (json.dumps(record) + "\n").encode("utf-8")
+                f.write(line)
+                self._records_offset += len(line)
+
+    # Vector store API
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        with self._write_lock():
+            start = len(self._records)
+            self._ensure_capacity(start + len(nodes))
+            records = []
+            for offset, node in enumerate(nodes):
+                self._matrix[start + offset] = np.asarray(
+                    node.get_embedding(), dtype=np.float32
+                )
+                records.append(
+                    {
+                        "row": start + offset,
+                        "id": node.node_id,
+                        "ref_doc_id": node.ref_doc_id,
+                        "metadata": node_to_metadata_dict(
+                            node, remove_text=False, flat_metadata=self.flat_metadata
+                        ),
+                    }
+                )
+            # Vectors must be on disk before the records that point to them.
+            self._matrix.flush()
+            self._append_records(records)
+            for record in records:
+                self._apply_record(record)
+        return [node.node_id for node in nodes]
+
+    def _delete_rows(self, rows):
+        records = [{"delete": int(row)} for row in rows]
+        self._append_records(records)
+        for record in records:
+            self._apply_record(record)
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        with self._write_lock():
+            self._delete_rows(
+                row
+                for row in np.flatnonzero(self._alive)
+                if self._records[row]["ref_doc_id"] == ref_doc_id
+            )
+
+    def delete_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[MetadataFilters] = None,
+        **delete_kwargs: Any,
+    ) -> None:
+        with self._write_lock():
+            rows = self._select_rows(node_ids, filters)
+            self._delete_rows(rows)
+
+    def clear(self) -> None:
+        with self._write_lock():
+            self._delete_rows(np.flatnonzero(self._alive))
+
+    def get_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[MetadataFilters] = None,
+    ) -> List[BaseNode]:
+        with self._lock:
+            self._load()
+            return [self._to_node(row) for row in self._select_rows(node_ids, filters)]
+
+    def _select_rows(self, node_ids=None, filters=None):
+        indexed_rows = None
+        if node_ids is None and filters is not None:
+            indexed_rows = indexed_rows_for(self._metadata_rows, filters)
+        if node_ids is not None:
+            rows = [self._id_to_row[i] for i in node_ids if i in self._id_to_row]
+        elif indexed_rows is not None:
+            rows = sorted(indexed_rows)
+        else:
+            rows = list(np.flatnonzero(self._alive))
+        if filters is not None:
+            rows = [
+                row
+                for row in rows
+                if match_filters(self._records[row]["metadata"], filters)
+            ]
+        return rows
+
+    def _to_node(self, row):
+        node = metadata_dict_to_node(self._records[row]["metadata"])
+        node.embedding = self._matrix[row].tolist()
+        return node
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.query_embedding is None:
+            raise ValueError("LocalVectorStore requires a query embedding")
+        with self._lock:
+            self._load()
+            n_rows = len(self._records)
+            if query.filters is not None or query.node_ids is not None:
+                rows = np.asarray(
+                    self._select_rows(query.node_ids, query.filters), dtype=np.int64
+                )
+            else:
+                rows = np.flatnonzero(self._alive[:n_rows])
+            if len(rows) == 0:
+                return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+            query_vector = np.asarray(query.query_embedding, dtype=np.float32)
+            if len(rows) == n_rows:
+                scores = self._matrix[:n_rows] @ query_vector
+            else:
+                scores = self._matrix[rows] @ query_vector
+            k = min(query.similarity_top_k, len(rows))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            nodes, similarities, ids = [], [], []
+            for i in top:
+                row = int(rows[i])
+                node = metadata_dict_to_node(self._records[row]["metadata"])
+                nodes.append(node)
+                similarities.append(float(scores[i]))
+                ids.append(node.node_id)
+        return VectorStoreQueryResult(nodes=nodes, similarities=similarities, ids=ids)
+
+    def _compact(self):
+        rows = np.flatnonzero(self._alive[: len(self._records)])
+        old_file = self._embeddings_file
+        new_file = f"embeddings-{uuid.uuid4().hex}.f32"
+        matrix = np.memmap(
+            self._file(new_file),
+            dtype=np.float32,
+            mode="w+",
+            shape=(max(INITIAL_CAPACITY, len(rows)), self.embedding_dim),
+        )
+        for start in range(0, len(rows), INITIAL_CAPACITY):
+            chunk = rows[start : start + INITIAL_CAPACITY]
+            matrix[start : start + len(chunk)] = self._matrix[chunk]
+        matrix.flush()
+        del matrix
+
+        records_path = self._file(RECORDS_FILE)
+        with open(records_path + ".tmp", "wb") as f:
+            f.write((json.dumps({"embeddings": new_file}) + "\n").encode("utf-8"))
+            for new_row, row in enumerate(rows):
+                record = dict(self._records[row], row=new_row)
+                f.write((json.dumps(record) + "\n").encode("utf-8"))
+        os.replace(records_path + ".tmp", records_path)
+
+        # Readers half-way through loading may still open the previous
+        # embeddings file, so it is only removed by the next compaction
+        for name in os.listdir(self.path):
+            if (
+                name.startswith("embeddings")
+                and name.endswith(".f32")
+                and name not in (old_file, new_file)
+            ):
+                try:
+                    os.remove(self._file(name))
+                except OSError:
+                    pass
+        self._reset()
+        self._load()
+
+    def persist(self, persist_path=None, fs=None) -> None:
+        """
+        Everything is written through on `add`/`delete`, so this flushes the
+        matrix, and compacts the namespace if enough of it is deleted rows.
+        """
+        with self._write_lock():
+            if self._matrix is not None:
+                self._matrix.flush()
+            n_records = len(self._records)
+            n_dead = n_records - int(self._alive[:n_records].sum())
+            if n_dead > COMPACT_DEAD_FRACTION * n_records:
+                self._compact()
@@ -0,0 +1,137 @@
+import json
+from datetime import datetime
+
+from llama_index.core.vector_stores.types import (
+    FilterCondition,
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+)
+
+# Metadata stamped on every node at ingestion, next to SimpleDirectoryReader's
+# `file_name`. `uploaded_at` is epoch seconds, since Pinecone only compares
+# numbers with $gt/$lt.
+TENANT_KEY = "tenant"
+UPLOADED_AT_KEY = "uploaded_at"
+DEFAULT_TENANT = "default"
+
+FILTER_FIELDS = ("file_name", "tenant", "uploaded_after", "uploaded_before")
+
+
+def _timestamp(field, value):
+    if isinstance(value, bool):
+        raise ValueError(f"{field} must be epoch seconds or an ISO 8601 date")
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            pass
+    raise ValueError(f"{field} must be epoch seconds or an ISO 8601 date")
+
+
+def _match_values(field, value):
+    """An EQ filter for one value, an IN filter for a list of them."""
+    if isinstance(value, str):
+        return MetadataFilter(key=field, value=value, operator=FilterOperator.EQ)
+    if (
+        isinstance(value, (list, tuple))
+        and value
+        and all(isinstance(v, str) for v in value)
+    ):
+        return MetadataFilter(
+            key=field, value=sorted(set(value)), operator=FilterOperator.IN
+        )
+    raise ValueError(f"{field} must be a string or a non-empty list of strings")
+
+
+def build_metadata_filters(filters):
+    """
+    Turns a filter spec into llama-index MetadataFilters, which vector stores
+    apply inside the similarity search.
+
+    The spec is a dict with any of:
+    - `file_name`: a file name or a list of them
+    - `tenant`: a tenant id or a list of them
+    - `uploaded_after` / `uploaded_before`: epoch seconds or an ISO 8601 date,
+      both inclusive
+
+    Returns None for an empty spec. MetadataFilters are returned unchanged.
+    Raises ValueError for unknown fields or bad values.
+    """
+    if filters is None or isinstance(filters, MetadataFilters):
+        return filters
+    if not isinstance(filters, dict):
+        raise ValueError("filters must be an object")
+    unknown = sorted(set(filters) - set(FILTER_FIELDS))
+    if unknown:
+        raise ValueError(f"Unknown filter fields: {', '.join(unknown)}")
+
+    built = []
+    for field in ("file_name", TENANT_KEY):
+        if filters.get(field) is not None:
+            built.append(_match_values(field, filters[field]))
+    for field, operator in (
+        ("uploaded_after", FilterOperator.GTE),
+        ("uploaded_before", FilterOperator.LTE),
+    ):
+        if filters.get(field) is not None:
+            built.append(
+                MetadataFilter(
+                    key=UPLOADED_AT_KEY,
+                    value=_timestamp(field, filters[field]),
+                    operator=operator,
+                )
+            )
+    if not built:
+        return None
+    return MetadataFilters(filters=built)
+
+
+def tenant_scoped_filters(filters, tenant):
+    """
+    `build_metadata_filters(filters)`, restricted to the documents `tenant`
+    may search: the shared ones of the default tenant and its own uploads.
+    A `tenant` in `filters` may narrow that down, and raises ValueError if it
+    names any other tenant.
+
+    Chunks indexed before they carried a `tenant` count as the default
+    tenant's, through an IS_EMPTY filter on `tenant`.
+    """
+    if isinstance(filters, MetadataFilters):
+        raise ValueError("filters must be a filter spec to be scoped to a tenant")
+    filters = dict(filters or {})
+    # Validates the spec, including the type of `tenant`
+    build_metadata_filters(filters)
+    allowed = {DEFAULT_TENANT, tenant}
+    requested = filters.pop(TENANT_KEY, None)
+    if requested is None:
+        requested = sorted(allowed)
+    tenants = {requested} if isinstance(requested, str) else set(requested)
+    if not tenants <= allowed:
+        raise ValueError("filters may only name the tenant of X-Tenant-Id")
+    tenant_filter = _match_values(TENANT_KEY, requested)
+    if DEFAULT_TENANT in tenants:
+        tenant_filter = MetadataFilters(
+            filters=[
+                tenant_filter,
+                MetadataFilter(
+                    key=TENANT_KEY, value=None, operator=FilterOperator.IS_EMPTY
+                ),
+            ],
+            condition=FilterCondition.OR,
+        )
+    built = build_metadata_filters(filters)
+    return MetadataFilters(filters=[*(built.filters if built else []), tenant_filter])
+
+
+def filters_key(filters):
+    """
+    A canonical string for `filters` (a spec or MetadataFilters), for cache
+    and coalescing keys. Empty for no filters.
+    """
+    metadata_filters = build_metadata_filters(filters)
+    if metadata_filters is None:
+        return ""
+    return json.dumps(metadata_filters.model_dump(mode="json"), sort_keys=True)
@@ -0,0 +1,138 @@
+import math
+import threading
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+
+
+def _format_labels(labels, extra=None):
+    items = list((labels or {}).items()) + list((extra or {}).items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}"
+
+
+class Histogram:
+    """
+    A thread-safe, Prometheus-style cumulative histogram.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, description="", buckets=DEFAULT_BUCKETS, labels=None):
+        self.name = name
+        self.description = description
+        self.labels = dict(labels or {})
+        self.buckets = tuple(sorted(set(buckets) | {math.inf}))
+        self._counts = [0] * len(self.buckets)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self._sum += value
+            self._count += 1
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self._counts[i] += 1
+                    break
+
+    def snapshot(self):
+        with self._lock:
+            cumulative, total = [], 0
+            for count in self._counts:
+                total += count
+                cumulative.append(total)
+            return {
+                "buckets": list(zip(self.buckets, cumulative)),
+                "sum": self._sum,
+                "count": self._count,
+            }
+
+    def samples(self):
+        snap = self.snapshot()
+        lines = []
+        for bound, count in snap["buckets"]:
+            le = "+Inf" if bound == math.inf else repr(float(bound))
+            labels = _format_labels(self.labels, {"le": le})
+            lines.append(f"{self.name}_bucket{labels} {count}")
+        labels = _format_labels(self.labels)
+        lines.append(f"{self.name}_sum{labels} {snap['sum']}")
+        lines.append(f"{self.name}_count{labels} {snap['count']}")
+        return lines
+
+
+class Counter:
+    """
+    A thread-safe, Prometheus-style monotonically increasing counter.
+    """
+
+    type = "counter"
+
+    def __init__(self, name, description="", labels=None):
+        self.name = name
+        self.description = description
+        self.labels = dict(labels or {})
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        with self._lock:
+            return self._value
+
+    def samples(self):
+        return [f"{self.name}{_format_labels(self.labels)} {self.value}"]
+
+
+_metrics = {}
+_lock = threading.Lock()
+
+
+def _get_or_create(cls, name, labels, **kwargs):
+    key = (name, tuple(sorted((labels or {}).items())))
+    with _lock:
+        if key not in _metrics:
+            _metrics[key] = cls(name, labels=labels, **kwargs)
+        return _metrics[key]
+
+
+def histogram(name, description="", buckets=DEFAULT_BUCKETS, labels=None):
+    """
+    Returns the process-wide histogram called `name` with `labels`, creating
+    it on first use.
+    """
+    return _get_or_create(
+        Histogram, name, labels, description=description, buckets=buckets
+    )
+
+
+def counter(name, description="", labels=None):
+    """
+    Returns the process-wide counter called `name` with `labels`, creating it
+    on first use.
+    """
+    return _get_or_create(Counter, name, labels, description=description)
+
+
+def render_prometheus():
+    with _lock:
+        metrics = list(_metrics.values())
+    lines, seen = [], set()
+    for metric in sorted(metrics, key=lambda m: m.name):
+        if metric.name not in seen:
+            seen.add(metric.name)
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+TIME_TO_FIRST_TOKEN = histogram(
+    "rag_time_to_first_token_seconds",
+    "Seconds from receiving a streaming query to emitting its first answer token.",
+)
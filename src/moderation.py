@@ -0,0 +1,235 @@
+import re
+import json
+import math
+from collections import deque
+from functools import lru_cache
+from typing import List, NamedTuple
+
+from metrics import counter
+from tracing import span
+
+VERDICT_ALLOW = "allow"
+VERDICT_BORDERLINE = "borderline"
+VERDICT_BLOCK = "block"
+
+CLEAN_QUERY_REPLY = "The query contains no inappropriate language."
+BLOCKED_QUERY_REPLY = (
+    "Your query contains language that is not appropriate here. Please keep "
+    "the conversation respectful and rephrase your question."
+)
+
+LEET = str.maketrans(
+    {
+        "0": "o",
+        "1": "i",
+        "3": "e",
+        "4": "a",
+        "5": "s",
+        "7": "t",
+        "8": "b",
+        "@": "a",
+        "$": "s",
+        "!": "i",
+        "|": "l",
+    }
+)
+# Suffixes allowed after a lexicon term, so "idiots" matches "idiot"
+SUFFIXES = ("", "s", "es", "ed", "er", "ers", "ing", "y")
+
+_LEET_CHAR = re.compile(r"[0134578@$!|]")
+# Tokens holding a character LEET maps
+_LEET_TOKEN = re.compile(r"\S*[0134578@$!|]\S*")
+_SPACED_LETTERS = re.compile(r"(?<![a-z])(?:[a-z][\s.\-_*+]+){2,}[a-z](?![a-z])")
+_SEPARATORS = re.compile(r"[\s.\-_*+]+")
+_ELONGATED = re.compile(r"([a-z])\1{2,}")
+_NON_LETTERS = re.compile(r"[^a-z]+")
+
+
+def _unleet(match):
+    token = match.group(0)
+    # Only inside words, so plain numbers are left alone
+    return token.translate(LEET) if re.search(r"[a-z]", token) else token
+
+
+def normalize_text(text):
+    """
+    Folds the usual obfuscations, so the matcher sees plain words:
+    leetspeak ("h4t3" -> "hate"), letters spaced or dotted apart
+    ("s t u p i d" -> "stupid") and elongated letters ("stuuupid" ->
+    "stupid"). Anything else that is not a letter becomes a single space.
+    """
+    text = text.casefold()
+    if _LEET_CHAR.search(text):
+        text = _LEET_TOKEN.sub(_unleet, text)
+    text = _SPACED_LETTERS.sub(lambda m: _SEPARATORS.sub("", m.group(0)), text)
+    text = _ELONGATED.sub(r"\1", text)
+    return " " + _NON_LETTERS.sub(" ", text).strip() + " "
+
+
+class AhoCorasick:
+    """
+    Multi-pattern matcher. Finds every occurrence of every pattern in one
+    pass over the text, however many patterns there are.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for pattern_id, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            self._out[state].append(pattern_id)
+
+        # Breadth-first, so fail links of shallower states are ready first
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, next_state in self._goto[state].items():
+                pending.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                if self._fail[next_state] == next_state:
+                    self._fail[next_state] = 0
+                self._out[next_state] += self._out[self._fail[next_state]]
+
+    def iter_matches(self, text):
+        """Yields `(end, pattern_id)` for each match, `end` exclusive."""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern_id in out[state]:
+                yield i + 1, pattern_id
+
+
+class ModerationResult(NamedTuple):
+    verdict: str
+    score: float
+    matches: List[str]
+
+
+class Moderator:
+    """
+    Local content moderation for queries.
+
+    Lexicon terms are matched as whole words, after normalization, with one
+    Aho-Corasick pass. Each term carries the weight of its severity. The
+    optional classifier is a logistic model over the query's words. It
+    catches hostile queries that use no lexicon term, such as insults aimed
+    at the assistant. The score is the higher of the two. Scores of at least
+    `block_threshold` are blocked, scores below `allow_threshold` are
+    allowed, and scores in between are borderline and left for the LLM to
+    judge.
+    """
+
+    def __init__(
+        self, lexicon, block_threshold=0.8, allow_threshold=0.4, use_classifier=True
+    ):
+        self.block_threshold = block_threshold
+        self.allow_threshold = allow_threshold
+        severity = lexicon["severity"]
+        terms = {}
+        for level, level_terms in lexicon["terms"].items():
+            for term in level_terms:
+                key = normalize_text(term).strip()
+                terms[key] = max(terms.get(key, 0.0), severity[level])
+        self.terms = list(terms)
+        self.weights = [terms[term] for term in self.terms]
+        self._matcher = AhoCorasick(self.terms)
+
+        classifier = lexicon.get("classifier") if use_classifier else None
+        self.classifier_bias = (classifier or {}).get("bias", 0.0)
+        self.classifier_weights = (classifier or {}).get("weights", {})
+        self.use_classifier = bool(self.classifier_weights)
+
+    def _is_word_match(self, text, end, term):
+        start = end - len(term)
+        if text[start - 1] != " ":
+            return False
+        rest = text[end : end + 4]
+        return any(rest.startswith(suffix + " ") for suffix in SUFFIXES)
+
+    def _classifier_score(self, text):
+        weights = self.classifier_weights
+        z = self.classifier_bias + sum(
+            weights.get(word, 0.0) for word in set(text.split())
+        )
+        return 1.0 / (1.0 + math.exp(-z))
+
+    def check(self, query_str):
+        text = normalize_text(query_str)
+        score, matches = 0.0, []
+        for end, term_id in self._matcher.iter_matches(text):
+            term = self.terms[term_id]
+            if self._is_word_match(text, end, term):
+                matches.append(term)
+                score = max(score, self.weights[term_id])
+        if self.use_classifier:
+            score = max(score, self._classifier_score(text))
+
+        if score >= self.block_threshold:
+            verdict = VERDICT_BLOCK
+        elif score >= self.allow_threshold:
+            verdict = VERDICT_BORDERLINE
+        else:
+            verdict = VERDICT_ALLOW
+        return ModerationResult(verdict, score, matches)
+
+    def moderate(self, query_str):
+        """`check`, recorded as a tracing stage and counted by verdict."""
+        with span("moderation"):
+            result = self.check(query_str)
+        counter(
+            "rag_moderation_verdicts_total",
+            "Local moderation verdicts.",
+            labels={"verdict": result.verdict},
+        ).inc()
+        return result
+
+
+def local_moderation_reply(query_str):
+    """
+    The moderation reply for a query that local moderation can decide, or
+    None if moderation is disabled or the query is borderline.
+    """
+    moderator = get_moderator()
+    if moderator is None:
+        return None
+    result = moderator.moderate(query_str)
+    if result.verdict == VERDICT_ALLOW:
+        return CLEAN_QUERY_REPLY
+    if result.verdict == VERDICT_BLOCK:
+        return BLOCKED_QUERY_REPLY
+    return None
+
+
+@lru_cache
+def get_moderator():
+    """
+    The process-wide Moderator built from `moderation` in the config, or
+    None if local moderation is disabled.
+    """
+    ncert_search = json.load(open("./config/ncert_search.json"))
+    moderation_config = ncert_search.get("moderation", {})
+    if not moderation_config.get("enabled", False):
+        return None
+    with open(moderation_config["lexicon_path"]) as f:
+        lexicon = json.load(f)
+    return Moderator(
+        lexicon,
+        block_threshold=moderation_config.get("block_threshold", 0.8),
+        allow_threshold=moderation_config.get("allow_threshold", 0.4),
+        use_classifier=moderation_config.get("classifier", True),
+    )
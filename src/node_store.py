@@ -0,0 +1,211 @@
+import os
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, List, Optional
+
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import (
+    NodeRelationship,
+    NodeWithScore,
+    QueryBundle,
+    RelatedNodeInfo,
+    TextNode,
+)
+from llama_index.core.vector_stores.utils import (
+    metadata_dict_to_node,
+    node_to_metadata_dict,
+)
+
+from metadata_filters import TENANT_KEY, UPLOADED_AT_KEY
+from tracing import record_cache, span
+
+# SQLite limits the number of bound parameters per statement
+LOOKUP_BATCH_SIZE = 500
+# Vector metadata in slim mode, besides the document id: the filter fields
+DEFAULT_SLIM_METADATA_KEYS = ["file_name", TENANT_KEY, UPLOADED_AT_KEY]
+# Source document id, kept on slim vectors so delete-by-document still works
+DOC_ID_KEY = "doc_id"
+
+
+def slim_metadata(node, keys):
+    """The vector metadata of `node` in slim mode: `keys` and its document id."""
+    metadata = {key: node.metadata[key] for key in keys if key in node.metadata}
+    metadata[DOC_ID_KEY] = node.ref_doc_id or "None"
+    return metadata
+
+
+def node_from_slim_metadata(node_id, metadata):
+    """A text-less node from slim vector metadata, to be hydrated later."""
+    metadata = dict(metadata or {})
+    doc_id = metadata.pop(DOC_ID_KEY, "None")
+    relationships = {}
+    if doc_id != "None":
+        relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id=doc_id)
+    return TextNode(
+        id_=node_id, text="", metadata=metadata, relationships=relationships
+    )
+
+
+class NodeStore:
+    """
+    Chunk text and metadata by node id, for vector stores that only keep
+    ids and filter fields ("slim vectors").
+
+    Nodes are stored as JSON in SQLite, the way vector stores serialize
+    them, without their embedding. Recently read nodes are kept in an
+    in-memory LRU of `cache_entries`. Node ids are derived from the chunk
+    content, so a cached node never goes stale; a deleted one is simply no
+    longer returned by the vector store.
+    """
+
+    def __init__(self, path, cache_entries=4096):
+        self.path = path
+        self.cache_entries = cache_entries
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS nodes (id TEXT PRIMARY KEY, node TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
+
+    def put_many(self, nodes):
+        rows = [
+            (
+                node.node_id,
+                json.dumps(node_to_metadata_dict(node, remove_text=False)),
+            )
+            for node in nodes
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO nodes (id, node) VALUES (?, ?)", rows
+            )
+            self._conn.commit()
+            for node_id, _ in rows:
+                self._cache.pop(node_id, None)
+
+    def get_many(self, node_ids):
+        """
+        Returns {node_id: node} for the stored ones among `node_ids`, read
+        with one query per `LOOKUP_BATCH_SIZE` ids not in the cache. Each
+        call gets fresh node objects, which callers may modify.
+        """
+        node_ids = list(dict.fromkeys(node_ids))
+        found = {}
+        with self._lock:
+            missing = []
+            for node_id in node_ids:
+                stored = self._cache.get(node_id)
+                if stored is None:
+                    missing.append(node_id)
+                else:
+                    self._cache.move_to_end(node_id)
+                    found[node_id] = stored
+            memory_hits = len(found)
+            for i in range(0, len(missing), LOOKUP_BATCH_SIZE):
+                batch = missing[i : i + LOOKUP_BATCH_SIZE]
+                found.update(
+                    self._conn.execute(
+                        "SELECT id, node FROM nodes WHERE id IN "
+                        f"({', '.join('?' * len(batch))})",
+                        batch,
+                    ).fetchall()
+                )
+            for node_id in missing:
+                if node_id in found:
+                    self._cache[node_id] = found[node_id]
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        record_cache("node_store", "memory_hit", memory_hits)
+        record_cache("node_store", "disk_hit", len(found) - memory_hits)
+        record_cache("node_store", "miss", len(node_ids) - len(found))
+        return {
+            node_id: metadata_dict_to_node(json.loads(stored))
+            for node_id, stored in found.items()
+        }
+
+    def delete_many(self, node_ids):
+        node_ids = list(node_ids)
+        with self._lock:
+            for i in range(0, len(node_ids), LOOKUP_BATCH_SIZE):
+                batch = node_ids[i : i + LOOKUP_BATCH_SIZE]
+                self._conn.execute(
+                    f"DELETE FROM nodes WHERE id IN ({', '.join('?' * len(batch))})",
+                    batch,
+                )
+            self._conn.commit()
+            for node_id in node_ids:
+                self._cache.pop(node_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM nodes")
+            self._conn.commit()
+            self._cache.clear()
+
+
+class NodeHydrator(BaseNodePostprocessor):
+    """
+    Swaps the text-less nodes returned by a slim vector store for their full
+    copies from the node store, in one bulk lookup. Nodes the store does not
+    have, such as BM25 hits or vectors upserted before slim mode, are kept.
+    """
+
+    node_store: Any = None
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "NodeHydrator"
+
+    def _postprocess_nodes(
+        self, nodes: List[NodeWithScore], query_bundle: Optional[QueryBundle] = None
+    ) -> List[NodeWithScore]:
+        with span("node_store.hydrate"):
+            stored = self.node_store.get_many(
+                [node_with_score.node.node_id for node_with_score in nodes]
+            )
+        for node_with_score in nodes:
+            node = stored.get(node_with_score.node.node_id)
+            if node is not None:
+                node_with_score.node = node
+        return nodes
+
+
+def get_slim_vectors_config(ncert_search):
+    """The `slim_vectors` config, or None unless it is enabled for Pinecone."""
+    slim_config = ncert_search.get("slim_vectors", {})
+    if not slim_config.get("enabled", False):
+        return None
+    # The local vector store keeps nodes on this host already
+    if ncert_search.get("vector_store", "pinecone") != "pinecone":
+        return None
+    return slim_config
+
+
+@lru_cache
+def get_node_store(namespace):
+    """
+    The process-wide NodeStore for `namespace`, or None unless slim vectors
+    are enabled.
+    """
+    ncert_search = json.load(open("./config/ncert_search.json"))
+    slim_config = get_slim_vectors_config(ncert_search)
+    if slim_config is None:
+        return None
+    return NodeStore(
+        os.path.join(
+            slim_config.get("node_store_path", "./storage/nodes"),
+            f"{namespace or 'default'}.sqlite",
+        ),
+        cache_entries=slim_config.get("cache_entries", 4096),
+    )
@@ -0,0 +1,228 @@
+import re
+import json
+import asyncio
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+import numpy as np
+from llama_index.core.settings import Settings
+
+from embedding_cache import normalize_query
+from metrics import counter
+from service_config import service_config
+from tracing import current_trace, span
+
+ROUTE_TEMPLATE = "template"
+ROUTE_RETRIEVAL = "retrieval"
+ROUTE_AGENT = "agent"
+
+# Small talk answered without any model call, matched against the whole query
+TEMPLATE_REPLIES = [
+    (
+        re.compile(
+            r"(hi|hello|hey|hii+|namaste|greetings|good (morning|afternoon|evening))"
+            r"( there| bot| agent)?"
+        ),
+        "Hello! Ask me a question about the uploaded NCERT material and I will "
+        "answer it from the documents.",
+    ),
+    (
+        re.compile(r"(how are you( doing)?|how's it going|what's up|sup)"),
+        "I'm doing well, thank you! What would you like to learn about today?",
+    ),
+    (
+        re.compile(r"(thanks|thank you|thank you so much|thx|ty)( a lot)?"),
+        "You're welcome! Feel free to ask another question.",
+    ),
+    (
+        re.compile(r"(bye|goodbye|see you|see ya|good night)( later)?"),
+        "Goodbye! Come back any time you have a question.",
+    ),
+    (
+        re.compile(
+            r"(who are you|what are you|what can you do|help|what is your name"
+            r"|what's your name)"
+        ),
+        "I'm an assistant for NCERT study material. Ask me to explain a "
+        "concept, define a term or summarize a topic, and I will answer from "
+        "the indexed documents.",
+    ),
+]
+
+QUESTION_WORDS = {
+    "what",
+    "why",
+    "how",
+    "when",
+    "where",
+    "which",
+    "who",
+    "whom",
+    "whose",
+    "explain",
+    "define",
+    "describe",
+    "list",
+    "compare",
+    "state",
+    "derive",
+    "name",
+    "differentiate",
+    "distinguish",
+    "summarize",
+    "summarise",
+    "give",
+}
+# Queries that address the assistant are left to the agent
+PERSONAL_WORDS = {"i", "me", "my", "you", "your", "we", "us"}
+
+# Reference queries for the embedding classifier
+KNOWLEDGE_EXAMPLES = [
+    "What is sound propagation?",
+    "Explain the structure of an atom.",
+    "Define photosynthesis.",
+    "Why does ice float on water?",
+    "Describe the process of digestion in humans.",
+    "What are the laws of motion?",
+    "Difference between speed and velocity",
+    "Newton's third law examples",
+    "causes of the French revolution",
+    "properties of acids and bases",
+]
+OTHER_EXAMPLES = [
+    "Tell me a joke.",
+    "Write a poem about the sea.",
+    "Can you help me with something?",
+    "I am bored.",
+    "What do you think about me?",
+    "Are you a robot?",
+    "ok",
+    "Let's chat.",
+    "You are stupid.",
+    "Translate this sentence to French.",
+]
+
+
+class RouteDecision(NamedTuple):
+    route: str
+    reason: str
+    reply: Optional[str] = None
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+class QueryRouter:
+    """
+    Decides, before the ReAct agent runs, how a query is answered:
+
+    - `template`: small talk, answered from a fixed reply
+    - `retrieval`: a plain knowledge question, answered directly by the
+      retrieval engine, skipping the agent's tool-selection and final-answer
+      LLM calls
+    - `agent`: anything else, handled by the full agent
+
+    Rules come first. A query they cannot place is compared with reference
+    knowledge questions and reference other queries by embedding similarity,
+    if the classifier is enabled. The query embedding is cached, so retrieval
+    reuses it.
+    """
+
+    def __init__(self, min_words=3, classifier=None):
+        classifier = classifier or {}
+        self.min_words = min_words
+        self.classifier_enabled = classifier.get("enabled", False)
+        self.min_similarity = classifier.get("min_similarity", 0.3)
+        self.margin = classifier.get("margin", 0.05)
+        self._references = None
+
+    def _match_rules(self, query_str):
+        text = normalize_query(query_str)
+        bare = re.sub(r"[\s!.?,]+$", "", text)
+        for pattern, reply in TEMPLATE_REPLIES:
+            if pattern.fullmatch(bare):
+                return RouteDecision(ROUTE_TEMPLATE, "rule:small_talk", reply)
+        words = re.findall(r"[\w']+", text)
+        if (
+            len(words) >= self.min_words
+            and (words[0] in QUESTION_WORDS or text.endswith("?"))
+            and not PERSONAL_WORDS.intersection(words)
+        ):
+            return RouteDecision(ROUTE_RETRIEVAL, "rule:question")
+        return None
+
+    def _reference_embeddings(self):
+        if self._references is None:
+            service_config.configure_settings()
+            embed_model = Settings.embed_model
+            self._references = (
+                _normalize(embed_model.get_text_embedding_batch(KNOWLEDGE_EXAMPLES)),
+                _normalize(embed_model.get_text_embedding_batch(OTHER_EXAMPLES)),
+            )
+        return self._references
+
+    def _classify(self, query_embedding):
+        knowledge, other = self._reference_embeddings()
+        query = _normalize(query_embedding)
+        knowledge_sim = float(np.max(knowledge @ query))
+        other_sim = float(np.max(other @ query))
+        if (
+            knowledge_sim >= self.min_similarity
+            and knowledge_sim - other_sim >= self.margin
+        ):
+            return RouteDecision(ROUTE_RETRIEVAL, f"classifier:{knowledge_sim:.2f}")
+        return RouteDecision(
+            ROUTE_AGENT, f"classifier:{knowledge_sim:.2f}/{other_sim:.2f}"
+        )
+
+    def _log(self, query_str, decision):
+        print(f"Route {decision.route} ({decision.reason}) for query {query_str!r}")
+        counter(
+            "rag_route_decisions_total",
+            "Queries by the route chosen for them.",
+            labels={"route": decision.route},
+        ).inc()
+        request_trace = current_trace()
+        if request_trace is not None:
+            request_trace.count(f"route_{decision.route}")
+        return decision
+
+    def route(self, query_str):
+        with span("router"):
+            decision = self._match_rules(query_str)
+            if decision is None and self.classifier_enabled:
+                service_config.configure_settings()
+                decision = self._classify(
+                    Settings.embed_model.get_query_embedding(query_str)
+                )
+        return self._log(query_str, decision or RouteDecision(ROUTE_AGENT, "default"))
+
+    async def aroute(self, query_str):
+        with span("router"):
+            decision = self._match_rules(query_str)
+            if decision is None and self.classifier_enabled:
+                # Embeds the reference queries on first use
+                await asyncio.to_thread(self._reference_embeddings)
+                decision = self._classify(
+                    await Settings.embed_model.aget_query_embedding(query_str)
+                )
+        return self._log(query_str, decision or RouteDecision(ROUTE_AGENT, "default"))
+
+
+@lru_cache
+def get_query_router():
+    """
+    The process-wide QueryRouter built from `router` in the config, or None
+    if routing is disabled and every query goes to the agent.
+    """
+    ncert_search = json.load(open("./config/ncert_search.json"))
+    router_config = ncert_search.get("router", {})
+    if not router_config.get("enabled", False):
+        return None
+    return QueryRouter(
+        min_words=router_config.get("min_words", 3),
+        classifier=router_config.get("classifier"),
+    )
@@ -0,0 +1,138 @@
+import math
+from collections import Counter
+from typing import List, Optional
+
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import NodeWithScore, QueryBundle
+
+from hybrid_retriever import tokenize
+
+# Scores are not comparable across rerankers: LexicalReranker blends a min-max
+# normalized retrieval score with term coverage, Cohere returns relevance
+# probabilities that are low for anything off topic.
+DEFAULT_SCORE_CUTOFFS = {"lexical": 0.3, "cohere": 0.05}
+
+
+def _bigrams(tokens):
+    return set(zip(tokens, tokens[1:]))
+
+
+class LexicalReranker(BaseNodePostprocessor):
+    """
+    CPU-only reranker that rescores retrieval candidates with lexical and
+    cross features between the query and each chunk:
+
+    - the first-stage retrieval score, min-max normalized over the candidates
+    - IDF-weighted coverage of the query terms, with IDF taken over the
+      candidate set
+    - saturated term frequency of the query terms
+    - share of query bigrams that appear verbatim (formula or chapter names)
+
+    The final score is a weighted sum in [0, 1] and the best `top_n` nodes
+    are kept.
+    """
+
+    top_n: int = 5
+    retrieval_weight: float = 0.4
+    coverage_weight: float = 0.3
+    frequency_weight: float = 0.2
+    phrase_weight: float = 0.1
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LexicalReranker"
+
+    def _postprocess_nodes(
+        self, nodes: List[NodeWithScore], query_bundle: Optional[QueryBundle]
+    ) -> List[NodeWithScore]:
+        if query_bundle is None or not nodes:
+            return nodes[: self.top_n]
+        query_tokens = tokenize(query_bundle.query_str)
+        query_terms = set(query_tokens)
+        query_bigrams = _bigrams(query_tokens)
+
+        node_tokens = [tokenize(n.node.get_content()) for n in nodes]
+        node_tfs = [Counter(tokens) for tokens in node_tokens]
+        idf = {
+            term: math.log(1 + len(nodes) / (1 + sum(term in tf for tf in node_tfs)))
+            for term in query_terms
+        }
+        total_idf = sum(idf.values()) or 1.0
+
+        scores = [n.score or 0.0 for n in nodes]
+        low, high = min(scores), max(scores)
+
+        reranked = []
+        for node, tokens, tf, score in zip(nodes, node_tokens, node_tfs, scores):
+            retrieval = (score - low) / (high - low) if high > low else 1.0
+            coverage = sum(idf[t] for t in query_terms if tf[t]) / total_idf
+            frequency = sum(idf[t] * tf[t] / (tf[t] + 1.0) for t in query_terms)
+            frequency /= total_idf
+            phrase = (
+                len(query_bigrams & _bigrams(tokens)) / len(query_bigrams)
+                if query_bigrams
+                else 0.0
+            )
+            new_score = (
+                self.retrieval_weight * retrieval
+                + self.coverage_weight * coverage
+                + self.frequency_weight * frequency
+                + self.phrase_weight * phrase
+            )
+            reranked.append(NodeWithScore(node=node.node, score=new_score))
+
+        reranked.sort(key=lambda n: n.score, reverse=True)
+        return reranked[: self.top_n]
+
+
+class ScoreCutoffPostprocessor(BaseNodePostprocessor):
+    """
+    Drops nodes scoring below `similarity_cutoff`, but always keeps the best
+    `min_keep` so a strict cutoff never leaves the synthesizer with nothing.
+    """
+
+    similarity_cutoff: float = 0.0
+    min_keep: int = Field(default=1, ge=0)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ScoreCutoffPostprocessor"
+
+    def _postprocess_nodes(
+        self, nodes: List[NodeWithScore], query_bundle: Optional[QueryBundle]
+    ) -> List[NodeWithScore]:
+        nodes = sorted(nodes, key=lambda n: n.score or 0.0, reverse=True)
+        kept = [n for n in nodes if (n.score or 0.0) >= self.similarity_cutoff]
+        return kept if len(kept) >= self.min_keep else nodes[: self.min_keep]
+
+
+def get_reranker(reranker_config, top_n):
+    """
+    Builds the reranker selected by `reranker.type` in the config: `lexical`
+    (default, local) or `cohere` (hosted, needs COHERE_API_KEY).
+    """
+    reranker_type = reranker_config.get("type", "lexical")
+    if reranker_type == "lexical":
+        return LexicalReranker(top_n=top_n)
+    if reranker_type == "cohere":
+        from llama_index.postprocessor.cohere_rerank import CohereRerank
+
+        return CohereRerank(
+            top_n=top_n, model=reranker_config.get("model", "rerank-english-v3.0")
+        )
+    raise NotImplementedError(f"Reranker {reranker_type} not implemented")
+
+
+def get_score_cutoff(reranker_config):
+    """
+    The cutoff for reranked scores, from `reranker.score_cutoff`: a number,
+    or one per reranker type.
+    """
+    reranker_type = reranker_config.get("type", "lexical")
+    score_cutoff = reranker_config.get("score_cutoff", DEFAULT_SCORE_CUTOFFS)
+    if isinstance(score_cutoff, dict):
+        return score_cutoff.get(
+            reranker_type, DEFAULT_SCORE_CUTOFFS.get(reranker_type, 0.0)
+        )
+    return score_cutoff
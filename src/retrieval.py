@@ -9,13 +9,54 @@ from service_config import service_config
 
 from llama_index.core.query_engine import RetrieverQueryEngine
 from llama_index.core.retrievers import VectorIndexRetriever
+from indexer import load_rag_index
 import os
+import json
+import time
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from metrics import TIME_TO_FIRST_TOKEN
+from tracing import record_cache, span
+from answer_cache import get_answer_cache
+from embedding_cache import (
+    aget_query_embedding_batch,
+    get_query_embedding_batch,
+    normalize_query,
+)
+from rerankers import ScoreCutoffPostprocessor, get_reranker, get_score_cutoff
+from context_packer import get_context_packer
+from single_flight import get_single_flight
+from metadata_filters import build_metadata_filters, filters_key
+from node_store import NodeHydrator, get_node_store
+from hybrid_retriever import (
+    BM25Retriever,
+    HybridRetriever,
+    get_bm25_index,
+    get_hybrid_config,
+)
 from dotenv import load_dotenv, find_dotenv
 from llama_index.core.settings import Settings
 
 # _ = load_dotenv(find_dotenv())
 
 
+class TracedRetrieverQueryEngine(RetrieverQueryEngine):
+    """RetrieverQueryEngine that records a tracing stage per postprocessor."""
+
+    def _apply_node_postprocessors(
+        self, nodes: List[NodeWithScore], query_bundle: QueryBundle
+    ) -> List[NodeWithScore]:
+        for node_postprocessor in self._node_postprocessors:
+            with span(f"postprocess.{type(node_postprocessor).__name__}"):
+                nodes = node_postprocessor.postprocess_nodes(
+                    nodes, query_bundle=query_bundle
+                )
+        return nodes
+
+
 class LLMIncludeALLFieldsPostprocessor(BaseNodePostprocessor):
     exclude_keys_to_allow_all: list[str] = []
 
@@ -35,6 +76,7 @@ class LLMIncludeALLFieldsPostprocessor(BaseNodePostprocessor):
 
 SIMILARITY_TOP_K = service_config.ncert_search["similarity_top_k"]
 LONG_ANSW_TOP_K = service_config.ncert_search["long_answ_top_k"]
+RERANKER_CONFIG = service_config.ncert_search.get("reranker", {})
 llm_field_postprocessor = LLMIncludeALLFieldsPostprocessor(
     exclude_keys_to_allow_all=service_config.ncert_search["exclude_keys_to_allow_all"]
 )
@@ -42,51 +84,235 @@ llm_field_postprocessor = LLMIncludeALLFieldsPostprocessor(
 post_processors = [llm_field_postprocessor]
 
 
+def get_post_processors(similarity_top_k, response_mode=None, namespace=None):
+    """
+    With reranking enabled, the retriever fetches `long_answ_top_k`
+    candidates; they are reranked, cut at `reranker.score_cutoff` and only
+    the best `similarity_top_k` reach the synthesizer.
+
+    With context packing enabled, the chunks are then merged and fitted into
+    the token budget of `response_mode`.
+
+    With slim vectors, the text-less nodes of `namespace` are hydrated from
+    the node store first, since everything after needs their text.
+    """
+    if not RERANKER_CONFIG.get("enabled", False):
+        selected = list(post_processors)
+    else:
+        selected = [
+            get_reranker(RERANKER_CONFIG, top_n=similarity_top_k),
+            ScoreCutoffPostprocessor(
+                similarity_cutoff=get_score_cutoff(RERANKER_CONFIG)
+            ),
+            llm_field_postprocessor,
+        ]
+    # Runs last, so it sees the metadata the LLM will actually get
+    context_packer = get_context_packer(service_config.ncert_search, response_mode)
+    if context_packer is not None:
+        selected.append(context_packer)
+    node_store = get_node_store(namespace or service_config.ncert_search["namespace"])
+    if node_store is not None:
+        selected.insert(0, NodeHydrator(node_store=node_store))
+    return selected
+
+
+# compact_accumulate answers every chunk separately and cannot be streamed, so
+# streaming queries pack the context into a single answer instead.
+STREAMING_RESPONSE_MODE = service_config.ncert_search.get(
+    "streaming_response_mode", "compact"
+)
+
+
+def batch_limits(retrieval_concurrency=None, synthesis_concurrency=None):
+    """Concurrency limits for batch queries, defaulting to `batch` in the config."""
+    batch_config = service_config.ncert_search.get("batch", {})
+    return (
+        retrieval_concurrency or batch_config.get("retrieval_concurrency", 16),
+        synthesis_concurrency or batch_config.get("synthesis_concurrency", 4),
+    )
+
+
 EMPTY_RESPONSE_REPLY_STR = """Your query did not receive a response from our server.
 
 This might occur if there is no relevant information for your query or if the query is too vague. Please try again by framing your query as a direct question."""
 
 
 class SimpleRetrieverGeneration:
-    def __init__(self, response_mode="compact_accumulate") -> None:
-        SIMILARITY_TOP_K = service_config.ncert_search["similarity_top_k"]
-        self.post_processors = post_processors
+    def __init__(
+        self,
+        response_mode="compact_accumulate",
+        index=None,
+        similarity_top_k=None,
+        namespace=None,
+        index_name=None,
+    ) -> None:
+        SIMILARITY_TOP_K = (
+            similarity_top_k or service_config.ncert_search["similarity_top_k"]
+        )
+        candidate_top_k = (
+            max(LONG_ANSW_TOP_K, SIMILARITY_TOP_K)
+            if RERANKER_CONFIG.get("enabled", False)
+            else SIMILARITY_TOP_K
+        )
+        self.similarity_top_k = SIMILARITY_TOP_K
+        self.namespace = namespace or service_config.ncert_search["namespace"]
+        self.index_name = index_name or service_config.ncert_search["index_name"]
+        self.post_processors = get_post_processors(
+            SIMILARITY_TOP_K, response_mode, self.namespace
+        )
+        self.index = index or service_config.system_indexer
+        self.candidate_top_k = candidate_top_k
         self.simple_retriever = VectorIndexRetriever(
-            index=service_config.system_indexer, similarity_top_k=SIMILARITY_TOP_K
+            index=self.index,
+            similarity_top_k=candidate_top_k,
+            callback_manager=Settings.callback_manager,
         )
+        self.retriever = self.create_retriever(candidate_top_k)
         self.query_classification_model_name = service_config.ncert_search[
             "query_classification_model_name"
         ]
         self.response_mode = response_mode
         self.query_engine = self.create_query_engine()
+        self._streaming_query_engine = None
 
-    def create_query_engine(self):
+    def create_retriever(self, similarity_top_k, filters=None):
+        """
+        Dense retriever, or dense + BM25 fusion if hybrid is on for the
+        namespace. With `filters` (MetadataFilters), both only search the
+        nodes whose metadata matches.
+        """
+        hybrid_config = get_hybrid_config(self.namespace)
+        dense_retriever = self.simple_retriever
+        if filters is not None:
+            dense_retriever = VectorIndexRetriever(
+                index=self.index,
+                similarity_top_k=similarity_top_k,
+                filters=filters,
+                callback_manager=Settings.callback_manager,
+            )
+        if hybrid_config is None:
+            return dense_retriever
+        dense_retriever.similarity_top_k = max(
+            hybrid_config.get("dense_top_k", 2 * similarity_top_k), similarity_top_k
+        )
+        sparse_retriever = BM25Retriever(
+            get_bm25_index(self.namespace),
+            similarity_top_k=max(
+                hybrid_config.get("sparse_top_k", 2 * similarity_top_k),
+                similarity_top_k,
+            ),
+            filters=filters,
+            callback_manager=Settings.callback_manager,
+        )
+        return HybridRetriever(
+            dense_retriever,
+            sparse_retriever,
+            similarity_top_k=similarity_top_k,
+            rrf_k=hybrid_config.get("rrf_k", 60),
+            callback_manager=Settings.callback_manager,
+        )
+
+    def create_query_engine(self, streaming=False):
         prompt_helper = None
         Settings.llm = service_config.MODEL
         response_synthesizer = get_response_synthesizer(
-            response_mode=self.response_mode,
-            use_async=False,
-            streaming=False,
+            response_mode=STREAMING_RESPONSE_MODE if streaming else self.response_mode,
+            use_async=service_config.ncert_search.get("use_async", True),
+            streaming=streaming,
             text_qa_template=QA_PROMPT_TMPL,
             prompt_helper=prompt_helper,
         )
-        simple_query_engine = RetrieverQueryEngine(
-            retriever=self.simple_retriever,
+        simple_query_engine = TracedRetrieverQueryEngine(
+            retriever=self.retriever,
             response_synthesizer=response_synthesizer,
-            node_postprocessors=self.post_processors,
+            node_postprocessors=(
+                get_post_processors(
+                    self.similarity_top_k, STREAMING_RESPONSE_MODE, self.namespace
+                )
+                if streaming
+                else self.post_processors
+            ),
         )
         return simple_query_engine
 
+    @property
+    def streaming_query_engine(self):
+        if self._streaming_query_engine is None:
+            self._streaming_query_engine = self.create_query_engine(streaming=True)
+        return self._streaming_query_engine
+
+    def get_query_engine(self, filters=None, streaming=False):
+        """
+        The query engine, restricted to the nodes matching `filters`
+        (MetadataFilters) if given. Filtered engines share the synthesizer
+        and postprocessors of the unfiltered one and are cheap to build, so
+        one is built per query.
+        """
+        query_engine = self.streaming_query_engine if streaming else self.query_engine
+        if filters is None:
+            return query_engine
+        return TracedRetrieverQueryEngine(
+            retriever=self.create_retriever(self.candidate_top_k, filters),
+            response_synthesizer=query_engine._response_synthesizer,
+            node_postprocessors=query_engine._node_postprocessors,
+        )
+
     def complete_query(self, query_str):
         response = service_config.MODEL.complete(
             query_clf_prompt.format(query_str=query_str)
         )
         return response.text
 
-    def get_query_response(self, query_str):
-        return self._get_query_response(query_str)
+    def _answer_scope(self, filters=None):
+        """
+        What an answer depends on besides the query and its namespace. Engines
+        for other indexes, response modes or top k, or other filters, neither
+        share in-flight queries nor cached answers.
+        """
+        return json.dumps(
+            [
+                self.index_name,
+                self.response_mode,
+                self.similarity_top_k,
+                filters_key(filters),
+            ]
+        )
+
+    def _flight_key(self, query_str, filters=None):
+        return (self.namespace, self._answer_scope(filters), normalize_query(query_str))
+
+    def get_query_response(self, query_str, filters=None):
+        """
+        Answers `query_str`. Concurrent calls for the same normalized query
+        and filters share one computation, if `coalescing` is enabled.
+
+        `filters` restricts retrieval to matching nodes; it is a spec for
+        `build_metadata_filters` or MetadataFilters.
+        """
+        filters = build_metadata_filters(filters)
+        single_flight = get_single_flight("retrieval")
+        if single_flight is None:
+            return self._get_query_response(query_str, filters)
+        return single_flight.do(
+            self._flight_key(query_str, filters),
+            self._get_query_response,
+            query_str,
+            filters,
+        )
 
-    def _get_query_response(self, query_str):
+    async def aget_query_response(self, query_str, filters=None):
+        filters = build_metadata_filters(filters)
+        single_flight = get_single_flight("retrieval")
+        if single_flight is None:
+            return await self._aget_query_response(query_str, filters)
+        return await single_flight.ado(
+            self._flight_key(query_str, filters),
+            self._aget_query_response,
+            query_str,
+            filters,
+        )
+
+    def _classify_query(self, query_str):
         # classify query
         extra_info = {"query_str": query_str}
         clf_model_name = self.query_classification_model_name
@@ -101,12 +327,16 @@ class SimpleRetrieverGeneration:
         #         False,
         #         extra_info,
         #     )
+        return extra_info
 
-        response = self.query_engine.query(query_str)
+    def _set_sources(self, response, extra_info):
         extra_info["sources"] = [
             {"file_name": x.node.metadata["file_name"], "score": x.score}
             for x in response.source_nodes
         ]
+
+    def _format_response(self, response, extra_info):
+        self._set_sources(response, extra_info)
         response = response.response
         extra_info["raw_response"] = response
         # extra_info["response_generation_model"] = model
@@ -119,36 +349,348 @@ class SimpleRetrieverGeneration:
         else:
             return response, True, extra_info
 
-    def get_retrieve_nodes(self, query_str):
-        nodes = self.simple_retriever.retrieve(QueryBundle(query_str))
+    def _cache_lookup(self, query_bundle, filters=None):
+        """
+        Returns `(cached_result, stamp)`. `stamp` must be passed back to
+        `_cache_store` so answers computed across an ingest are not cached.
+        """
+        answer_cache = get_answer_cache()
+        with span("answer_cache.lookup"):
+            stamp = answer_cache.current_stamp(self.namespace)
+            cached = answer_cache.lookup(
+                self.namespace,
+                query_bundle.embedding,
+                scope=self._answer_scope(filters),
+            )
+        record_cache("answer", "miss" if cached is None else "hit")
+        return cached, stamp
+
+    def _cache_store(self, query_bundle, result, stamp, filters=None):
+        answer_cache = get_answer_cache()
+        if answer_cache is not None and result[1]:
+            answer_cache.store(
+                self.namespace,
+                query_bundle.query_str,
+                query_bundle.embedding,
+                result,
+                stamp=stamp,
+                scope=self._answer_scope(filters),
+            )
+
+    def _get_query_response(self, query_str, filters=None):
+        extra_info = self._classify_query(query_str)
+        query_bundle = QueryBundle(query_str)
+        stamp = None
+        if get_answer_cache() is not None:
+            # Embed once up front; the retriever reuses the embedding.
+            query_bundle.embedding = Settings.embed_model.get_query_embedding(query_str)
+            cached, stamp = self._cache_lookup(query_bundle, filters)
+            if cached is not None:
+                return cached
+        response = self.get_query_engine(filters).query(query_bundle)
+        result = self._format_response(response, extra_info)
+        self._cache_store(query_bundle, result, stamp, filters)
+        return result
+
+    async def _aget_query_response(self, query_str, filters=None):
+        # Query embedding, vector search and synthesis are all awaited, so the
+        # event loop stays free while we wait on OpenAI and Pinecone.
+        extra_info = self._classify_query(query_str)
+        query_bundle = QueryBundle(query_str)
+        stamp = None
+        if get_answer_cache() is not None:
+            query_bundle.embedding = await Settings.embed_model.aget_query_embedding(
+                query_str
+            )
+            cached, stamp = self._cache_lookup(query_bundle, filters)
+            if cached is not None:
+                return cached
+        response = await self.get_query_engine(filters).aquery(query_bundle)
+        result = self._format_response(response, extra_info)
+        self._cache_store(query_bundle, result, stamp, filters)
+        return result
+
+    def _answer_embedded(
+        self, query_bundle, retrieve_slots, synthesis_slots, filters=None
+    ):
+        """
+        `_get_query_response` for a query embedded in advance. Retrieval and
+        synthesis each hold a slot from their semaphore while they run.
+        """
+        extra_info = self._classify_query(query_bundle.query_str)
+        stamp = None
+        if get_answer_cache() is not None:
+            cached, stamp = self._cache_lookup(query_bundle, filters)
+            if cached is not None:
+                return cached
+        query_engine = self.get_query_engine(filters)
+        with retrieve_slots:
+            nodes = query_engine.retrieve(query_bundle)
+        with synthesis_slots:
+            response = query_engine.synthesize(query_bundle, nodes)
+        result = self._format_response(response, extra_info)
+        self._cache_store(query_bundle, result, stamp, filters)
+        return result
+
+    async def _aanswer_embedded(
+        self, query_bundle, retrieve_slots, synthesis_slots, filters=None
+    ):
+        extra_info = self._classify_query(query_bundle.query_str)
+        stamp = None
+        if get_answer_cache() is not None:
+            cached, stamp = self._cache_lookup(query_bundle, filters)
+            if cached is not None:
+                return cached
+        query_engine = self.get_query_engine(filters)
+        async with retrieve_slots:
+            nodes = await query_engine.aretrieve(query_bundle)
+        async with synthesis_slots:
+            response = await query_engine.asynthesize(query_bundle, nodes)
+        result = self._format_response(response, extra_info)
+        self._cache_store(query_bundle, result, stamp, filters)
+        return result
+
+    def get_query_responses(
+        self,
+        queries,
+        retrieval_concurrency=None,
+        synthesis_concurrency=None,
+        filters=None,
+    ):
+        """
+        Answers a batch of queries. All queries are embedded in one batched
+        request, then retrieved and synthesized concurrently, with at most
+        `retrieval_concurrency` vector lookups and `synthesis_concurrency`
+        syntheses in flight.
+
+        Returns one entry per query, in order: the `get_query_response`
+        tuple, or the exception raised while answering that query. `filters`
+        applies to every query.
+        """
+        retrieval_concurrency, synthesis_concurrency = batch_limits(
+            retrieval_concurrency, synthesis_concurrency
+        )
+        filters = build_metadata_filters(filters)
+        try:
+            with span("batch.embed"):
+                embeddings = get_query_embedding_batch(Settings.embed_model, queries)
+        except Exception as e:
+            return [e] * len(queries)
+        retrieve_slots = threading.BoundedSemaphore(retrieval_concurrency)
+        synthesis_slots = threading.BoundedSemaphore(synthesis_concurrency)
+
+        def answer(query_str, embedding):
+            try:
+                return self._answer_embedded(
+                    QueryBundle(query_str, embedding=embedding),
+                    retrieve_slots,
+                    synthesis_slots,
+                    filters,
+                )
+            except Exception as e:
+                return e
+
+        workers = max(retrieval_concurrency, synthesis_concurrency)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # Threads run in copies of this context, so spans reach its trace
+            futures = [
+                pool.submit(
+                    contextvars.copy_context().run, answer, query_str, embedding
+                )
+                for query_str, embedding in zip(queries, embeddings)
+            ]
+            return [future.result() for future in futures]
+
+    async def aget_query_responses(
+        self,
+        queries,
+        retrieval_concurrency=None,
+        synthesis_concurrency=None,
+        filters=None,
+    ):
+        """Async variant of `get_query_responses`."""
+        retrieval_concurrency, synthesis_concurrency = batch_limits(
+            retrieval_concurrency, synthesis_concurrency
+        )
+        filters = build_metadata_filters(filters)
+        try:
+            with span("batch.embed"):
+                embeddings = await aget_query_embedding_batch(
+                    Settings.embed_model, queries
+                )
+        except Exception as e:
+            return [e] * len(queries)
+        retrieve_slots = asyncio.Semaphore(retrieval_concurrency)
+        synthesis_slots = asyncio.Semaphore(synthesis_concurrency)
+        return await asyncio.gather(
+            *(
+                self._aanswer_embedded(
+                    QueryBundle(query_str, embedding=embedding),
+                    retrieve_slots,
+                    synthesis_slots,
+                    filters,
+                )
+                for query_str, embedding in zip(queries, embeddings)
+            ),
+            return_exceptions=True,
+        )
+
+    def stream_query_response(self, query_str, filters=None):
+        """
+        Streaming variant of `get_query_response`.
+
+        Returns a generator of answer tokens and the `extra_info` dict. Sources
+        are filled in before the first token is produced.
+        """
+        start = time.perf_counter()
+        extra_info = self._classify_query(query_str)
+        query_engine = self.get_query_engine(
+            build_metadata_filters(filters), streaming=True
+        )
+        response = query_engine.query(query_str)
+        self._set_sources(response, extra_info)
+        return (
+            self._timed_token_gen(response.response_gen, start, extra_info),
+            extra_info,
+        )
+
+    async def astream_query_response(self, query_str, filters=None):
+        """Async variant of `stream_query_response` yielding an async generator."""
+        start = time.perf_counter()
+        extra_info = self._classify_query(query_str)
+        query_engine = self.get_query_engine(
+            build_metadata_filters(filters), streaming=True
+        )
+        response = await query_engine.aquery(query_str)
+        self._set_sources(response, extra_info)
+        return (
+            self._atimed_token_gen(response.response_gen, start, extra_info),
+            extra_info,
+        )
+
+    def _timed_token_gen(self, response_gen, start, extra_info):
+        first = True
+        for token in response_gen:
+            if first:
+                first = False
+                self._record_first_token(start, extra_info)
+            yield token
+
+    async def _atimed_token_gen(self, response_gen, start, extra_info):
+        first = True
+        async for token in response_gen:
+            if first:
+                first = False
+                self._record_first_token(start, extra_info)
+            yield token
+
+    def _record_first_token(self, start, extra_info):
+        ttft = time.perf_counter() - start
+        extra_info["time_to_first_token"] = ttft
+        TIME_TO_FIRST_TOKEN.observe(ttft)
+
+    def get_retrieve_nodes(self, query_str, filters=None):
+        filters = build_metadata_filters(filters)
+        retriever = (
+            self.retriever
+            if filters is None
+            else self.create_retriever(self.candidate_top_k, filters)
+        )
+        nodes = retriever.retrieve(QueryBundle(query_str))
+        node_store = get_node_store(self.namespace)
+        if node_store is not None:
+            nodes = NodeHydrator(node_store=node_store).postprocess_nodes(nodes)
         return nodes
 
 
 class NcertRetrieverGeneration(SimpleRetrieverGeneration):
     def __init__(self, response_mode="compact_accumulate"):
-        SIMILARITY_TOP_K = service_config.ncert_search["similarity_top_k"]
-        self.post_processors = post_processors
         self.task_type = service_config.ncert_search["task_type"]
-        self.simple_retriever = VectorIndexRetriever(
-            index=service_config.system_indexer, similarity_top_k=SIMILARITY_TOP_K
-        )
-        self.query_classification_model_name = service_config.ncert_search[
-            "query_classification_model_name"
-        ]
-        self.response_mode = response_mode
-        self.query_engine = self.create_query_engine()
+        super().__init__(response_mode=response_mode)
 
-    def get_query_response(self, query_str):
-        response, is_valid, extra_info = self._get_query_response(query_str)
+    def get_query_response(self, query_str, filters=None):
+        response, is_valid, extra_info = super().get_query_response(query_str, filters)
         return response, is_valid, extra_info
 
+    async def aget_query_response(self, query_str, filters=None):
+        response, is_valid, extra_info = await super().aget_query_response(
+            query_str, filters
+        )
+        return response, is_valid, extra_info
+
+
+_retrieval_engines = {}
+_retrieval_engines_lock = threading.Lock()
+
+
+def get_retrieval_engine(
+    index_name=None, namespace=None, response_mode="compact_accumulate", top_k=None
+):
+    """
+    Returns the process-wide SimpleRetrieverGeneration for the given
+    (index, namespace, response_mode, top_k), building it on first use.
+
+    The retriever, response synthesizer and query engine hold no per-query
+    state, so one instance is shared across tool calls and threads.
+    """
+    ncert_search = service_config.ncert_search
+    index_name = index_name or ncert_search["index_name"]
+    namespace = namespace if namespace is not None else ncert_search["namespace"]
+    top_k = top_k or ncert_search["similarity_top_k"]
+    key = (index_name, namespace, response_mode, top_k)
+
+    engine = _retrieval_engines.get(key)
+    if engine is not None:
+        return engine
+    with _retrieval_engines_lock:
+        engine = _retrieval_engines.get(key)
+        if engine is None:
+            if (index_name, namespace) == (
+                ncert_search["index_name"],
+                ncert_search["namespace"],
+            ):
+                index = service_config.system_indexer
+            else:
+                index = load_rag_index(
+                    ncert_search, index_name=index_name, namespace=namespace
+                )
+            engine = SimpleRetrieverGeneration(
+                response_mode=response_mode,
+                index=index,
+                similarity_top_k=top_k,
+                namespace=namespace,
+                index_name=index_name,
+            )
+            _retrieval_engines[key] = engine
+    return engine
+
+
+def warm_up():
+    """
+    Builds the default retrieval engine, which configures the models and
+    connects to the vector index. Servers call this at startup so the first
+    request does not pay for it.
+    """
+    start = time.perf_counter()
+    get_retrieval_engine()
+    print(f"Retrieval warm-up took {time.perf_counter() - start:.2f}s")
+
+
+@lru_cache
+def get_ncert_retriever_generation():
+    return NcertRetrieverGeneration()
+
 
-ncert_retriever_generation = NcertRetrieverGeneration()
+def __getattr__(name):
+    # Built on first use so that importing this module stays cheap
+    if name == "ncert_retriever_generation":
+        return get_ncert_retriever_generation()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 if __name__ == "__main__":
     # Test query
     query_str = "What is sound propagation?"
-    response = ncert_retriever_generation.get_query_response(query_str)
+    response = get_ncert_retriever_generation().get_query_response(query_str)
     print(f"Query: {query_str}")
     print(f"Response: {response}")
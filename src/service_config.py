@@ -1,11 +1,15 @@
 import json
+import threading
+from llama_index.core.callbacks import CallbackManager
 from llama_index.core.settings import Settings
-from llama_index.embeddings.openai import OpenAIEmbedding
 
 # Local Imports
 import prompts
 from llms import get_openai_model
-from indexer import load_pinecone_index, get_rag_index
+from indexer import load_rag_index
+from embedding_cache import get_embed_model
+from http_clients import openai_client_kwargs
+from tracing import LlamaIndexTraceHandler
 
 
 def get_model_by_name(name, system_prompt):
@@ -16,23 +20,65 @@ def get_model_by_name(name, system_prompt):
 
 
 class ServiceConfig:
+    """
+    Service-wide configuration. The config file is read on import, but the
+    LLMs, the embed model and the vector index are only built on first
+    access. Importing this module therefore needs no network. State is kept
+    on the class, so every instance shares the same objects.
+    """
 
     ncert_search = json.load(open("./config/ncert_search.json"))
-    Settings.llm = get_openai_model(ncert_search["llm"])
-    Settings.embed_model = OpenAIEmbedding(
-        model=ncert_search["embedding_model_name"],
-        dimensions=ncert_search["embedding_dim"],
-    )
-    system_indexer = get_rag_index(
-        load_pinecone_index(
-            ncert_search["index_name"], host=ncert_search["pinecone_host"]
-        ),
-        namespace=ncert_search["namespace"],
-    )
-
-    MODEL = get_model_by_name(
-        ncert_search["llm"], system_prompt=prompts.qa_system_prompt
-    )
+
+    _lock = threading.RLock()
+    _settings_configured = False
+    _system_indexer = None
+    _model = None
+
+    @classmethod
+    def configure_settings(cls):
+        """
+        Sets the global llama-index LLM, embed model and tracing callbacks,
+        once.
+        """
+        with cls._lock:
+            if cls._settings_configured:
+                return
+            from llama_index.embeddings.openai import OpenAIEmbedding
+
+            Settings.callback_manager = CallbackManager([LlamaIndexTraceHandler()])
+            Settings.llm = get_openai_model(cls.ncert_search["llm"])
+            Settings.llm.callback_manager = Settings.callback_manager
+            Settings.embed_model = get_embed_model(
+                OpenAIEmbedding(
+                    model=cls.ncert_search["embedding_model_name"],
+                    dimensions=cls.ncert_search["embedding_dim"],
+                    **openai_client_kwargs(),
+                ),
+                cls.ncert_search,
+            )
+            Settings.embed_model.callback_manager = Settings.callback_manager
+            cls._settings_configured = True
+
+    @property
+    def system_indexer(self):
+        cls = type(self)
+        with cls._lock:
+            if cls._system_indexer is None:
+                cls.configure_settings()
+                cls._system_indexer = load_rag_index(cls.ncert_search)
+            return cls._system_indexer
+
+    @property
+    def MODEL(self):
+        cls = type(self)
+        with cls._lock:
+            if cls._model is None:
+                cls.configure_settings()
+                cls._model = get_model_by_name(
+                    cls.ncert_search["llm"], system_prompt=prompts.qa_system_prompt
+                )
+                cls._model.callback_manager = Settings.callback_manager
+            return cls._model
 
 
 service_config = ServiceConfig()
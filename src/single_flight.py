@@ -0,0 +1,123 @@
+import json
+import asyncio
+import threading
+from functools import lru_cache
+
+from metrics import counter
+from tracing import current_trace
+
+ROLE_LEADER = "leader"
+ROLE_FOLLOWER = "follower"
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Flight:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one computation.
+
+    The first caller for a key (the leader) runs it. Callers arriving with
+    the same key while it runs (followers) wait for it and get the same
+    result, or the same exception, back. Once it finishes, the key is
+    forgotten, so the next call computes afresh; caching results is left to
+    the caches.
+
+    `ado` runs the computation as a task of its own, on the caller's loop.
+    A caller that is cancelled stops waiting without cancelling it for the
+    others, and the task is only cancelled once every caller has gone.
+    """
+
+    def __init__(self, scope):
+        self.scope = scope
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._flights = {}
+
+    def _record(self, role):
+        counter(
+            "rag_coalesced_requests_total",
+            "Requests by whether they led a computation or joined one in flight.",
+            labels={"scope": self.scope, "role": role},
+        ).inc()
+        request_trace = current_trace()
+        if request_trace is not None and role == ROLE_FOLLOWER:
+            request_trace.count(f"coalesced_{self.scope}")
+
+    def do(self, key, fn, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        self._record(ROLE_LEADER if leader else ROLE_FOLLOWER)
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key, fn, *args):
+        loop = asyncio.get_running_loop()
+        # Tasks belong to one event loop, so keys are per loop
+        flight_key = (loop, key)
+        # Loops on other threads (e.g. llama-index's use_async synthesis) share
+        # `_flights`, so the lookup and insert happen under the lock
+        with self._lock:
+            flight = self._flights.get(flight_key)
+            leader = flight is None
+            if leader:
+                flight = _Flight(loop.create_task(fn(*args)))
+                self._flights[flight_key] = flight
+        if leader:
+            flight.task.add_done_callback(lambda _: self._forget(flight_key, flight))
+        self._record(ROLE_LEADER if leader else ROLE_FOLLOWER)
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Everyone waiting was cancelled. Later callers start over
+                # instead of joining a cancelled task.
+                self._forget(flight_key, flight)
+                flight.task.cancel()
+
+    def _forget(self, flight_key, flight):
+        with self._lock:
+            if self._flights.get(flight_key) is flight:
+                del self._flights[flight_key]
+
+
+@lru_cache
+def get_single_flight(scope):
+    """
+    The process-wide SingleFlight for `scope`, or None if `coalescing` is
+    disabled in the config.
+    """
+    ncert_search = json.load(open("./config/ncert_search.json"))
+    if not ncert_search.get("coalescing", {}).get("enabled", False):
+        return None
+    return SingleFlight(scope)
@@ -1,10 +1,9 @@
 import os
 import json
-import shutil
 import streamlit as st
-from langchain.agents import Tool
-from document_manager import document_manager
-from agent import VectorDBTool, InappropriateContentDetector, get_agent
+from agent import get_agent, get_agent_tools, get_retrieval, use_retrieval_filters
+from moderation import BLOCKED_QUERY_REPLY, VERDICT_ALLOW, VERDICT_BLOCK, get_moderator
+from query_router import ROUTE_RETRIEVAL, ROUTE_TEMPLATE, get_query_router
 import warnings
 
 warnings.filterwarnings("ignore")
@@ -21,8 +20,22 @@ os.environ["COHERE_API_KEY"] = cohere_api_key
 
 
 @st.cache_resource
-def get_document_manager():
-    return document_manager
+def get_ingestion_queue():
+    """Start the background ingestion workers once per process"""
+    from ingestion_jobs import get_ingestion_queue
+
+    ingestion_queue = get_ingestion_queue()
+    ingestion_queue.start()
+    return ingestion_queue
+
+
+@st.cache_resource
+def warm_up_services():
+    """Connect to the index once, before the first question is asked"""
+    from retrieval import warm_up
+
+    warm_up()
+    return True
 
 
 @st.cache_resource
@@ -32,34 +45,74 @@ def get_agent_instance():
         with open("./config/ncert_search.json") as f:
             config = json.load(f)
 
-        tools = [
-            Tool(
-                name="VectorDBTool",
-                func=VectorDBTool().run,
-                description="Use this tool to query the VectorDB for complex information.",
-            ),
-            Tool(
-                name="InappropriateContentDetector",
-                func=InappropriateContentDetector().run,
-                description="Detects inappropriate language in user queries and warns the user.",
-            ),
-        ]
-
-        return get_agent(tools, config["agent_llm"])
+        return get_agent(get_agent_tools(), config["agent_llm"])
     except Exception as e:
         st.error(f"Failed to initialize agent: {e}")
         return None
 
 
-@st.cache_data
-def process_uploaded_file(file_path):
-    """Process and index uploaded file with caching"""
-    doc_manager = get_document_manager()
+def answer_query(prompt, filters=None):
+    """Route the prompt; only queries the router cannot answer reach the agent"""
+    moderator = get_moderator()
+    verdict = moderator.moderate(prompt).verdict if moderator else VERDICT_ALLOW
+    if verdict == VERDICT_BLOCK:
+        return {"output": BLOCKED_QUERY_REPLY}
+    router = get_query_router()
+    # Borderline prompts go to the agent, whose moderation tool asks the LLM
+    if router is not None and verdict == VERDICT_ALLOW:
+        decision = router.route(prompt)
+        if decision.route == ROUTE_TEMPLATE:
+            return {"output": decision.reply}
+        if decision.route == ROUTE_RETRIEVAL:
+            answer, is_valid, _ = get_retrieval().get_query_response(prompt, filters)
+            if is_valid:
+                return {"output": answer}
+    with use_retrieval_filters(filters):
+        return agent.invoke(prompt)
+
+
+def submit_uploaded_file(uploaded_file):
+    """Queue an upload for background indexing; unchanged files are skipped"""
     try:
-        n_indexed = doc_manager.index_doc_from_files([file_path])
-        return n_indexed, None
-    except Exception as e:
-        return 0, str(e)
+        job = get_ingestion_queue().submit(uploaded_file, uploaded_file.name)
+        return job["id"], None
+    except ValueError as e:
+        return None, str(e)
+
+
+@st.fragment(run_every=1)
+def show_ingestion_status():
+    """Poll the upload's indexing job without blocking the rest of the page"""
+    from ingestion_jobs import JOB_FAILED, JOB_SUCCEEDED, JOB_SUPERSEDED
+
+    job_id = st.session_state.get("ingestion_job_id")
+    job = get_ingestion_queue().store.get(job_id) if job_id else None
+    if job is None:
+        return
+    if job["status"] == JOB_FAILED:
+        st.error(f"An error occurred while indexing the documents: {job['error']}")
+    elif job["status"] == JOB_SUPERSEDED:
+        st.info(
+            f"{job['file_name']} was uploaded again, the newer upload is indexed instead."
+        )
+    elif job["status"] == JOB_SUCCEEDED:
+        if job["n_indexed"]:
+            st.success(
+                f"File uploaded and indexed successfully! {job['n_indexed']} new or changed chunks indexed."
+            )
+        else:
+            st.info("File is already indexed, no new or changed chunks.")
+        if not st.session_state["file_processed"]:
+            st.session_state["file_processed"] = True
+            # Show the chat, which is only drawn once a file is indexed
+            st.rerun(scope="app")
+    else:
+        progress = job["progress"]
+        st.info(
+            f"Indexing {job['file_name']} in the background "
+            f"({job['status']}): {progress.get('nodes_upserted', 0)} of "
+            f"{progress.get('nodes_parsed', 0)} chunks indexed so far."
+        )
 
 
 # Add project information in sidebar
@@ -128,6 +181,17 @@ with st.sidebar:
         """
         )
 
+    stream_answers = st.toggle(
+        "⚡ Stream answers",
+        value=True,
+        help="Show the answer from the knowledge base as it is generated instead of waiting for the agent.",
+    )
+    only_uploaded_file = st.toggle(
+        "📄 Only search the uploaded file",
+        value=True,
+        help="Answer from the document you uploaded instead of the whole knowledge base.",
+    )
+
     st.divider()
     st.caption(" 2024 RAG Assistant")
     st.divider()
@@ -139,6 +203,9 @@ st.markdown(
 
 # Initialize the agent
 agent = get_agent_instance()
+with open("./config/ncert_search.json") as f:
+    if json.load(f).get("warm_up_on_startup", True):
+        warm_up_services()
 
 # File uploader
 uploaded_file = st.file_uploader("Choose a file to upload", type=["txt", "pdf"])
@@ -148,29 +215,19 @@ if "file_processed" not in st.session_state:
     st.session_state["file_processed"] = False
 
 if uploaded_file is not None:
-    folder_path = "./uploaded_files"
-    if not os.path.exists(folder_path):
-        os.makedirs(folder_path)
-
-    file_path = os.path.join(folder_path, uploaded_file.name)
-
-    # Only write file if it doesn't exist
-    if not os.path.exists(file_path):
-        with open(file_path, "wb") as output:
-            shutil.copyfileobj(uploaded_file, output)
-
-        # Process file only if newly uploaded
-        n_indexed, error = process_uploaded_file(file_path)
+    # Streamlit reruns the script on every interaction, so only index each
+    # upload once. A re-upload under the same name is re-indexed, and the
+    # manifest limits the work to the chunks that changed. Indexing runs on
+    # the ingestion queue, so the page stays responsive meanwhile.
+    if st.session_state.get("indexed_upload_id") != uploaded_file.file_id:
+        job_id, error = submit_uploaded_file(uploaded_file)
         if error:
             st.error(f"An error occurred while indexing the documents: {error}")
         else:
-            st.success(
-                f"File uploaded and indexed successfully! {n_indexed} chunks created."
-            )
-            st.session_state["file_processed"] = True
-    else:
-        st.info("File already exists and has been processed.")
-        st.session_state["file_processed"] = True
+            st.session_state["indexed_upload_id"] = uploaded_file.file_id
+            st.session_state["ingestion_job_id"] = job_id
+
+show_ingestion_status()
 
 # Chat interface
 if st.session_state["file_processed"] and agent:
@@ -185,20 +242,42 @@ if st.session_state["file_processed"] and agent:
     if prompt := st.chat_input("Ask something about your document..."):
         st.session_state["agent_messages"].append({"role": "user", "content": prompt})
         st.chat_message("user").write(prompt)
+        # The vector store searches only the uploaded file's chunks
+        filters = (
+            {"file_name": uploaded_file.name}
+            if only_uploaded_file and uploaded_file is not None
+            else None
+        )
 
-        with st.spinner("Thinking..."):
+        if stream_answers:
             try:
-                response = agent.invoke(prompt)
-                if response and "output" in response:
-                    response_text = response["output"]
-                    st.session_state["agent_messages"].append(
-                        {"role": "assistant", "content": response_text}
+                with st.chat_message("assistant"):
+                    token_gen, extra_info = get_retrieval().stream_query_response(
+                        prompt, filters
                     )
-                    st.chat_message("assistant").write(response_text)
-                else:
-                    st.warning("No response available from the system.")
+                    response_text = st.write_stream(token_gen)
+                    ttft = extra_info.get("time_to_first_token")
+                    if ttft is not None:
+                        st.caption(f"First token after {ttft:.2f}s")
+                st.session_state["agent_messages"].append(
+                    {"role": "assistant", "content": response_text}
+                )
             except Exception as e:
-                st.error(f"Failed to connect to agent: {str(e)}")
+                st.error(f"Failed to stream a response: {str(e)}")
+        else:
+            with st.spinner("Thinking..."):
+                try:
+                    response = answer_query(prompt, filters)
+                    if response and "output" in response:
+                        response_text = response["output"]
+                        st.session_state["agent_messages"].append(
+                            {"role": "assistant", "content": response_text}
+                        )
+                        st.chat_message("assistant").write(response_text)
+                    else:
+                        st.warning("No response available from the system.")
+                except Exception as e:
+                    st.error(f"Failed to connect to agent: {str(e)}")
 else:
     if not agent:
         st.error(
@@ -0,0 +1,250 @@
+import math
+import time
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from llama_index.core.callbacks import CBEventType
+from llama_index.core.callbacks.base_handler import BaseCallbackHandler
+from llama_index.core.callbacks.token_counting import get_llm_token_counts
+from llama_index.core.utilities.token_counting import TokenCounter
+
+from metrics import counter, histogram
+
+STAGE_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    math.inf,
+)
+CALL_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, math.inf)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, math.inf)
+
+_current_trace = contextvars.ContextVar("rag_trace", default=None)
+
+
+class Trace:
+    """
+    Spans and counters collected while serving one request.
+
+    The trace lives in a context variable, so code running in the same task,
+    in tasks it spawns and in `asyncio.to_thread` calls records into it
+    without passing it around.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.duration = None
+        self.spans = []
+        self.counters = Counter()
+        self._lock = threading.Lock()
+
+    def add_span(self, stage, start, duration):
+        with self._lock:
+            self.spans.append((stage, start - self.started, duration))
+
+    def count(self, key, amount=1):
+        with self._lock:
+            self.counters[key] += amount
+
+    def summary(self):
+        """Per-stage call counts and total milliseconds, plus the counters."""
+        stages = {}
+        with self._lock:
+            for stage, _, duration in self.spans:
+                totals = stages.setdefault(stage, {"count": 0, "ms": 0.0})
+                totals["count"] += 1
+                totals["ms"] += 1000 * duration
+            counters = dict(self.counters)
+        for totals in stages.values():
+            totals["ms"] = round(totals["ms"], 2)
+        duration = self.duration
+        if duration is None:
+            duration = time.perf_counter() - self.started
+        return {
+            "name": self.name,
+            "ms": round(1000 * duration, 2),
+            "stages": stages,
+            "counters": counters,
+        }
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def trace(name):
+    """Collects a Trace for the enclosed request and records its totals."""
+    request_trace = Trace(name)
+    token = _current_trace.set(request_trace)
+    try:
+        yield request_trace
+    finally:
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # A streaming generator closed from another context
+            _current_trace.set(None)
+        request_trace.duration = time.perf_counter() - request_trace.started
+        labels = {"route": name}
+        histogram(
+            "rag_request_seconds", "Seconds spent serving a request.", labels=labels
+        ).observe(request_trace.duration)
+        histogram(
+            "rag_request_llm_calls",
+            "LLM calls made while serving a request.",
+            CALL_BUCKETS,
+            labels=labels,
+        ).observe(request_trace.counters["llm_calls"])
+        histogram(
+            "rag_request_llm_tokens",
+            "LLM prompt and completion tokens used while serving a request.",
+            TOKEN_BUCKETS,
+            labels=labels,
+        ).observe(
+            request_trace.counters["prompt_tokens"]
+            + request_trace.counters["completion_tokens"]
+        )
+
+
+def record_span(stage, start, duration):
+    histogram(
+        "rag_stage_seconds",
+        "Seconds spent in each stage of retrieval, generation and ingestion.",
+        STAGE_BUCKETS,
+        labels={"stage": stage},
+    ).observe(duration)
+    request_trace = current_trace()
+    if request_trace is not None:
+        request_trace.add_span(stage, start, duration)
+
+
+@contextmanager
+def span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(stage, start, time.perf_counter() - start)
+
+
+def record_llm_call(source, prompt_tokens=0, completion_tokens=0):
+    labels = {"source": source}
+    counter("rag_llm_calls_total", "LLM calls.", labels=labels).inc()
+    counter(
+        "rag_llm_tokens_total",
+        "LLM tokens used.",
+        labels={**labels, "kind": "prompt"},
+    ).inc(prompt_tokens)
+    counter(
+        "rag_llm_tokens_total",
+        "LLM tokens used.",
+        labels={**labels, "kind": "completion"},
+    ).inc(completion_tokens)
+    request_trace = current_trace()
+    if request_trace is not None:
+        request_trace.count("llm_calls")
+        request_trace.count("prompt_tokens", prompt_tokens)
+        request_trace.count("completion_tokens", completion_tokens)
+
+
+def record_cache(cache, result, amount=1):
+    """Counts `amount` lookups in `cache` with `result` (hit, miss, ...)."""
+    if not amount:
+        return
+    counter(
+        "rag_cache_requests_total",
+        "Cache lookups by cache and result.",
+        labels={"cache": cache, "result": result},
+    ).inc(amount)
+    request_trace = current_trace()
+    if request_trace is not None:
+        request_trace.count(f"{cache}_cache_{result}", amount)
+
+
+def record_context_tokens(retrieved, packed):
+    """Counts context tokens retrieved, and those left after packing."""
+    for kind, amount in (("retrieved", retrieved), ("packed", packed)):
+        counter(
+            "rag_context_tokens_total",
+            "Context tokens retrieved, and sent to the synthesizer after packing.",
+            labels={"kind": kind},
+        ).inc(amount)
+    request_trace = current_trace()
+    if request_trace is not None:
+        request_trace.count("context_tokens_retrieved", retrieved)
+        request_trace.count("context_tokens_packed", packed)
+
+
+class LlamaIndexTraceHandler(BaseCallbackHandler):
+    """
+    Records llama-index callback events (embedding, retrieve, synthesize, LLM
+    calls, ...) as stages, and counts LLM calls and tokens.
+    """
+
+    def __init__(self):
+        super().__init__(
+            event_starts_to_ignore=[CBEventType.TEMPLATING],
+            event_ends_to_ignore=[CBEventType.TEMPLATING],
+        )
+        self._starts = {}
+        self._lock = threading.Lock()
+        self._token_counter = TokenCounter()
+
+    def on_event_start(
+        self,
+        event_type: CBEventType,
+        payload: Optional[Dict[str, Any]] = None,
+        event_id: str = "",
+        parent_id: str = "",
+        **kwargs: Any,
+    ) -> str:
+        with self._lock:
+            self._starts[event_id] = time.perf_counter()
+        return event_id
+
+    def on_event_end(
+        self,
+        event_type: CBEventType,
+        payload: Optional[Dict[str, Any]] = None,
+        event_id: str = "",
+        **kwargs: Any,
+    ) -> None:
+        with self._lock:
+            start = self._starts.pop(event_id, None)
+        if start is None:
+            return
+        record_span(
+            f"llama_index.{event_type.value}", start, time.perf_counter() - start
+        )
+        if event_type == CBEventType.LLM and payload:
+            token_counts = get_llm_token_counts(self._token_counter, payload)
+            record_llm_call(
+                "llama_index",
+                token_counts.prompt_token_count,
+                token_counts.completion_token_count,
+            )
+
+    def start_trace(self, trace_id: Optional[str] = None) -> None:
+        pass
+
+    def end_trace(
+        self,
+        trace_id: Optional[str] = None,
+        trace_map: Optional[Dict[str, List[str]]] = None,
+    ) -> None:
+        pass